@@ -1,14 +1,38 @@
-from flask import Flask, jsonify, render_template, request, session, redirect
+from flask import Flask, g, jsonify, render_template, request, send_from_directory, session, redirect, url_for
 #from flask_pymongo import PyMongo
 import mongomock
 from flask_cors import CORS
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
-import bcrypt
 from datetime import datetime, timedelta, timezone 
 from dotenv import load_dotenv
+import hashlib
+import hmac
 import os
 import re
+import time
+
+from assets import AssetManifest, buildAssets, isFingerprinted
+from cache import LRUCache, QuoteListCache, UserProfileCache
+from columnar import columnarMimetype, encodeColumnar, wantsColumnar
+from compression import compressResponse
+from database import MongoConnection, clientOptions
+from indexes import ensureIndexes
+from metrics import MultiprocessMetrics, renderMetrics, requestDuration, requestErrorsTotal, requestsTotal
+from passwords import HasherBusy, PasswordHasher
+from quoteBatch import BatchError, parseOperations, runBatch
+from quoteExport import exportCursor, exportMimetypes, generateExport, gzipChunks
+from quoteImport import ImportFormatError, detectFormat, importQuoteRecords, iterRecords
+from quota import bumpLibraryVersion, releaseQuota, reserveQuota
+from quoteUtils import (
+    QueryError, QuoteValidationError, backfillDerivedFields, buildListQuery, characterSpamLimit, cleanQuoteFields,
+    derivedFields, encodeCursor, parseListArgs, quoteProjection, serializeQuote, sortCollation
+)
+from search import parseSearchArgs, searchPage
+from suggestions import applySuggestionChanges, findSuggestions, parseSuggestArgs, rebuildSuggestions, suggestionFields
+from sync import collectChanges, parseChangesArgs, recordDeletion, requireFullSync, stampQuotes, tombstoneRetention
 
 load_dotenv()
 
@@ -18,45 +42,394 @@ app.config["SECRET_KEY"] = os.getenv("SECRET_KEY") # Used for session management
 app.config["SESSION_COOKIE_SECURE"] = True  # Send cookies only over HTTPS
 app.config["SESSION_COOKIE_HTTPONLY"] = True  # Prevent client-side JavaScript access
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(minutes= 30)  # Set session lifetime
+app.config["BCRYPT_ROUNDS"] = int(os.getenv("BCRYPT_ROUNDS", 12)) # Work factor of new password hashes
+app.config["BCRYPT_WORKERS"] = int(os.getenv("BCRYPT_WORKERS", 0)) or None # Parallel hashes, defaults to the CPU count
+app.config["BCRYPT_QUEUE_LIMIT"] = int(os.getenv("BCRYPT_QUEUE_LIMIT", 32)) # Hashes allowed to wait for a worker
+app.config["QUOTE_CACHE_SIZE"] = int(os.getenv("QUOTE_CACHE_SIZE", 256)) # Users whose quote list is kept in memory
+app.config["QUOTE_CACHE_TTL"] = int(os.getenv("QUOTE_CACHE_TTL", 300)) # Seconds a cached quote list is kept
+app.config["USER_CACHE_SIZE"] = int(os.getenv("USER_CACHE_SIZE", 1024)) # Users whose quota is kept in memory
+app.config["USER_CACHE_TTL"] = int(os.getenv("USER_CACHE_TTL", 5)) # Seconds a cached quota may lag behind other processes
+app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN") # Bearer token of the /metrics scraper, loopback only if unset
+app.config["METRICS_DIR"] = os.getenv("METRICS_DIR") # Directory where workers share their metrics (set by gunicorn.conf.py)
+app.config["COMPRESSION_MIN_SIZE"] = int(os.getenv("COMPRESSION_MIN_SIZE", 500)) # Smaller bodies are sent uncompressed
+app.config["COMPRESSION_LEVEL"] = int(os.getenv("COMPRESSION_LEVEL", 6)) # gzip level, 1 (fast) to 9 (small)
+app.config["BROTLI_QUALITY"] = int(os.getenv("BROTLI_QUALITY", 5)) # brotli quality, 0 to 11 (if brotli is installed)
+app.config["COMPRESSION_EXEMPT_PATHS"] = ("/get-quote-limit", "/metrics") # A few bytes, not worth the CPU
+app.config["ASSET_MAX_AGE"] = int(os.getenv("ASSET_MAX_AGE", 31536000)) # Seconds browsers keep fingerprinted assets (a year)
 
+# One MongoClient per process, created after gunicorn forks its workers (see database.py)
 # Use real MongoDB if not testing
-if app.config.get("TESTING"):
-    mongoClient = mongomock.MongoClient()
-else:
-    from pymongo import MongoClient
-    mongoClient = MongoClient(app.config["MONGO_URI"])
-db = mongoClient["quote-base"]
+mongoConnection = MongoConnection(
+    app.config["MONGO_URI"],
+    options= clientOptions(),
+    clientFactory= mongomock.MongoClient if app.config.get("TESTING") else None
+)
+db = mongoConnection.database("quote-base")
 app.db = db # This allows app.db to be dynamically set during testing
-characterSpamLimit = 2000
+
+# Password hashing and verification run on their own bounded pool (see passwords.py)
+passwordHasher = PasswordHasher(
+    rounds= app.config["BCRYPT_ROUNDS"],
+    maxWorkers= app.config["BCRYPT_WORKERS"],
+    queueLimit= app.config["BCRYPT_QUEUE_LIMIT"]
+)
+
+# Per-user quote lists, tagged with the library version they were read at (see cache.py)
+quoteListCache = QuoteListCache(LRUCache(maxEntries= app.config["QUOTE_CACHE_SIZE"], ttl= app.config["QUOTE_CACHE_TTL"]))
+
+# Quota and existence of recently active users, for reads that do not enforce anything (see cache.py)
+userProfileCache = UserProfileCache(LRUCache(maxEntries= app.config["USER_CACHE_SIZE"], ttl= app.config["USER_CACHE_TTL"]))
+
+# Metrics exposed by /metrics; with several workers, each shares its numbers through METRICS_DIR (see metrics.py)
+def metricFamilies():
+    # Looked up on every use: the MongoDB counters are replaced when the process creates its client (see database.py)
+    return [
+        requestDuration, requestsTotal, requestErrorsTotal,
+        mongoConnection.commandStats.durations, mongoConnection.commandStats.failures,
+        passwordHasher.durations, passwordHasher.rejections,
+    ]
+
+multiprocessMetrics = MultiprocessMetrics(app.config["METRICS_DIR"], metricFamilies) if app.config["METRICS_DIR"] else None
+if multiprocessMetrics:
+    multiprocessMetrics.start() # The app is imported after the fork (preload_app = False)
+
+# Fingerprinted static files written by the build-assets command (see assets.py)
+assetManifest = AssetManifest(app.static_folder)
+
+@app.template_global()
+def assetUrl(path):
+    # {{ assetUrl('css/styles.css') }}: the built copy if there is one, the source file otherwise
+    return url_for("static", filename= assetManifest.resolve(path))
 
 #mongo = PyMongo(app)
 CORS(app)
 
+# Database the indexes were last checked on (app.db can be swapped during testing)
+indexedDb = None
+
+@app.before_request
+def startRequestTimer():
+    # Registered first, so the other before_request hooks are part of the measured time
+    g.requestStartedAt = time.perf_counter()
+
+@app.after_request
+def recordRequestMetrics(response):
+    recordRequest(response.status_code)
+    return response
+
+@app.after_request
+def compress(response):
+    # gzip/brotli depending on Accept-Encoding (see compression.py)
+    return compressResponse(
+        response,
+        request,
+        minSize= app.config["COMPRESSION_MIN_SIZE"],
+        level= app.config["COMPRESSION_LEVEL"],
+        brotliQuality= app.config["BROTLI_QUALITY"],
+        exemptPaths= app.config["COMPRESSION_EXEMPT_PATHS"]
+    )
+
+@app.after_request
+def cacheFingerprintedAssets(response):
+    # A fingerprinted file never changes (a new build gets a new name), browsers need not revalidate it
+    if request.endpoint == "static" and response.status_code == 200 and isFingerprinted(request.view_args.get("filename", "")):
+        response.headers["Cache-Control"] = f"public, max-age={app.config['ASSET_MAX_AGE']}, immutable"
+    return response
+
+@app.teardown_request
+def recordFailedRequest(error):
+    # Exceptions no route caught never reach after_request
+    if error is not None:
+        recordRequest(500)
+
+def recordRequest(status):
+    startedAt = g.pop("requestStartedAt", None)
+    if startedAt is None: # Already recorded
+        return
+    route = request.url_rule.rule if request.url_rule else "<unmatched>" # Route pattern, not the path with its ids
+    requestDuration.observe(time.perf_counter() - startedAt, request.method, route)
+    requestsTotal.inc(request.method, route, str(status))
+    if status >= 500:
+        requestErrorsTotal.inc(request.method, route)
+
 @app.before_request
 def makeSessionPermanent():
     session.permanent = True
 
+@app.before_request
+def bootstrapIndexes():
+    # Create missing indexes once per process (and per database), before the first request is served
+    global indexedDb
+    if indexedDb is app.db:
+        return
+    try:
+        ensureIndexes(app.db)
+        indexedDb = app.db
+    except Exception as e:
+        print(f"Error ensuring indexes: {str(e)}") # Retried on the next request
+
+@app.cli.command("ensure-indexes")
+def ensureIndexesCommand():
+    # flask --app app ensure-indexes: create missing indexes and report drift without serving requests
+    report = ensureIndexes(app.db)
+    print(f"Created: {len(report['created'])}, drifted: {len(report['drifted'])}, unmanaged: {len(report['unmanaged'])}")
+
+@app.cli.command("backfill")
+def backfillCommand():
+    # flask --app app backfill: add the fields newer versions derive to quotes stored before them; run once after
+    # upgrading, never from a request (it scans the quotes collection)
+    report = backfillDerivedFields(app.db["quotes"])
+    print(f"Updated: {report['updated']}, duplicates left without a fingerprint: {len(report['duplicates'])}")
+    for quoteId in report["duplicates"]:
+        print(f"  duplicate quote {quoteId}")
+    # Autocomplete counts of every user, for quotes stored before suggestions existed (absolute counts, safe to rerun)
+    print(f"Suggestions: {rebuildSuggestions(app.db['quotes'], app.db['suggestions'])}")
+
+@app.cli.command("build-assets")
+def buildAssetsCommand():
+    # flask --app app build-assets: fingerprint and minify static/ into static/dist (see assets.py)
+    manifest = buildAssets(app.static_folder)
+    assetManifest.load()
+    print(f"Built {len(manifest['assets'])} assets and {sum(len(v) for v in manifest['variants'].values())} image variants")
+
+def updateSuggestions(userEmail, removed=(), added=(), rebuild=False):
+    # Autocomplete counts follow every quote change (see suggestions.py). They are derived data:
+    # a failure is logged, not turned into an error for a change that already went through.
+    try:
+        if rebuild:
+            rebuildSuggestions(app.db["quotes"], app.db["suggestions"], userEmail)
+        else:
+            applySuggestionChanges(app.db["suggestions"], userEmail, removed= removed, added= added)
+    except Exception as e:
+        print(f"Error updating suggestions: {str(e)}")
+
+def getUserQuotes(userEmail, version):
+    # Quote list of a user, from the cache if it holds this library version
+    if version is not None:
+        userQuotes = quoteListCache.get(userEmail, version)
+        if userQuotes is not None:
+            return userQuotes
+    
+    # Fetch all quotes for the user
+    userQuotes = list(
+        app.db["quotes"].find(
+            {"userEmail": userEmail}, 
+            quoteProjection # Do not include user email in the returned data (security)
+        )
+    )
+    userQuotes = [serializeQuote(quote) for quote in userQuotes] # Convert ObjectId to string for JSON serialization
+    if version is not None:
+        quoteListCache.set(userEmail, version, userQuotes)
+    return userQuotes
+
+# Part of the /home ETag, so a deployed template change is not answered with 304
+with open(os.path.join(app.root_path, "templates", "index.html"), "rb") as templateFile:
+    homeTemplateHash = hashlib.sha256(templateFile.read()).hexdigest()[:16]
+
+def makeETag(*parts):
+    # Strong ETag from the values a response depends on; always includes the user so browsers shared
+    # by several accounts never get another user's page confirmed as fresh
+    return hashlib.sha256(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+
+def notModified(etag):
+    # 304 response if the client already has this version, None otherwise.
+    # Weak comparison, as compressed responses carry the weak form of the ETag (see compression.py)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        return withETag(response, etag)
+    return None
+
+def withETag(response, etag):
+    # Private (per user) and revalidated on every use
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+def wantsDelta():
+    # Mutation routes answer with the changed quote only when the client asks for it (?delta=1)
+    return request.args.get("delta", "").lower() in ("1", "true")
+
+def quoteListResponse(payload, status=200):
+    # JSON response holding a quote list under "quotes", columnar when the client asks for it (see columnar.py)
+    if wantsColumnar(request):
+        payload["quotes"] = encodeColumnar(payload["quotes"])
+        response = jsonify(payload)
+        response.mimetype = columnarMimetype
+    else:
+        response = jsonify(payload)
+    response.vary.add("Accept")
+    response.status_code = status
+    return response
+
 @app.route("/home")
 def home():
     if "user" in session: # Check if the user is logged in
         userEmail = session["user"]
         
+        # Library version lets the client notice changes it has not seen (e.g. from another tab),
+        # and tells whether the cached quote list is still current
+        user = app.db["users"].find_one({"email": userEmail}, {"_id": 0, "libraryVersion": 1}) or {}
+        version = user.get("libraryVersion", 0)
+        
+        # Nothing changed since the browser's copy: do not fetch or render the quotes
+        etag = makeETag(userEmail, version, homeTemplateHash, assetManifest.version) # A new build links new asset URLs
+        cached = notModified(etag)
+        if cached:
+            return cached
+        
+        # Only the page shell: script.js loads the quotes from /quotes, so the response does not grow with the library
+        # Owner tag of the offline copy of the library, so the service worker never shows it to another account
+        owner = makeETag("owner", userEmail, app.config["SECRET_KEY"])[:16]
+        response = app.make_response(render_template("index.html", version= version, owner= owner))
+        return withETag(response, etag)
+    
+    return redirect("/") # Redirect to register page if not logged in
+
+@app.route("/quotes", methods=["GET"])
+def listQuotes():
+    try:
+        # Ensure the user is logged in
+        if "user" not in session:
+            return jsonify({"error": "Unauthorized access. Please log in."}), 401
+        
+        # Validate paging, sorting and search parameters
+        try:
+            options = parseListArgs(request.args)
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
+        
         # Connect to MongoDB
         quotesCollection = app.db["quotes"]
+        userEmail = session["user"]
         
-        # Fetch all quotes for the logged-in user
+        # Library version, read before the quotes: a client loading page after page compares it to notice
+        # changes made in between (a change landing between the two reads only makes it reload too often)
+        user = app.db["users"].find_one({"email": userEmail}, {"_id": 0, "libraryVersion": 1}) or {}
+        
+        # Fetch one quote more than requested to know whether there is a next page
+        query, sort = buildListQuery(userEmail, options)
         userQuotes = list(
             quotesCollection.find(
-                {"userEmail": userEmail}, 
-                {"userEmail": 0} # Do not include user email in the returned data (security)
-            )
+                query,
+                quoteProjection, # Do not include user email in the returned data (security)
+                collation=sortCollation
+            ).sort(sort).limit(options["limit"] + 1)
         )
-        for quote in userQuotes:
-            quote["_id"] = str(quote["_id"]) # Convert ObjectId to string for JSON serialization
+        hasMore = len(userQuotes) > options["limit"]
+        userQuotes = userQuotes[:options["limit"]]
+        
+        # Keyset cursor pointing after the last quote of this page
+        nextCursor = None
+        if hasMore:
+            lastQuote = userQuotes[-1]
+            sortValue = lastQuote.get(options["sortField"]) if options["sortField"] else None
+            nextCursor = encodeCursor(sortValue, lastQuote["_id"])
+        
+        payload = {
+            "quotes": [serializeQuote(quote) for quote in userQuotes],
+            "nextCursor": nextCursor,
+            "version": user.get("libraryVersion", 0),
+        }
+        # Number of quotes matching the search over all pages, asked for with the first page (?count=1)
+        if request.args.get("count", "").lower() in ("1", "true"):
+            countQuery, _ = buildListQuery(userEmail, {**options, "cursor": None})
+            payload["total"] = quotesCollection.count_documents(countQuery, collation=sortCollation) # Same indexes as the page
+        return quoteListResponse(payload)
+    
+    except Exception as e:
+        print(f"Error listing quotes: {str(e)}")
+        return jsonify({"error": "Something went wrong"}), 500
+
+@app.route("/quotes/search", methods=["GET"])
+def searchQuotes():
+    try:
+        # Ensure the user is logged in
+        if "user" not in session:
+            return jsonify({"error": "Unauthorized access. Please log in."}), 401
+        
+        # Validate query, field and paging parameters
+        try:
+            options = parseSearchArgs(request.args)
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Connect to MongoDB
+        quotesCollection = app.db["quotes"]
+        userEmail = session["user"]
+        
+        # Rank the matching quotes by _id and score, then load only the quotes of the page
+        result = searchPage(quotesCollection, userEmail, options)
+        total = result["total"]
+        hits = [serializeQuote(quote) for quote in result["quotes"]]
         
-        return render_template("index.html", quotes= userQuotes)
+        return quoteListResponse({
+            "quotes": hits,
+            "total": total,
+            "page": options["page"],
+            "hasMore": options["page"] * options["limit"] < total,
+        })
     
-    return redirect("/") # Redirect to register page if not logged in
+    except Exception as e:
+        print(f"Error searching quotes: {str(e)}")
+        return jsonify({"error": "Something went wrong"}), 500
+
+@app.route("/quotes/suggest", methods=["GET"])
+def suggestValues():
+    try:
+        # Ensure the user is logged in
+        if "user" not in session:
+            return jsonify({"error": "Unauthorized access. Please log in."}), 401
+        
+        # Validate field, prefix and limit
+        try:
+            options = parseSuggestArgs(request.args)
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Values of the field starting with the prefix, most used first, from the suggestions collection only
+        suggestions = findSuggestions(
+            app.db["suggestions"], session["user"], options["field"], options["prefix"], options["limit"]
+        )
+        return jsonify({"field": options["field"], "prefix": options["prefix"], "suggestions": suggestions})
+    
+    except Exception as e:
+        print(f"Error suggesting values: {str(e)}")
+        return jsonify({"error": "Something went wrong"}), 500
+
+@app.route("/quotes/changes", methods=["GET"])
+def listChanges():
+    try:
+        # Ensure the user is logged in
+        if "user" not in session:
+            return jsonify({"error": "Unauthorized access. Please log in."}), 401
+        
+        # Library version the client last synced at
+        try:
+            since = parseChangesArgs(request.args)
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        userEmail = session["user"]
+        
+        # Version read before the changes, so a change landing in between is sent again next time rather than missed
+        user = app.db["users"].find_one({"email": userEmail}, {"_id": 0, "libraryVersion": 1, "syncFloor": 1}) or {}
+        
+        # Quotes stamped since then and tombstones of the deleted ones, or reset when the client has to reload
+        changes = collectChanges(app.db["quotes"], app.db["tombstones"], user, userEmail, since)
+        changes["retention"] = int(tombstoneRetention.total_seconds()) # Clients that synced longer ago reload
+        return quoteListResponse(changes)
+    
+    except Exception as e:
+        print(f"Error listing changes: {str(e)}")
+        return jsonify({"error": "Something went wrong"}), 500
+
+@app.route("/service-worker.js")
+def serviceWorker():
+    # Served from the root so it controls /home, and never fingerprinted: browsers look for a new version on every visit
+    response = send_from_directory(os.path.join(app.static_folder, "js"), "serviceWorker.js", max_age= 0)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @app.route("/")
 def registerPage():
@@ -82,8 +455,7 @@ def register():
         
         # Connect to MongoDB collections
         # Can use dynamically injected db (mock db)
-        userCollection = app.db["users"]
-        userCollection.create_index("email", unique=True)
+        userCollection = app.db["users"] # Unique email index is created at startup (see indexes.py)
         
         # Check if user already exists
         existingUser = userCollection.find_one({"email": email})
@@ -91,12 +463,12 @@ def register():
             return jsonify({"error": "This account already exists"}), 400
         
         # Hash and salt the password
-        hashedPassword = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        hashedPassword = passwordHasher.hash(password)
         
         # Create a new user object
         user = {
             "email": email,
-            "password": hashedPassword.decode("utf-8"), # store as a string
+            "password": hashedPassword, # store as a string
             "quotesRemaining": 100, # default quote limit, 100
             "totalQuotes": 100, # default quote limit, 100
             "createdAt": datetime.now(timezone.utc),
@@ -106,6 +478,7 @@ def register():
         
         # Insert new user into the database
         userCollection.insert_one(user)
+        userProfileCache.prime(email, user) # Replaces a cached "does not exist"
         
         # Set session data
         session["user"] = email
@@ -116,6 +489,8 @@ def register():
         # Redirect to the home page
         return jsonify({"message": "Registration successful!"}), 200
         
+    except HasherBusy:
+        return jsonify({"error": "Server is busy. Please try again in a moment."}), 503
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         return jsonify({"error": "Something went wrong"}), 500
@@ -138,15 +513,19 @@ def login():
         existingUser = userCollection.find_one({"email": email})
         if not existingUser:
             return jsonify({"error": "Invalid email or password"}), 400
+        userProfileCache.prime(email, existingUser) # The home page asks for the quota right after
         
         # Verify the password
-        if not bcrypt.checkpw(password.encode("utf-8"), existingUser["password"].encode("utf-8")):
+        if not passwordHasher.verify(password, existingUser["password"]):
             return jsonify({"error": "Invalid email or password"}), 400
         
-        # Update last login time
+        # Update last login time, and the hash if it was made with another work factor than the configured one
+        updatedFields = {"lastLogin": datetime.now(timezone.utc)}
+        if passwordHasher.needsRehash(existingUser["password"]):
+            updatedFields["password"] = passwordHasher.hash(password)
         userCollection.update_one(
             {"email": email},
-            {"$set": {"lastLogin": datetime.now(timezone.utc)}}
+            {"$set": updatedFields}
         )
         
         # Set session data
@@ -158,6 +537,8 @@ def login():
         # Redirect to the home page
         return jsonify({"message": "Login successful!"}), 200
     
+    except HasherBusy:
+        return jsonify({"error": "Server is busy. Please try again in a moment."}), 503
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         return jsonify({"error": "Something went wrong"}), 500
@@ -173,17 +554,21 @@ def getQuoteLimit():
         userCollection = app.db["users"]
         userEmail = session["user"]
         
-        # Fetch user details
-        user = userCollection.find_one(
-            {"email": userEmail},
-            {"_id": 0, "quotesRemaining": 1, "totalQuotes": 1}
-        )
+        # Fetch user details, from the profile cache when the user was active a moment ago
+        user = userProfileCache.get(userCollection, userEmail)
         if not user:
             session.pop("user", None) # User not found in DB; end the session and log them out
             return jsonify({"error": "User not found. Please log in again."}), 401
         
+        # Quota changes with every add/delete, so its values are its version
+        etag = makeETag(userEmail, user["quotesRemaining"], user["totalQuotes"])
+        cached = notModified(etag)
+        if cached:
+            return cached
+        
         # Return the user's quote limit
-        return jsonify({"remainingQuotes": user["quotesRemaining"], "totalQuotes": user["totalQuotes"]}), 200
+        response = jsonify({"remainingQuotes": user["quotesRemaining"], "totalQuotes": user["totalQuotes"]})
+        return withETag(response, etag), 200
     
     except Exception as e:
         print(f"Error fetching quote limits: {str(e)}")
@@ -197,82 +582,64 @@ def addQuote():
             return jsonify({"error": "Unauthorized access. Please log in."}), 401
         
         # Parse incoming JSON data
-        data = request.get_json()
-        bookSeries = data.get("bookSeries").strip()
-        bookTitle = data.get("bookTitle").strip()
-        characters = data.get("characters").strip()
-        quote = data.get("quote").strip()
-        author = data.get("author").strip()
-        
-        # Basic validations
-        # Required fields
-        if not bookTitle or not quote or not author:
-            return jsonify({"error": "Book title, quote, and author are mandatory fields."}), 400
-        # Spam protection (data longer than specified characters)
-        for ele in [bookSeries, bookTitle, characters, quote, author]:
-            if ele and len(ele) > characterSpamLimit:
-                return jsonify({"error": f"Any field should not be longer than {characterSpamLimit} characters."}), 400
+        # Basic validations: required fields and spam protection (data longer than specified characters)
+        try:
+            fields = cleanQuoteFields(request.get_json())
+        except QuoteValidationError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Connect to MongoDB
         quotesCollection = app.db["quotes"]
         userCollection = app.db["users"]
         userEmail = session["user"]
         
-        # Get user data to check quotesRemaining
-        user = userCollection.find_one({"email": userEmail})
-        if not user:
-            session.pop("user", None) # User not found in DB; end the session and log them out
-            return jsonify({"error": "User not found. Please log in again."}), 401
-        if user["quotesRemaining"] <= 0:
+        # Reserve one quote of the quota first: a single conditional update, so parallel adds can not overdraw it
+        granted = reserveQuota(userCollection, userEmail, 1)
+        if not granted:
+            if not userProfileCache.exists(userCollection, userEmail):
+                session.pop("user", None) # User not found in DB; end the session and log them out
+                return jsonify({"error": "User not found. Please log in again."}), 401
             return jsonify({"error": "Quote limit reached. Upgrade to add more quotes."}), 403
         
-        # Check for duplicate quotes for the user
-        duplicate = quotesCollection.find_one({
-            "userEmail": userEmail,
-            "bookSeries": bookSeries,
-            "bookTitle": bookTitle,
-            "characters": characters,
-            "quote": quote,
-            "author": author,
-        })
-        if duplicate:
-            return jsonify({"error": "Duplicate quote detected."}), 400
-        
         # Create a new quote object
         newQuote = {
             "userEmail": userEmail,
-            "bookSeries": bookSeries,
-            "bookTitle": bookTitle,
-            "characters": characters,
-            "quote": quote,
-            "author": author,
+            **fields,
             "createdAt": datetime.now(timezone.utc),
             "updatedAt": datetime.now(timezone.utc),
         }
+        newQuote.update(derivedFields(newQuote)) # Fingerprint and search terms
+        
+        # Insert the new quote, the unique (userEmail, fingerprint) index rejects duplicates.
+        # The reserved quote is given back if the insert does not go through.
+        try:
+            quotesCollection.insert_one(newQuote)
+        except DuplicateKeyError:
+            releaseQuota(userCollection, userEmail, 1)
+            return jsonify({"error": "Duplicate quote detected."}), 400
+        except Exception:
+            releaseQuota(userCollection, userEmail, 1)
+            raise
+        userProfileCache.applyIncrement(userEmail, quotesRemaining= -1) # Same $inc as the reservation
         
-        # Insert the new quote
-        quotesCollection.insert_one(newQuote)
+        # Bump the library version only now that the quote is stored, then list the quote under it
+        version = bumpLibraryVersion(userCollection, userEmail)
+        stampQuotes(quotesCollection, [newQuote["_id"]], version) # Listed by GET /quotes/changes
         
-        # Update user's quotesRemaining
-        userCollection.update_one(
-            {"email": userEmail},
-            {
-                "$inc": {"quotesRemaining": -1}, 
-                "$set": {"updatedAt": datetime.now(timezone.utc)}
-            }
-        )
+        updateSuggestions(userEmail, added= [newQuote])
+        
+        # Keep the cached quote list in step
+        newQuote = serializeQuote(newQuote)
+        quoteListCache.applyChange(userEmail, version, quote= newQuote)
+        
+        # Delta mode: only send back the new quote
+        if wantsDelta():
+            return jsonify({"message": "Quote added successfully!", "quote": newQuote, "version": version}), 200
         
         # Fetch all quotes for the user and return them
-        userQuotes = list(
-            quotesCollection.find(
-                {"userEmail": userEmail}, 
-                {"userEmail": 0} # Do not include user email in the returned data (security)
-            )
-        )
-        for quoteBlock in userQuotes:
-            quoteBlock["_id"] = str(quoteBlock["_id"]) # Convert ObjectId to string for JSON serialization
+        userQuotes = getUserQuotes(userEmail, version)
             
-        return jsonify({"message": "Quote added successfully!", "quotes": userQuotes}), 200
+        return quoteListResponse({"message": "Quote added successfully!", "quotes": userQuotes, "version": version})
     
     except Exception as e:
         print(f"Error occurred: {str(e)}")
@@ -286,48 +653,52 @@ def editQuote(quoteId):
             return jsonify({"error": "Unauthorized access. Please log in."}), 401
         
         # Parse incoming JSON data
-        data = request.get_json()
-        updatedFields = {
-            "bookSeries": data.get("bookSeries").strip() if data.get("bookSeries").strip() else data.get("bookTitle").strip(),
-            "bookTitle": data.get("bookTitle").strip(),
-            "characters": data.get("characters").strip() if data.get("characters").strip() else data.get("author").strip(),
-            "quote": data.get("quote").strip(),
-            "author": data.get("author").strip(),
-            "updatedAt": datetime.now(timezone.utc),
-        }
+        # Basic validations: required fields and spam protection, empty series/characters default to title/author
+        try:
+            updatedFields = cleanQuoteFields(request.get_json(), fillDefaults= True)
+        except QuoteValidationError as e:
+            return jsonify({"error": str(e)}), 400
+        updatedFields["updatedAt"] = datetime.now(timezone.utc)
         
-        # Basic validations
-        # Required fields
-        if not updatedFields["bookTitle"] or not updatedFields["quote"] or not updatedFields["author"]:
-            return jsonify({"error": "Book title, quote, and author are mandatory fields."}), 400
-        # Spam protection (data longer than specified characters)
-        for value in updatedFields.values():
-            if value and not isinstance(value, datetime) and len(value) > characterSpamLimit:
-                return jsonify({"error": f"Any field should not be longer than {characterSpamLimit} characters."}), 400
+        updatedFields.update(derivedFields(updatedFields)) # Fingerprint and search terms
         
         # Connect to MongoDB
         quotesCollection = app.db["quotes"]
+        userCollection = app.db["users"]
         userEmail = session["user"]
         
-        # Update the quote
-        result = quotesCollection.update_one(
-            {"_id": ObjectId(quoteId), "userEmail": userEmail},
-            {"$set": updatedFields}
-        )
-        if result.matched_count == 0:
+        # Update the quote and get the previous document back in the same round trip
+        # (the suggestions need the values it had, the response is the previous document with the changes applied)
+        try:
+            previousQuote = quotesCollection.find_one_and_update(
+                {"_id": ObjectId(quoteId), "userEmail": userEmail},
+                {"$set": updatedFields},
+                projection=quoteProjection, # Do not include user email in the returned data (security)
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            return jsonify({"error": "Duplicate quote detected."}), 400
+        if previousQuote is None:
             return jsonify({"error": "Quote not found or unauthorized"}), 404
+        updatedQuote = {**previousQuote, **{field: value for field, value in updatedFields.items() if field not in quoteProjection}}
+        updateSuggestions(userEmail, removed= [previousQuote], added= [updatedQuote])
+        
+        # Bump the library version only now that the edit went through, then list the quote under it
+        version = bumpLibraryVersion(userCollection, userEmail)
+        stampQuotes(quotesCollection, [previousQuote["_id"]], version) # Listed by GET /quotes/changes
+        
+        # Keep the cached quote list in step
+        updatedQuote = serializeQuote(updatedQuote)
+        quoteListCache.applyChange(userEmail, version, quote= updatedQuote)
+        
+        # Delta mode: only send back the updated quote
+        if wantsDelta():
+            return jsonify({"message": "Quote updated successfully!", "quote": updatedQuote, "version": version}), 200
         
         # Fetch updated quotes and return them
-        userQuotes = list(
-            quotesCollection.find(
-                {"userEmail": userEmail},
-                {"userEmail": 0} # Do not include user email in the returned data (security)
-            )
-        )
-        for quoteBlock in userQuotes:
-            quoteBlock["_id"] = str(quoteBlock["_id"]) # Convert ObjectId to string for JSON serialization
+        userQuotes = getUserQuotes(userEmail, version)
         
-        return jsonify({"message": "Quote updated successfully!", "quotes": userQuotes}), 200
+        return quoteListResponse({"message": "Quote updated successfully!", "quotes": userQuotes, "version": version})
         
     except Exception as e:
         print(f"Error occurred: {str(e)}")
@@ -346,42 +717,186 @@ def deleteQuote(quoteId):
         userCollection = app.db["users"]
         userEmail = session["user"]
         
-        # Delete the quote
-        result = quotesCollection.delete_one(
-            {"_id": ObjectId(quoteId), "userEmail": userEmail}
+        # Delete the quote, getting back the values its suggestions were counted with
+        deletedQuote = quotesCollection.find_one_and_delete(
+            {"_id": ObjectId(quoteId), "userEmail": userEmail},
+            projection={field: 1 for field in suggestionFields}
         )
-        if result.deleted_count == 0:
+        if deletedQuote is None:
             return jsonify({"error": "Quote not found or unauthorized"}), 404
+        updateSuggestions(userEmail, removed= [deletedQuote])
         
-        # Increment quotesRemaining for the user
-        userCollection.update_one(
-            {"email": userEmail},
-            {
-                "$inc": {"quotesRemaining": 1},
-                "$set": {"updatedAt": datetime.now(timezone.utc)}
-            }
-        )
+        # Give the quote back to the quota and bump the library version, in one update
+        version = releaseQuota(userCollection, userEmail, 1, bumpVersion= True)
+        userProfileCache.applyIncrement(userEmail, quotesRemaining= 1)
+        if version is not None:
+            recordDeletion(app.db["tombstones"], userEmail, quoteId, version) # Clients syncing later drop their copy
+        
+        # Keep the cached quote list in step
+        quoteListCache.applyChange(userEmail, version, deletedId= quoteId)
+        
+        # Delta mode: only send back the id of the deleted quote
+        if wantsDelta():
+            return jsonify({"message": "Quote deleted successfully!", "deletedId": quoteId, "version": version}), 200
         
         # Fetch updated quotes and return them
-        userQuotes = list(
-            quotesCollection.find(
-                {"userEmail": userEmail},
-                {"userEmail": 0} # Do not include user email in the returned data (security)
+        userQuotes = getUserQuotes(userEmail, version)
+        
+        return quoteListResponse({"message": "Quote deleted successfully!", "quotes": userQuotes, "version": version})
+        
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        return jsonify({"error": "Something went wrong"}), 500
+
+@app.route("/quotes/batch", methods=["POST"])
+def batchQuotes():
+    try:
+        # Ensure the user is logged in
+        if "user" not in session:
+            return jsonify({"error": "Unauthorized access. Please log in."}), 401
+        
+        try:
+            operations = parseOperations(request.get_json(silent= True))
+        except BatchError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        quotesCollection = app.db["quotes"]
+        userCollection = app.db["users"]
+        userEmail = session["user"]
+        
+        if not userProfileCache.exists(userCollection, userEmail):
+            session.pop("user", None) # User not found in DB; end the session and log them out
+            return jsonify({"error": "User not found. Please log in again."}), 401
+        
+        # All operations go to MongoDB in one bulk_write, with a single quota adjustment
+        results, version = runBatch(quotesCollection, userCollection, userEmail, operations)
+        if version is not None:
+            userProfileCache.invalidate(userEmail) # Quota settled by several updates, read it again
+            quoteListCache.invalidate(userEmail) # Too many changes to patch the cached list
+            updateSuggestions(userEmail, rebuild= True) # Counted again, like the cached list
+            requireFullSync(userCollection, userEmail, version) # Nor listed one by one by GET /quotes/changes
+        
+        failed = sum(1 for result in results if result["status"] == "error")
+        response = {
+            "message": f"{len(results) - failed} of {len(results)} operations applied.",
+            "results": results,
+            "version": version,
+        }
+        
+        # Delta mode: only the per-operation results
+        if not wantsDelta():
+            response["quotes"] = getUserQuotes(userEmail, version)
+            return quoteListResponse(response)
+        
+        return jsonify(response), 200
+    
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        return jsonify({"error": "Something went wrong"}), 500
+
+@app.route("/quotes/export", methods=["GET"])
+def exportQuotes():
+    try:
+        # Ensure the user is logged in
+        if "user" not in session:
+            return jsonify({"error": "Unauthorized access. Please log in."}), 401
+        
+        exportFormat = request.args.get("format", "ndjson").lower()
+        if exportFormat not in exportMimetypes:
+            return jsonify({"error": "Unsupported format. Use ndjson, csv or json."}), 400
+        compress = request.args.get("gzip", "").lower() in ("1", "true")
+        
+        # Quotes go from the cursor to the client batch by batch, the library is never held in memory
+        chunks = generateExport(exportCursor(app.db["quotes"], session["user"]), exportFormat)
+        filename = f"quotes.{exportFormat}"
+        mimetype = exportMimetypes[exportFormat]
+        if compress:
+            chunks = gzipChunks(chunks)
+            filename += ".gz"
+            mimetype = "application/gzip"
+        
+        response = app.response_class(chunks, mimetype= mimetype)
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response.headers["Cache-Control"] = "private, no-store"
+        return response
+    
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        return jsonify({"error": "Something went wrong"}), 500
+
+@app.route("/quotes/import", methods=["POST"])
+def importQuotes():
+    try:
+        # Ensure the user is logged in
+        if "user" not in session:
+            return jsonify({"error": "Unauthorized access. Please log in."}), 401
+        
+        quotesCollection = app.db["quotes"]
+        userCollection = app.db["users"]
+        userEmail = session["user"]
+        
+        if not userProfileCache.exists(userCollection, userEmail):
+            session.pop("user", None) # User not found in DB; end the session and log them out
+            return jsonify({"error": "User not found. Please log in again."}), 401
+        
+        # Either a multipart upload (file field) or the raw request body
+        upload = request.files.get("file")
+        try:
+            importFormat = detectFormat(
+                request.args.get("format"),
+                upload.filename if upload else None,
+                upload.mimetype if upload else request.mimetype
             )
-        )
-        for quoteBlock in userQuotes:
-            quoteBlock["_id"] = str(quoteBlock["_id"]) # Convert ObjectId to string for JSON serialization
+        except ImportFormatError as e:
+            return jsonify({"error": str(e)}), 400
         
-        return jsonify({"message": "Quote deleted successfully!", "quotes": userQuotes}), 200
+        # Records are parsed and inserted batch by batch, the file is never held in memory
+        stream = upload.stream if upload else request.stream
+        report = importQuoteRecords(quotesCollection, userCollection, userEmail, iterRecords(stream, importFormat))
         
+        userProfileCache.invalidate(userEmail) # Quota reserved and released batch by batch, read it again
+        if report["imported"]:
+            quoteListCache.invalidate(userEmail) # Too many changes to patch the cached list
+            updateSuggestions(userEmail, rebuild= True) # Counted again, like the cached list
+        
+        return jsonify({"message": f"{report['imported']} quotes imported.", **report}), 200
+    
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         return jsonify({"error": "Something went wrong"}), 500
 
+@app.route("/internal/stats", methods=["GET"])
+def internalStats():
+    # Cache, password pool and MongoDB pool counters of this process, only for requests made from the server itself
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({
+        "pid": os.getpid(),
+        "quoteListCache": quoteListCache.stats(),
+        "userProfileCache": userProfileCache.stats(),
+        "passwordHasher": passwordHasher.stats(),
+        "mongo": mongoConnection.stats(),
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Prometheus scrape target: METRICS_TOKEN as bearer token, or only from the server itself when no token is set.
+    # Under gunicorn the numbers of every worker are summed, whichever worker picks up the scrape.
+    token = app.config.get("METRICS_TOKEN")
+    if token:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return jsonify({"error": "Unauthorized"}), 401
+    elif request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "Not found"}), 404
+    
+    families = multiprocessMetrics.collect() if multiprocessMetrics else metricFamilies()
+    return app.response_class(renderMetrics(families), mimetype= "text/plain; version=0.0.4")
+
 @app.route("/logout", methods= ["GET"])
 def logout():
     session.pop("user", None) # Remove user session
     return redirect("/") # Redirect to the register page
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Development server only, production runs gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.getenv("FLASK_DEBUG", "0") == "1", host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,373 @@
+"""Static asset build: content hashed file names, minified JS/CSS and background image variants
+
+    flask --app app build-assets    (or: python assets.py [--static static])
+
+Writes static/dist/ and static/dist/manifest.json, which assetUrl (see AssetManifest) reads to turn
+"css/styles.css" into "/static/dist/css/styles.3f2a9c81d0e4.css". Without a manifest (nothing built)
+the plain /static paths are used, so a development checkout works without the build.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+
+try:
+    from PIL import Image, features # In requirements.txt, for WebP/AVIF and resized images
+except ImportError:
+    Image = None
+
+distFolder = "dist" # Inside the static folder
+manifestName = "manifest.json"
+hashLength = 12
+# name.<12 hex digits>.ext, the files that may be cached forever
+fingerprintPattern = re.compile(r"\.[0-9a-f]{12}\.[A-Za-z0-9]+$")
+
+# Widths of the resized background images, the original is kept as the largest variant
+backgroundWidths = (640, 1280, 1920)
+# Formats of the background variants, best first: (Pillow format, extension, media type, save options)
+imageFormats = (
+    ("AVIF", ".avif", "image/avif", {"quality": 50}),
+    ("WEBP", ".webp", "image/webp", {"quality": 75, "method": 6}),
+    ("JPEG", ".jpg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+)
+imageExtensions = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico")
+
+
+class AssetManifest:
+    """Maps source paths (relative to the static folder) to their built, fingerprinted copies"""
+
+    def __init__(self, staticFolder):
+        self.staticFolder = staticFolder
+        self.assets = {}
+        self.version = "" # Changes with every build, part of the ETag of pages that link assets
+        self.load()
+
+    def load(self):
+        path = os.path.join(self.staticFolder, distFolder, manifestName)
+        try:
+            with open(path, "rb") as manifestFile:
+                data = manifestFile.read()
+        except FileNotFoundError:
+            self.assets, self.version = {}, ""
+            return
+        self.assets = json.loads(data)["assets"]
+        self.version = hashlib.sha256(data).hexdigest()[:hashLength]
+
+    def resolve(self, path):
+        """Built copy of path if there is one, path itself otherwise
+
+        Args:
+            path (str): Path relative to the static folder, e.g. "js/script.js"
+
+        Returns:
+            str: Path relative to the static folder
+        """
+        return self.assets.get(path, path)
+
+
+def isFingerprinted(filename):
+    """Whether a static file name is a build output whose content never changes
+
+    Args:
+        filename (str): Path relative to the static folder
+
+    Returns:
+        bool: True for dist/ files with a content hash in their name
+    """
+    return filename.startswith(distFolder + "/") and fingerprintPattern.search(filename) is not None
+
+
+def contentHash(data):
+    return hashlib.sha256(data).hexdigest()[:hashLength]
+
+
+def fingerprintedName(path, data, suffix=""):
+    # css/styles.css -> dist/css/styles.<hash>.css
+    base, extension = os.path.splitext(path)
+    return f"{distFolder}/{base}{suffix}.{contentHash(data)}{extension}"
+
+
+def minifyCss(text):
+    """Strip comments and whitespace that does not change the meaning of a stylesheet
+
+    Args:
+        text (str): CSS
+
+    Returns:
+        str: Minified CSS
+    """
+    strings = r""""(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'"""
+    # Comments first, matched along with strings so quotes in comments and "/*" in strings are no trouble
+    text = re.sub(r"/\*.*?\*/|" + strings, lambda match: "" if match.group(0).startswith("/*") else match.group(0), text, flags=re.S)
+    parts = re.split(f"({strings})", text) # Strings are left untouched
+    for index in range(0, len(parts), 2):
+        part = re.sub(r"\s+", " ", parts[index])
+        part = re.sub(r"\s*([{};,>])\s*", r"\1", part)
+        part = re.sub(r":\s+", ":", part) # Not "\s+:", "a :hover" and "a:hover" are different selectors
+        part = part.replace(";}", "}")
+        parts[index] = part
+    return "".join(parts).strip()
+
+
+def minifyJs(text):
+    """Strip comments, indentation and blank lines from a script
+
+    Line breaks are kept, so automatic semicolon insertion works as before; strings, template
+    literals and regular expression literals are copied as they are.
+
+    Args:
+        text (str): JavaScript
+
+    Returns:
+        str: Minified JavaScript
+    """
+    output = []
+    index, length = 0, len(text)
+    lastSignificant = "" # Last character outside comments and whitespace, tells a regex from a division
+    while index < length:
+        char = text[index]
+        if char in "\"'`":
+            end = index + 1
+            while end < length and text[end] != char:
+                end += 2 if text[end] == "\\" else 1
+            output.append(text[index:end + 1])
+            index, lastSignificant = end + 1, char
+        elif text.startswith("//", index):
+            end = text.find("\n", index)
+            index = length if end == -1 else end
+        elif text.startswith("/*", index):
+            end = text.find("*/", index + 2)
+            index = length if end == -1 else end + 2
+        elif char == "/" and (lastSignificant == "" or lastSignificant in "(,=:[!&|?{};+-*%<>~^"):
+            end, inClass = index + 1, False
+            while end < length and (text[end] != "/" or inClass) and text[end] != "\n":
+                if text[end] == "\\":
+                    end += 1
+                elif text[end] == "[":
+                    inClass = True
+                elif text[end] == "]":
+                    inClass = False
+                end += 1
+            output.append(text[index:end + 1])
+            index, lastSignificant = end + 1, "/"
+        elif char == "\n":
+            while output and output[-1] in (" ", "\t"):
+                output.pop()
+            if output and output[-1] != "\n":
+                output.append("\n")
+            index += 1
+            while index < length and text[index] in " \t\r":
+                index += 1
+        elif char in " \t\r":
+            # Runs of spaces become one, none at the start of a line
+            if output and output[-1] not in (" ", "\n"):
+                output.append(" ")
+            index += 1
+        else:
+            output.append(char)
+            index, lastSignificant = index + 1, char
+    return "".join(output).strip() + "\n"
+
+
+def rewriteReferences(text, assets, relativeTo):
+    """Point url(...) and "../static/..." references at the fingerprinted copies
+
+    Args:
+        text (str): CSS or JS source
+        assets (dict): Manifest built so far (source path -> built path)
+        relativeTo (str): Directory of the source, relative to the static folder
+
+    Returns:
+        str: Source with built paths
+    """
+    def cssUrl(match):
+        reference = match.group(2)
+        source = os.path.normpath(os.path.join(relativeTo, reference)).replace(os.sep, "/")
+        if source not in assets:
+            return match.group(0)
+        return f'url("/static/{assets[source]}")'
+
+    def scriptPath(match):
+        source = match.group(2)
+        if source not in assets:
+            return match.group(0)
+        return f"{match.group(1)}/static/{assets[source]}{match.group(1)}"
+
+    text = re.sub(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""", cssUrl, text)
+    return re.sub(r"""(["'])\.\./static/([^"']+)\1""", scriptPath, text)
+
+
+def backgroundImages(css, relativeTo):
+    # Images used as background-image, relative to the static folder
+    return {
+        os.path.normpath(os.path.join(relativeTo, reference)).replace(os.sep, "/")
+        for reference in re.findall(r"""background(?:-image)?\s*:[^;}]*url\(\s*["']?([^"')]+)""", css)
+    }
+
+
+def availableImageFormats():
+    """Image formats this Pillow can write, best first
+
+    Returns:
+        list: Entries of imageFormats ([] without Pillow)
+    """
+    if Image is None:
+        return []
+    formats = []
+    for entry in imageFormats:
+        if entry[0] == "AVIF" and not features.check("avif"):
+            continue
+        if entry[0] == "WEBP" and not features.check("webp"):
+            continue
+        formats.append(entry)
+    return formats
+
+
+def buildImageVariants(data, path, widths=backgroundWidths):
+    """Resized WebP/AVIF/JPEG copies of an image
+
+    Args:
+        data (bytes): Original image
+        path (str): Its path relative to the static folder
+        widths (tuple, optional): Widths to produce, those wider than the original are skipped
+
+    Returns:
+        list: (built path, bytes, media type, width), best format first and widest first per format
+    """
+    formats = availableImageFormats()
+    if not formats:
+        return []
+    with Image.open(io.BytesIO(data)) as original:
+        original.load()
+        image = original.convert("RGB")
+    targetWidths = sorted({width for width in widths if width < image.width} | {image.width}, reverse=True)
+    variants = []
+    for pillowFormat, extension, mediaType, options in formats:
+        for width in targetWidths:
+            resized = image if width == image.width else image.resize(
+                (width, round(image.height * width / image.width)), Image.LANCZOS
+            )
+            buffer = io.BytesIO()
+            resized.save(buffer, pillowFormat, **options)
+            variantData = buffer.getvalue()
+            base = os.path.splitext(path)[0]
+            variants.append((fingerprintedName(base + extension, variantData, f"-{width}w"), variantData, mediaType, width))
+    return variants
+
+
+def imageSetRules(css, variants):
+    """Add image-set() declarations (and smaller images on narrow screens) next to background images
+
+    Browsers without image-set() keep the url() declaration before it.
+
+    Args:
+        css (str): Minified stylesheet whose url()s already point at built files
+        variants (dict): Built path of an image -> its variants (see buildImageVariants)
+
+    Returns:
+        str: Stylesheet
+    """
+    def imageSet(entries):
+        return "image-set(" + ",".join(f'url("/static/{path}") type("{mediaType}")' for path, mediaType in entries) + ")"
+
+    def rule(match):
+        selector, body = match.group(1), match.group(2)
+        found = re.search(r'background(?:-image)?:[^;}]*url\("/static/([^"]+)"\)', body)
+        if not found or found.group(1) not in variants:
+            return match.group(0)
+        imageVariants = variants[found.group(1)]
+        widths = sorted({width for _, _, _, width in imageVariants}, reverse=True)
+        # Widest image of every format for the declaration, narrower ones behind media queries
+        byWidth = {width: [(path, mediaType) for path, _, mediaType, w in imageVariants if w == width] for width in widths}
+        extra = f"{selector}{{{body};background-image:{imageSet(byWidth[widths[0]])}}}"
+        for width in widths[1:]:
+            extra += f"@media (max-width:{width}px){{{selector}{{background-image:{imageSet(byWidth[width])}}}}}"
+        return extra
+
+    return re.sub(r"([^{}]+)\{([^{}]*)\}", rule, css)
+
+
+def buildAssets(staticFolder, minify=True, imageWidths=backgroundWidths):
+    """Build every static file into staticFolder/dist and write the manifest
+
+    Images are copied first, stylesheets and scripts after them, so their references can be
+    rewritten to the fingerprinted image names. The previous build is removed.
+
+    Args:
+        staticFolder (str): Flask static folder
+        minify (bool, optional): Minify CSS and JS. Defaults to True.
+        imageWidths (tuple, optional): Widths of the background image variants. Defaults to backgroundWidths.
+
+    Returns:
+        dict: The manifest ({"assets": {source: built}, "variants": {source: [{path, type, width}]}})
+    """
+    outputFolder = os.path.join(staticFolder, distFolder)
+    shutil.rmtree(outputFolder, ignore_errors=True)
+
+    sources = []
+    for directory, directories, files in os.walk(staticFolder):
+        directories[:] = [name for name in directories if os.path.join(directory, name) != outputFolder]
+        for name in files:
+            sources.append(os.path.relpath(os.path.join(directory, name), staticFolder).replace(os.sep, "/"))
+    # Images, then everything else but scripts and stylesheets, then stylesheets, then scripts
+    order = lambda path: (path.endswith(".js"), path.endswith(".css"), not path.endswith(imageExtensions), path)
+    sources.sort(key=order)
+
+    # Background images of every stylesheet, they get resized variants
+    backgrounds = set()
+    for source in sources:
+        if source.endswith(".css"):
+            with open(os.path.join(staticFolder, source), encoding="utf-8") as cssFile:
+                backgrounds |= backgroundImages(cssFile.read(), os.path.dirname(source))
+
+    assets, variants, builtVariants = {}, {}, {}
+    outputs = []
+    for source in sources:
+        with open(os.path.join(staticFolder, source), "rb") as sourceFile:
+            data = sourceFile.read()
+        if source.endswith((".css", ".js")):
+            text = rewriteReferences(data.decode("utf-8"), assets, os.path.dirname(source))
+            if source.endswith(".css"):
+                text = minifyCss(text) if minify else text
+                text = imageSetRules(text, builtVariants) if minify else text
+            elif minify:
+                text = minifyJs(text)
+            data = text.encode("utf-8")
+        built = fingerprintedName(source, data)
+        assets[source] = built
+        outputs.append((built, data))
+
+        if source in backgrounds:
+            imageVariants = buildImageVariants(data, source, imageWidths)
+            if not imageVariants: # Pillow is not installed
+                continue
+            outputs.extend((path, variantData) for path, variantData, _, _ in imageVariants)
+            builtVariants[built] = [(path, None, mediaType, width) for path, _, mediaType, width in imageVariants]
+            variants[source] = [{"path": path, "type": mediaType, "width": width} for path, _, mediaType, width in imageVariants]
+
+    for built, data in outputs:
+        path = os.path.join(staticFolder, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as outputFile:
+            outputFile.write(data)
+
+    manifest = {"assets": assets, "variants": variants}
+    with open(os.path.join(outputFolder, manifestName), "w", encoding="utf-8") as manifestFile:
+        json.dump(manifest, manifestFile, indent=2, sort_keys=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, minified static assets")
+    parser.add_argument("--static", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+    parser.add_argument("--no-minify", action="store_true")
+    args = parser.parse_args()
+    manifest = buildAssets(args.static, minify=not args.no_minify)
+    print(f"Built {len(manifest['assets'])} assets and {sum(len(v) for v in manifest['variants'].values())} image variants")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Load driver: run a mix of requests from several threads and report latency and throughput per route
+
+    python -m benchmarks.run --target mongomock --threads 8 --duration 30
+    python -m benchmarks.run --target mongod --mongo-uri mongodb://localhost:27017 --database quote-bench
+    python -m benchmarks.run --target http --url http://127.0.0.1:5000 (seed the server's database first)
+    python -m benchmarks.run ... --compare benchmarks/results/<earlier run>.json
+
+mongomock and mongod targets serve the app in this process through the Flask test client, so they
+measure the application code and the database; the http target measures a running server (gunicorn).
+Results are written to benchmarks/results/<time>-<commit>.json.
+"""
+import argparse
+import http.cookies
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+from benchmarks.seed import benchmarkEmail, benchmarkPassword, randomQuote, seedDatabase, words
+
+resultsDirectory = os.path.join(os.path.dirname(__file__), "results")
+
+# Relative weight of every operation in the default mix
+defaultMix = {
+    "home": 30, "list": 20, "search": 10, "quota": 10, "add": 10, "edit": 10, "delete": 5, "login": 4, "register": 1,
+}
+
+
+class InProcessClient:
+    """Calls the app through the Flask test client, keeping the session cookie"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    """Calls a running server; the session cookie is kept by hand as it is marked Secure"""
+
+    def __init__(self, baseUrl):
+        self.baseUrl = baseUrl.rstrip("/")
+        self.cookies = {}
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.baseUrl + path, data=data, method=method)
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+        if self.cookies:
+            request.add_header("Cookie", "; ".join(f"{name}={value}" for name, value in self.cookies.items()))
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                self._keepCookies(response.headers)
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            self._keepCookies(e.headers)
+            return e.code, e.read()
+
+    def _keepCookies(self, headers):
+        for header in headers.get_all("Set-Cookie") or []:
+            for name, morsel in http.cookies.SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+
+
+class VirtualUser:
+    """One benchmark user, logged in once and then running operations picked from the mix"""
+
+    def __init__(self, client, email, rng, newClient):
+        self.client = client
+        self.email = email
+        self.rng = rng
+        self.newClient = newClient # Registrations run on a separate client, the session stays with this user
+        self.quoteIds = [] # Quotes of the user, edited at random
+        self.addedIds = [] # Quotes added by this run, the only ones deleted (the library keeps its size)
+
+    def start(self):
+        self.client.request("POST", "/login", {"email": self.email, "password": benchmarkPassword})
+        status, body = self.client.request("GET", "/quotes?limit=50")
+        if status == 200:
+            self.quoteIds = [quote["_id"] for quote in json.loads(body)["quotes"]]
+
+    def run(self, operation):
+        """Run one operation
+
+        Returns:
+            tuple: (operation actually run, status)
+        """
+        if operation == "delete" and not self.addedIds:
+            operation = "add"
+        if operation == "edit" and not self.quoteIds:
+            operation = "add"
+        return operation, getattr(self, operation)()
+
+    def home(self):
+        return self.client.request("GET", "/home")[0]
+
+    def list(self):
+        field = self.rng.choice(["bookTitle", "author", ""]) # "": insertion order
+        return self.client.request("GET", f"/quotes?limit=20&sortField={field}")[0]
+
+    def search(self):
+        return self.client.request("GET", f"/quotes/search?q={self.rng.choice(words)}")[0]
+
+    def quota(self):
+        return self.client.request("GET", "/get-quote-limit")[0]
+
+    def add(self):
+        status, body = self.client.request("POST", "/add-quote?delta=1", self._quoteFields())
+        if status == 200:
+            quoteId = json.loads(body)["quote"]["_id"]
+            self.addedIds.append(quoteId)
+            self.quoteIds.append(quoteId)
+        return status
+
+    def edit(self):
+        quoteId = self.rng.choice(self.quoteIds)
+        return self.client.request("PUT", f"/edit-quote/{quoteId}?delta=1", self._quoteFields())[0]
+
+    def delete(self):
+        quoteId = self.addedIds.pop()
+        self.quoteIds.remove(quoteId)
+        return self.client.request("DELETE", f"/delete-quote/{quoteId}?delta=1")[0]
+
+    def login(self):
+        return self.client.request("POST", "/login", {"email": self.email, "password": benchmarkPassword})[0]
+
+    def register(self):
+        email = f"register-{os.getpid()}-{threading.get_ident()}-{time.monotonic_ns()}@example.com"
+        return self.newClient().request("POST", "/register", {"email": email, "password": benchmarkPassword})[0]
+
+    def _quoteFields(self):
+        quote = randomQuote(self.rng, self.email)
+        return {field: quote[field] for field in ("bookSeries", "bookTitle", "characters", "quote", "author")}
+
+
+def percentile(sortedValues, fraction):
+    # Nearest-rank percentile
+    if not sortedValues:
+        return None
+    return sortedValues[max(0, math.ceil(fraction * len(sortedValues)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (milliseconds) and throughput per operation
+
+    Args:
+        samples (dict): operation -> [(seconds, status)]
+        elapsed (float): Seconds the load ran
+
+    Returns:
+        dict: operation -> count, errors, requestsPerSecond, p50Ms, p95Ms, p99Ms, maxMs
+    """
+    routes = {}
+    for operation, values in sorted(samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in values)
+        routes[operation] = {
+            "count": len(values),
+            "errors": sum(1 for _, status in values if status >= 400),
+            "requestsPerSecond": round(len(values) / elapsed, 2),
+            "p50Ms": round(percentile(latencies, 0.50), 3),
+            "p95Ms": round(percentile(latencies, 0.95), 3),
+            "p99Ms": round(percentile(latencies, 0.99), 3),
+            "maxMs": round(latencies[-1], 3),
+        }
+    return routes
+
+
+def runLoad(makeClient, users, threads, duration, mix, seed=1):
+    """Run the mix from several threads for duration seconds
+
+    Args:
+        makeClient (callable): Returns a new client (InProcessClient or HttpClient)
+        users (int): Seeded users to spread the threads over
+        threads (int): Concurrent virtual users
+        duration (float): Seconds to run
+        mix (dict): operation -> weight
+        seed (int, optional): Random seed of the operation sequence. Defaults to 1.
+
+    Returns:
+        dict: elapsed, total requests, throughput and the per operation summary
+    """
+    samples = {}
+    samplesLock = threading.Lock()
+    operations, weights = zip(*mix.items())
+    virtualUsers = [
+        VirtualUser(makeClient(), benchmarkEmail(index % users), random.Random(seed + index), makeClient)
+        for index in range(threads)
+    ]
+    for virtualUser in virtualUsers:
+        virtualUser.start() # Logins and id lookups are not part of the measured window
+    startLine = threading.Barrier(threads + 1)
+
+    def work(virtualUser):
+        local = {}
+        startLine.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            operation = virtualUser.rng.choices(operations, weights)[0]
+            startedAt = time.perf_counter()
+            operation, status = virtualUser.run(operation)
+            local.setdefault(operation, []).append((time.perf_counter() - startedAt, status))
+        with samplesLock:
+            for operation, values in local.items():
+                samples.setdefault(operation, []).extend(values)
+
+    workers = [threading.Thread(target=work, args=(virtualUser,)) for virtualUser in virtualUsers]
+    for worker in workers:
+        worker.start()
+    startLine.wait()
+    startedAt = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - startedAt
+
+    total = sum(len(values) for values in samples.values())
+    return {
+        "elapsedSeconds": round(elapsed, 3),
+        "requests": total,
+        "requestsPerSecond": round(total / elapsed, 2),
+        "routes": summarize(samples, elapsed),
+    }
+
+
+def gitCommit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def saveResult(result):
+    os.makedirs(resultsDirectory, exist_ok=True)
+    path = os.path.join(resultsDirectory, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json")
+    with open(path, "w") as resultFile:
+        json.dump(result, resultFile, indent=2)
+    return path
+
+
+def printReport(result, baseline=None):
+    print(f"{result['requests']} requests in {result['elapsedSeconds']}s: {result['requestsPerSecond']} req/s")
+    header = f"{'route':<10}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header + ("   p95 vs baseline" if baseline else ""))
+    for route, stats in result["routes"].items():
+        line = (
+            f"{route:<10}{stats['count']:>8}{stats['errors']:>8}{stats['requestsPerSecond']:>10}"
+            f"{stats['p50Ms']:>10}{stats['p95Ms']:>10}{stats['p99Ms']:>10}"
+        )
+        before = baseline["routes"].get(route) if baseline else None
+        if before:
+            change = (stats["p95Ms"] - before["p95Ms"]) / before["p95Ms"] * 100 if before["p95Ms"] else 0
+            line += f"   {change:+.1f}%"
+        print(line)
+
+
+def parseMix(text):
+    mix = {}
+    for part in text.split(","):
+        operation, weight = part.split("=")
+        if operation not in defaultMix:
+            raise argparse.ArgumentTypeError(f"Unknown operation {operation}, use: {', '.join(defaultMix)}")
+        mix[operation] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a request mix against the app and report latency per route")
+    parser.add_argument("--target", choices=("mongomock", "mongod", "http"), default="mongomock")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server of the http target")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017", help="database of the mongod target")
+    parser.add_argument("--database", default="quote-bench")
+    parser.add_argument("--users", type=int, default=20, help="seeded users")
+    parser.add_argument("--quotes", type=int, default=200, help="seeded quotes per user")
+    parser.add_argument("--no-seed", action="store_true", help="use the users already in the database")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--mix", type=parseMix, default=defaultMix, help="e.g. home=50,add=10,delete=10")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="work factor of the in-process app")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    if args.target == "http":
+        makeClient = lambda: HttpClient(args.url)
+    else:
+        import mongomock
+        from app import app, passwordHasher
+        from database import MongoConnection, clientOptions
+
+        app.config["SECRET_KEY"] = app.config.get("SECRET_KEY") or "benchmark-secret-key"
+        if args.bcrypt_rounds:
+            passwordHasher.rounds = args.bcrypt_rounds
+        if args.target == "mongomock":
+            app.db = mongomock.MongoClient()[args.database]
+        else:
+            app.db = MongoConnection(args.mongo_uri, options=clientOptions()).database(args.database)
+        if not args.no_seed:
+            seedDatabase(app.db, args.users, args.quotes, seed=args.seed, rounds=passwordHasher.rounds)
+        makeClient = lambda: InProcessClient(app)
+
+    result = runLoad(makeClient, args.users, args.threads, args.duration, args.mix, seed=args.seed)
+    result.update({
+        "commit": gitCommit(),
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "target": args.target,
+        "settings": {
+            "users": args.users, "quotes": args.quotes, "threads": args.threads, "duration": args.duration,
+            "mix": args.mix, "seed": args.seed, "bcryptRounds": args.bcrypt_rounds,
+        },
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+    })
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+    printReport(result, baseline)
+    print(f"Saved to {saveResult(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Seed a database with benchmark users and quotes
+
+    python -m benchmarks.seed --users 50 --quotes 200 [--mongo-uri mongodb://localhost:27017] [--seed 1]
+
+Every user is called bench<N>@example.com and has the password benchmarkPassword.
+The same seed always produces the same library, so runs on different commits compare.
+"""
+import argparse
+import random
+import string
+from datetime import datetime, timezone
+
+import bcrypt
+
+from indexes import ensureIndexes
+from quoteUtils import characterSpamLimit, derivedFields
+
+benchmarkPassword = "benchmarkPassword"
+quotesLimit = 100 # Quota of a registered user, raised for seeded users so add/delete mixes can run
+
+# (mean, spread, max) characters per field: titles and names are short, quotes long tailed up to the spam limit
+fieldLengths = {
+    "bookSeries": (20, 10, 80),
+    "bookTitle": (25, 12, 120),
+    "characters": (25, 15, 200),
+    "quote": (180, 250, characterSpamLimit),
+    "author": (16, 6, 60),
+}
+
+# Vocabulary the fields are made of, the same on every run
+_vocabularyRng = random.Random(0)
+words = ["".join(_vocabularyRng.choices(string.ascii_lowercase, k=_vocabularyRng.randint(2, 10))) for _ in range(2000)]
+
+
+def benchmarkEmail(index):
+    return f"bench{index}@example.com"
+
+
+def randomText(rng, mean, spread, maxLength):
+    """Words picked at random, about mean characters long (normal distribution, at least 1 and at most maxLength)"""
+    length = max(1, min(maxLength, int(rng.gauss(mean, spread))))
+    text = ""
+    while len(text) < length:
+        text += rng.choice(words) + " "
+    return text[:length].strip() or "x"
+
+
+def randomQuote(rng, userEmail):
+    """Quote document with realistic field lengths, as addQuote stores it"""
+    quote = {field: randomText(rng, *lengths) for field, lengths in fieldLengths.items()}
+    quote.update({
+        "userEmail": userEmail,
+        "createdAt": datetime.now(timezone.utc),
+        "updatedAt": datetime.now(timezone.utc),
+    })
+    quote.update(derivedFields(quote))
+    return quote
+
+
+def seedDatabase(db, users, quotesPerUser, seed=1, rounds=12, batchSize=1000):
+    """Insert users and their quotes, replacing earlier benchmark users
+
+    Args:
+        db (Database): Database to seed (pymongo or mongomock)
+        users (int): Users to create
+        quotesPerUser (int): Quotes of every user
+        seed (int, optional): Random seed. Defaults to 1.
+        rounds (int, optional): bcrypt work factor of the shared password hash. Defaults to 12.
+        batchSize (int, optional): Quotes per insert_many. Defaults to 1000.
+
+    Returns:
+        list: Emails of the seeded users
+    """
+    rng = random.Random(seed)
+    ensureIndexes(db)
+    emails = [benchmarkEmail(index) for index in range(users)]
+    db["users"].delete_many({"email": {"$regex": r"^bench\d+@example\.com$"}})
+    db["quotes"].delete_many({"userEmail": {"$regex": r"^bench\d+@example\.com$"}})
+
+    # One hash for everybody: hashing is what the login route is measured on, not the seeding
+    hashedPassword = bcrypt.hashpw(benchmarkPassword.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+    now = datetime.now(timezone.utc)
+    db["users"].insert_many([
+        {
+            "email": email,
+            "password": hashedPassword,
+            "quotesRemaining": quotesLimit + quotesPerUser,
+            "totalQuotes": quotesLimit + quotesPerUser * 2,
+            "libraryVersion": 0,
+            "createdAt": now,
+            "updatedAt": now,
+            "lastLogin": now,
+        }
+        for email in emails
+    ])
+
+    batch = []
+    for email in emails:
+        for _ in range(quotesPerUser):
+            batch.append(randomQuote(rng, email))
+            if len(batch) >= batchSize:
+                db["quotes"].insert_many(batch, ordered=False)
+                batch = []
+    if batch:
+        db["quotes"].insert_many(batch, ordered=False)
+    return emails
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed benchmark users and quotes")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--quotes", type=int, default=200, help="quotes per user")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt work factor of the seeded password")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="quote-base")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    db = MongoClient(args.mongo_uri)[args.database]
+    seedDatabase(db, args.users, args.quotes, seed=args.seed, rounds=args.rounds)
+    print(f"Seeded {args.users} users with {args.quotes} quotes each in {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread safe in-process cache evicting the least recently used entry past maxEntries
+
+    Entries also expire ttl seconds after they were stored.
+    """
+
+    def __init__(self, maxEntries=256, ttl=300):
+        """
+        Args:
+            maxEntries (int, optional): Entries kept before evicting. Defaults to 256.
+            ttl (int, optional): Seconds an entry stays valid. Defaults to 300.
+        """
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expiresAt, value), most recently used last
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        """Value stored under key, counted as a hit or a miss
+
+        Args:
+            key (Hashable): Cache key
+
+        Returns:
+            Any: Stored value, None if missing or expired
+        """
+        with self._lock:
+            value = self._lookup(key)
+            self._stats["hits" if value is not None else "misses"] += 1
+            return value
+
+    def peek(self, key):
+        """Same as get, without touching the counters or the recency order
+
+        Args:
+            key (Hashable): Cache key
+
+        Returns:
+            Any: Stored value, None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if the cache is full
+
+        Args:
+            key (Hashable): Cache key
+            value (Any): Value to store (None is not a valid value)
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def update(self, key, change):
+        """Replace a stored value with change(value), atomically and keeping its expiry time
+
+        Missing or expired entries are left alone, the next get reads the source again.
+
+        Args:
+            key (Hashable): Cache key
+            change (Callable): New value from the stored one
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return
+            self._entries[key] = (entry[0], change(entry[1]))
+
+    def delete(self, key):
+        """Drop the entry stored under key, if any
+
+        Args:
+            key (Hashable): Cache key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters since start
+
+        Returns:
+            dict: hits, misses, evictions, expirations, entries and hitRatio
+        """
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                hitRatio=self._stats["hits"] / lookups if lookups else None,
+            )
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self._stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+
+class QuoteListCache:
+    """Serialized quote lists per user, tagged with the library version they were read at
+
+    A cached list is only served for the version it was stored with, so a process never
+    returns a list older than the library: versions are bumped by every add/edit/delete
+    (see libraryVersion in app.py), whichever process handled it.
+
+    It serves the full-list responses of mutations made without ?delta=1 (API clients and
+    scripts; the web page always asks for deltas). Mutations patch the cached list in place
+    (see applyChange), so successive changes do not each read the whole library again.
+    """
+
+    def __init__(self, local):
+        """
+        Args:
+            local (LRUCache): In-process cache
+        """
+        self.local = local
+
+    def get(self, userEmail, version):
+        """Quote list of a user, if cached for the given library version
+
+        Args:
+            userEmail (str): Owner of the quotes
+            version (int): Current library version of the user
+
+        Returns:
+            list | None: Serialized quotes
+        """
+        entry = self.local.get(userEmail)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def set(self, userEmail, version, quotes):
+        """Store the quote list of a user read at the given library version
+
+        Args:
+            userEmail (str): Owner of the quotes
+            version (int): Library version the quotes were read at
+            quotes (list): Serialized quotes
+        """
+        self.local.set(userEmail, (version, quotes))
+
+    def applyChange(self, userEmail, version, quote=None, deletedId=None):
+        """Update a cached list after a mutation instead of dropping it
+
+        The change is only applied on top of the version right before it, otherwise some
+        other change is missing from the cached list and the entry is invalidated.
+
+        Args:
+            userEmail (str): Owner of the quotes
+            version (int | None): Library version after the change
+            quote (dict, optional): Added or edited quote, serialized. Defaults to None.
+            deletedId (str, optional): _id of the deleted quote. Defaults to None.
+        """
+        entry = self.local.peek(userEmail)
+        if entry is None or version is None or entry[0] != version - 1:
+            self.invalidate(userEmail)
+            return
+
+        # Build a new list, readers may still be iterating over the cached one
+        changedId = deletedId if deletedId is not None else quote["_id"]
+        quotes = [cached for cached in entry[1] if cached["_id"] != changedId]
+        if quote is not None:
+            replaced = len(quotes) != len(entry[1])
+            if replaced:
+                quotes = [quote if cached["_id"] == changedId else cached for cached in entry[1]] # Keep the position
+            else:
+                quotes.append(quote)
+        self.set(userEmail, version, quotes)
+
+    def invalidate(self, userEmail):
+        """Forget the cached list of a user
+
+        Args:
+            userEmail (str): Owner of the quotes
+        """
+        self.local.delete(userEmail)
+
+    def stats(self):
+        return self.local.stats()
+
+
+class UserProfileCache:
+    """Quota fields of users, and whether they exist, kept for a few seconds
+
+    For reads only (quota display, existence checks): the quota itself is always enforced by
+    conditional updates in MongoDB (see quota.py). Quota changes made by this process are applied
+    to the cached profile in place; changes made by other processes show after at most ttl seconds.
+    """
+
+    # Fields of the user document kept in a profile
+    fields = ("quotesRemaining", "totalQuotes")
+
+    def __init__(self, local):
+        """
+        Args:
+            local (LRUCache): In-process cache, with a short ttl
+        """
+        self.local = local
+
+    def get(self, userCollection, userEmail):
+        """Profile of a user, from MongoDB if not cached
+
+        Args:
+            userCollection (Collection): Users collection
+            userEmail (str): Email of the user
+
+        Returns:
+            dict | None: quotesRemaining and totalQuotes, None if the user does not exist
+        """
+        profile = self.local.get(userEmail)
+        if profile is None:
+            user = userCollection.find_one({"email": userEmail}, {"_id": 0, **{field: 1 for field in self.fields}})
+            profile = self.prime(userEmail, user)
+        return profile if profile["exists"] else None
+
+    def exists(self, userCollection, userEmail):
+        return self.get(userCollection, userEmail) is not None
+
+    def prime(self, userEmail, user):
+        """Cache a user document read or written anyway (login, registration)
+
+        Args:
+            userEmail (str): Email of the user
+            user (dict | None): User document, None if there is no such user
+
+        Returns:
+            dict: The cached profile
+        """
+        profile = {"exists": user is not None, **{field: user.get(field) for field in self.fields if user}}
+        self.local.set(userEmail, profile)
+        return profile
+
+    def applyIncrement(self, userEmail, **changes):
+        """Apply an $inc made to a user document to the cached profile, if there is one
+
+        Args:
+            userEmail (str): Email of the user
+            **changes (int): Increment per field (e.g. quotesRemaining=-1)
+        """
+        def increment(profile):
+            if not profile["exists"]:
+                return profile
+            return {**profile, **{field: (profile.get(field) or 0) + change for field, change in changes.items()}}
+        self.local.update(userEmail, increment)
+
+    def invalidate(self, userEmail):
+        """Forget the profile of a user, after changes not applied in place
+
+        Args:
+            userEmail (str): Email of the user
+        """
+        self.local.delete(userEmail)
+
+    def stats(self):
+        return self.local.stats()
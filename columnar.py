@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+
+from quoteUtils import quoteFields
+
+# Media type of the columnar encoding, asked for with the Accept header
+columnarMimetype = "application/vnd.quotebase.columnar+json"
+
+# Columns sent in this order
+columnarFields = ("_id",) + quoteFields + ("createdAt", "updatedAt")
+# Columns whose values repeat across quotes (same author, same book), sent once in a dictionary
+dictionaryFields = ("bookSeries", "bookTitle", "characters", "author")
+# Columns sent as milliseconds since the epoch instead of date strings
+timestampFields = ("createdAt", "updatedAt")
+
+
+def wantsColumnar(request):
+    """Whether the client prefers the columnar encoding over plain JSON
+
+    Args:
+        request (Request): Current request
+
+    Returns:
+        bool: True if the Accept header ranks columnarMimetype first
+    """
+    return request.accept_mimetypes.best_match(["application/json", columnarMimetype]) == columnarMimetype
+
+
+def encodeColumnar(quotes):
+    """Encode a list of serialized quotes column by column
+
+    {
+        "count": 2,
+        "fields": ["_id", "bookSeries", ...],
+        "columns": {"_id": ["...", "..."], "author": [0, 0], "createdAt": [1735689600000, ...], ...},
+        "dictionaries": {"author": ["Tolkien"], ...},
+        "timestamps": ["createdAt", "updatedAt"]
+    }
+
+    Dictionary columns hold indexes into their dictionary, missing values are null everywhere.
+
+    Args:
+        quotes (list): Serialized quotes (see serializeQuote)
+
+    Returns:
+        dict: Columnar payload
+    """
+    columns = {field: [] for field in columnarFields}
+    dictionaries = {field: [] for field in dictionaryFields}
+    positions = {field: {} for field in dictionaryFields}
+    for quote in quotes:
+        for field in columnarFields:
+            value = quote.get(field)
+            if value is not None and field in positions:
+                index = positions[field].get(value)
+                if index is None:
+                    index = positions[field][value] = len(dictionaries[field])
+                    dictionaries[field].append(value)
+                value = index
+            elif value is not None and field in timestampFields:
+                value = epochMilliseconds(value)
+            columns[field].append(value)
+    return {
+        "count": len(quotes),
+        "fields": list(columnarFields),
+        "columns": columns,
+        "dictionaries": dictionaries,
+        "timestamps": list(timestampFields),
+    }
+
+
+def decodeColumnar(payload):
+    """Back to a list of quote dicts (timestamps stay in milliseconds), mirrors decodeColumnar in script.js
+
+    Args:
+        payload (dict): Columnar payload
+
+    Returns:
+        list: Quotes
+    """
+    columns = payload["columns"]
+    dictionaries = payload["dictionaries"]
+    quotes = []
+    for row in range(payload["count"]):
+        quote = {}
+        for field in payload["fields"]:
+            value = columns[field][row]
+            if value is not None and field in dictionaries:
+                value = dictionaries[field][value]
+            quote[field] = value
+        quotes.append(quote)
+    return quotes
+
+
+def epochMilliseconds(value):
+    # MongoDB returns naive datetimes in UTC
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    return value
@@ -0,0 +1,110 @@
+import zlib
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing (images and gzip downloads already are compressed)
+compressibleTypes = (
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript",
+    "application/json", "application/vnd.quotebase.columnar+json", "application/javascript",
+    "application/x-ndjson", "image/svg+xml",
+)
+
+
+def availableEncodings():
+    """Encodings this process can produce, preferred first
+
+    Returns:
+        list: "br" when the brotli package is installed, then "gzip"
+    """
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compressResponse(response, request, minSize=500, level=6, brotliQuality=5, exemptPaths=()):
+    """Compress a response body with the best encoding the client accepts
+
+    Bodies already encoded, file responses (send_file), small bodies and exempt paths are left as
+    they are. Streamed bodies are compressed chunk by chunk, flushing after each one so the client
+    still gets every chunk as soon as it is produced.
+
+    Args:
+        response (Response): Response about to be sent
+        request (Request): Request it answers
+        minSize (int, optional): Bodies smaller than this many bytes are sent as is. Defaults to 500.
+        level (int, optional): gzip level, 1 (fast) to 9 (small). Defaults to 6.
+        brotliQuality (int, optional): brotli quality, 0 to 11. Defaults to 5.
+        exemptPaths (tuple, optional): Paths never compressed. Defaults to ().
+
+    Returns:
+        Response: The same response, compressed or not
+    """
+    if (
+        response.status_code < 200 or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.direct_passthrough
+        or response.mimetype not in compressibleTypes
+        or request.path in exemptPaths
+    ):
+        return response
+    if not response.is_streamed and (response.content_length or 0) < minSize:
+        return response
+
+    # Caches must keep one copy per encoding, whichever this client gets
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(availableEncodings())
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compressChunks(response.response, encoding, level, brotliQuality)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(compressBytes(response.get_data(), encoding, level, brotliQuality))
+    response.headers["Content-Encoding"] = encoding
+
+    # The compressed body is a different representation: keep the validator but make it weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compressBytes(data, encoding, level=6, brotliQuality=5):
+    if encoding == "br":
+        return brotli.compress(data, quality=brotliQuality)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits 31: gzip header and trailer
+    return compressor.compress(data) + compressor.flush()
+
+
+def compressChunks(chunks, encoding, level=6, brotliQuality=5):
+    """Compress a streamed body
+
+    Args:
+        chunks (Iterable): str or bytes chunks of the body
+        encoding (str): br or gzip
+        level (int, optional): gzip level. Defaults to 6.
+        brotliQuality (int, optional): brotli quality. Defaults to 5.
+
+    Yields:
+        bytes: Compressed chunks
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=brotliQuality)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            compressed = compress(chunk) + flush()
+            if compressed:
+                yield compressed
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close() # Let the source generator release its cursor when the client goes away
@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+from metrics import MetricFamily
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters, fed by pymongo pool events
+
+    A growing checkout wait with every connection in use means the pool is too small
+    for the threads of the process (pool starvation), before it shows up as latency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkoutStarted = threading.local() # Checkouts happen on the requesting thread
+        self._stats = {
+            "open": 0, "inUse": 0, "maxInUse": 0, "checkouts": 0, "checkoutFailures": 0,
+            "waitSeconds": 0.0, "maxWaitSeconds": 0.0, "cleared": 0,
+        }
+
+    def stats(self):
+        """Snapshot of the counters
+
+        Returns:
+            dict: Open and in use connections, checkouts, failed checkouts, total/max seconds waited for a connection
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def connection_check_out_started(self, event):
+        self._checkoutStarted.at = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._checkoutStarted, "at", time.perf_counter())
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["inUse"] += 1
+            self._stats["maxInUse"] = max(self._stats["maxInUse"], self._stats["inUse"])
+            self._stats["waitSeconds"] += waited
+            self._stats["maxWaitSeconds"] = max(self._stats["maxWaitSeconds"], waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._stats["checkoutFailures"] += 1 # event.reason: timeout, connectionError or poolClosed
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._stats["inUse"] -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self._stats["open"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._stats["open"] -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._stats["cleared"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+class CommandStats(monitoring.CommandListener):
+    """Duration histogram and failures of the database commands sent, per collection and command"""
+
+    def __init__(self):
+        self._collections = {} # request id -> collection, from started to succeeded/failed
+        self.durations = MetricFamily(
+            "quotebase_mongo_command_duration_seconds", "Time MongoDB commands took, as seen by the driver.",
+            "histogram", ("collection", "command")
+        )
+        self.failures = MetricFamily(
+            "quotebase_mongo_command_failures_total", "MongoDB commands that failed.",
+            "counter", ("collection", "command")
+        )
+
+    def stats(self):
+        """Snapshot of the counters
+
+        Returns:
+            dict: "collection.command" -> {"count", "failures", "seconds"}
+        """
+        failures = dict(self.failures.items())
+        stats = {}
+        for (collection, command), histogram in self.durations.items():
+            _, seconds, count = histogram.snapshot()
+            stats[f"{collection}.{command}"] = {
+                "count": count, "failures": failures.get((collection, command), 0), "seconds": seconds
+            }
+        return stats
+
+    def started(self, event):
+        # The collection is the value of the command name key ({"find": "quotes"}), except for getMore
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        self.durations.observe(event.duration_micros / 1_000_000, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        self.durations.observe(event.duration_micros / 1_000_000, collection, event.command_name)
+        self.failures.inc(collection, event.command_name)
+
+
+def clientOptions(environ=os.environ):
+    """MongoClient pool and timeout options, from the environment
+
+    Args:
+        environ (dict, optional): Environment to read. Defaults to os.environ.
+
+    Returns:
+        dict: Keyword arguments for MongoClient, unset values are left to the pymongo defaults
+    """
+    names = {
+        "MONGO_MAX_POOL_SIZE": "maxPoolSize", # Connections per process, at most (pymongo default 100)
+        "MONGO_MIN_POOL_SIZE": "minPoolSize", # Connections kept open even when idle
+        "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS", # Idle connections are closed after this
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS", # Wait for a free connection before failing
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS", # Wait for a usable server
+        "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+        "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS", # Wait for a reply to a single operation
+    }
+    return {option: int(environ[name]) for name, option in names.items() if environ.get(name)}
+
+
+class MongoConnection:
+    """One MongoClient per process, created on first use
+
+    MongoClient is not fork safe: a client created before a pre-forking server (gunicorn)
+    starts its workers would share sockets and monitor threads with them. The client is
+    only created when a process first needs it, and again if the process id changed.
+    """
+
+    def __init__(self, uri=None, options=None, clientFactory=None):
+        """
+        Args:
+            uri (str, optional): MongoDB connection string. Defaults to None (localhost).
+            options (dict, optional): MongoClient options, see clientOptions. Defaults to None.
+            clientFactory (callable, optional): Builds the client from (uri, **options). Defaults to pymongo.MongoClient.
+        """
+        self.uri = uri
+        self.options = options or {}
+        self.clientFactory = clientFactory
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.poolStats = PoolStats()
+        self.commandStats = CommandStats()
+
+    @property
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    # Fresh counters and client in every process; the parent's client is left alone
+                    self.poolStats = PoolStats()
+                    self.commandStats = CommandStats()
+                    factory = self.clientFactory
+                    if factory is None:
+                        from pymongo import MongoClient
+                        factory = MongoClient
+                    self._client = factory(
+                        self.uri, event_listeners=[self.poolStats, self.commandStats], **self.options
+                    )
+                    self._pid = os.getpid()
+        return self._client
+
+    def database(self, name):
+        """Database handle resolving to the client of the current process on every use
+
+        Args:
+            name (str): Database name
+
+        Returns:
+            LazyDatabase: Can be used like a pymongo Database
+        """
+        return LazyDatabase(self, name)
+
+    def stats(self):
+        """Pool and command counters of this process
+
+        Returns:
+            dict: pid, options, pool and commands
+        """
+        return {
+            "pid": self._pid,
+            "options": self.options,
+            "pool": self.poolStats.stats(),
+            "commands": self.commandStats.stats(),
+        }
+
+
+class LazyDatabase:
+    """Stands in for a pymongo Database, going through MongoConnection.client on every access"""
+
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+
+    def __getitem__(self, collectionName):
+        return self._connection.client[self._name][collectionName]
+
+    def __getattr__(self, attribute):
+        return getattr(self._connection.client[self._name], attribute)
@@ -0,0 +1,48 @@
+# Production server settings, read by: gunicorn -c gunicorn.conf.py app:app
+# Every value can be overridden from the environment (.env is not read here, set them on the container)
+import multiprocessing
+import os
+import tempfile
+
+from metrics import clearMultiprocessDirectory
+
+# Address to listen on
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# Worker processes: each one has its own quote list cache, password pool and MongoDB connection pool.
+# Threads per worker: requests mostly wait on MongoDB and bcrypt (which releases the GIL), so a few
+# threads per process keep the CPUs busy without the memory cost of more processes.
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("WEB_THREADS", 4))
+worker_class = "gthread"
+
+# Seconds an idle keep-alive connection is held open (put it above the load balancer idle timeout)
+keepalive = int(os.getenv("WEB_KEEPALIVE", 5))
+# Seconds a worker may stay silent before it is killed and replaced
+timeout = int(os.getenv("WEB_TIMEOUT", 30))
+# Seconds workers get to finish their requests on a reload (kill -HUP) or shutdown (SIGTERM)
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", 30))
+
+# Recycle workers after this many requests (plus jitter so they do not all restart together), 0 disables
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", 0))
+
+# The app is imported in every worker, after the fork: MongoClient and the password pool must not be
+# shared between processes
+preload_app = False
+# Restart workers when the code changes, for development only
+reload = os.getenv("WEB_RELOAD", "0") == "1"
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-") # "-": stdout
+errorlog = "-"
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")
+
+# Workers add up their metrics through files in this directory, so /metrics covers the whole server
+# whichever worker answers the scrape (see MultiprocessMetrics in metrics.py). Set before the fork,
+# the workers inherit it.
+metricsDir = os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "quotebase-metrics"))
+
+def on_starting(server):
+    # Counters start from zero with the server, not from the previous run's files
+    os.makedirs(metricsDir, exist_ok=True)
+    clearMultiprocessDirectory(metricsDir)
@@ -0,0 +1,129 @@
+from pymongo.errors import OperationFailure
+
+from quoteUtils import quoteListIndexes, sortCollation
+from suggestions import suggestionIndexes
+from sync import syncIndex, tombstoneRetention
+
+
+def indexName(keys):
+    """Default MongoDB name of an index (e.g. email_1, userEmail_1_author_1__id_1)
+
+    Args:
+        keys (list): [(field, direction), ...]
+
+    Returns:
+        str: Index name
+    """
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def indexSpec(keys, **options):
+    return {"name": indexName(keys), "keys": keys, "options": options}
+
+
+# Indexes the app relies on, per collection
+requiredIndexes = {
+    "users": [
+        # Login, registration and every per-user lookup; also guarantees one account per email
+        indexSpec([("email", 1)], unique=True),
+    ],
+    "quotes": [
+        # Listing, filtering and keyset paging of a user's quotes (GET /quotes)
+        *[indexSpec(keys, collation=sortCollation) for keys in quoteListIndexes],
+        # Duplicate detection: inserts and edits colliding on the content fingerprint are rejected by the server.
+        # Partial so that legacy quotes still waiting for their fingerprint do not collide on null.
+        indexSpec(
+            [("userEmail", 1), ("fingerprint", 1)],
+            unique=True,
+            partialFilterExpression={"fingerprint": {"$exists": True}}
+        ),
+        # Inverted index of GET /quotes/search (multikey over the "field:word" terms)
+        indexSpec([("userEmail", 1), ("searchTerms", 1)]),
+        # Change feed of GET /quotes/changes (quotes stored before it existed have no syncVersion)
+        indexSpec(syncIndex, partialFilterExpression={"syncVersion": {"$exists": True}}),
+    ],
+    "suggestions": [
+        # One count per distinct value of a field of a user, updated by every quote change
+        indexSpec(suggestionIndexes[0], unique=True),
+        # Prefix lookups of GET /quotes/suggest
+        indexSpec(suggestionIndexes[1]),
+    ],
+    "tombstones": [
+        # Deleted quotes listed by GET /quotes/changes
+        indexSpec(syncIndex),
+        # Tombstones expire after the retention window
+        indexSpec([("deletedAt", 1)], expireAfterSeconds=int(tombstoneRetention.total_seconds())),
+    ],
+}
+
+
+def findDrift(spec, existing):
+    """Compare a required index with the one found on the server
+
+    Args:
+        spec (dict): Entry of requiredIndexes
+        existing (dict): Entry of collection.index_information()
+
+    Returns:
+        list: Human readable differences, empty if the index is as declared
+    """
+    differences = []
+    if [tuple(key) for key in existing["key"]] != [tuple(key) for key in spec["keys"]]:
+        differences.append(f"keys are {existing['key']}")
+    for option, expected in spec["options"].items():
+        found = existing.get(option)
+        if option == "collation" and found is not None:
+            # The server fills in every collation default, only compare what we declared
+            found = {key: found.get(key) for key in expected}
+        if found is not None and found != expected:
+            differences.append(f"{option} is {found}, expected {expected}")
+        elif found is None:
+            differences.append(f"{option} is missing")
+    return differences
+
+
+def ensureIndexes(db, specs=requiredIndexes):
+    """Create missing indexes and report the ones that differ from the declaration
+
+    Safe to run on every start: existing indexes are left untouched, drifted ones are
+    reported but never dropped, that decision is left to a human.
+
+    Args:
+        db (Database): Database to check
+        specs (dict, optional): Required indexes per collection. Defaults to requiredIndexes.
+
+    Returns:
+        dict: {"created": [...], "drifted": [...], "unmanaged": [...]} as "collection.indexName" strings
+    """
+    report = {"created": [], "drifted": [], "unmanaged": []}
+    for collectionName, collectionSpecs in specs.items():
+        collection = db[collectionName]
+        existingIndexes = collection.index_information()
+
+        for spec in collectionSpecs:
+            label = f"{collectionName}.{spec['name']}"
+            existing = existingIndexes.get(spec["name"])
+            if existing is None:
+                try:
+                    collection.create_index(spec["keys"], name=spec["name"], **spec["options"])
+                    report["created"].append(label)
+                except OperationFailure as e:
+                    # Typically the same keys exist under another name or with other options
+                    print(f"Could not create index {label}: {str(e)}")
+                    report["drifted"].append(label)
+                continue
+
+            differences = findDrift(spec, existing)
+            if differences:
+                print(f"Index {label} differs from its declaration: {', '.join(differences)}")
+                report["drifted"].append(label)
+
+        # Indexes nobody declared (left over from older versions or created by hand)
+        declaredNames = {spec["name"] for spec in collectionSpecs} | {"_id_"}
+        report["unmanaged"] += [f"{collectionName}.{name}" for name in existingIndexes if name not in declaredNames]
+
+    if report["created"]:
+        print(f"Created indexes: {', '.join(report['created'])}")
+    if report["unmanaged"]:
+        print(f"Indexes not declared in indexes.py: {', '.join(report['unmanaged'])}")
+    return report
@@ -0,0 +1,283 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+# Latency buckets in seconds (upper bounds), from cache hits to slow bulk imports
+defaultBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Thread safe histogram with fixed buckets; observe() is a bisect and three increments"""
+
+    def __init__(self, buckets=defaultBuckets):
+        """
+        Args:
+            buckets (tuple, optional): Sorted upper bounds. Defaults to defaultBuckets.
+        """
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # Last one is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """Cumulative bucket counts, as exposed to Prometheus
+
+        Returns:
+            tuple: ([(upper bound, count of values <= bound)], sum, count)
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        return self._cumulate(counts), total, sum(counts)
+
+    def state(self):
+        """Raw bucket counts and sum, for another process to merge
+
+        Returns:
+            tuple: ([count per bucket, +Inf last], sum)
+        """
+        with self._lock:
+            return list(self._counts), self._sum
+
+    def merge(self, counts, total):
+        with self._lock:
+            self._counts = [mine + theirs for mine, theirs in zip(self._counts, counts)]
+            self._sum += total
+
+    def _cumulate(self, counts):
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative
+
+
+class MetricFamily:
+    """Counters or histograms of one metric, one per combination of label values"""
+
+    def __init__(self, name, help, kind, labelNames, buckets=defaultBuckets):
+        """
+        Args:
+            name (str): Metric name
+            help (str): Description shown by Prometheus
+            kind (str): counter or histogram
+            labelNames (tuple): Label names, values are passed in the same order
+            buckets (tuple, optional): Histogram buckets. Defaults to defaultBuckets.
+        """
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelNames = tuple(labelNames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelValues, amount=1):
+        with self._lock:
+            self._children[labelValues] = self._children.get(labelValues, 0) + amount
+
+    def observe(self, value, *labelValues):
+        histogram = self._children.get(labelValues)
+        if histogram is None:
+            with self._lock:
+                histogram = self._children.setdefault(labelValues, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def state(self):
+        """Children as plain values, for another process to merge (see MultiprocessMetrics)
+
+        Returns:
+            list: [label values, count or (bucket counts, sum)]
+        """
+        return [
+            [list(labelValues), child if self.kind == "counter" else child.state()]
+            for labelValues, child in self.items()
+        ]
+
+    def merge(self, state):
+        """Add the children of another process to these
+
+        Args:
+            state (list): Output of state() in the other process
+        """
+        for labelValues, value in state:
+            labelValues = tuple(labelValues)
+            if self.kind == "counter":
+                self.inc(*labelValues, amount=value)
+                continue
+            with self._lock:
+                histogram = self._children.setdefault(labelValues, Histogram(self.buckets))
+            histogram.merge(*value)
+
+    def emptyCopy(self):
+        return MetricFamily(self.name, self.help, self.kind, self.labelNames, self.buckets)
+
+    def items(self):
+        """Current children
+
+        Returns:
+            list: (label values, count or Histogram)
+        """
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        """Prometheus text exposition lines of this metric
+
+        Returns:
+            list: Lines, without trailing newlines
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labelValues, child in sorted(self.items(), key=lambda item: item[0]):
+            labels = list(zip(self.labelNames, labelValues))
+            if self.kind == "counter":
+                lines.append(f"{self.name}{formatLabels(labels)} {formatValue(child)}")
+                continue
+            cumulative, total, count = child.snapshot()
+            for bound, bucketCount in cumulative:
+                lines.append(f"{self.name}_bucket{formatLabels(labels + [('le', formatValue(bound))])} {bucketCount}")
+            lines.append(f"{self.name}_sum{formatLabels(labels)} {formatValue(total)}")
+            lines.append(f"{self.name}_count{formatLabels(labels)} {count}")
+        return lines
+
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    # Label values escape backslash, double quote and line feed
+    escaped = (
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def formatValue(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def renderMetrics(families):
+    """Prometheus text format (version 0.0.4) of several metrics
+
+    Args:
+        families (Iterable): MetricFamily objects
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+    for family in families:
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+class MultiprocessMetrics:
+    """Metrics of every worker process, summed at scrape time
+
+    Each worker writes the state of its metrics to its own file in a directory shared by the
+    workers (on every scrape it serves, every flushInterval seconds and at exit). A scrape
+    reads all the files and adds them up, so whichever worker answers, the counters cover
+    the whole server and never go backwards. Files of workers that exited are kept, as
+    their requests still count; the directory is emptied when the server starts (see
+    gunicorn.conf.py).
+    """
+
+    def __init__(self, directory, families, flushInterval=5):
+        """
+        Args:
+            directory (str): Directory shared by the workers
+            families (callable): Returns the MetricFamily objects of this process, called on every write
+            flushInterval (int, optional): Seconds between two writes of this process. Defaults to 5.
+        """
+        self.directory = directory
+        self.families = families
+        self.flushInterval = flushInterval
+        self._pid = None # Process the flushing thread runs in
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Write this process's file periodically, from the process that serves requests (after the fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._flushPeriodically, daemon=True).start()
+            atexit.register(self.write)
+
+    def write(self):
+        """Write the state of this process's metrics to its file, replacing it atomically"""
+        state = {family.name: family.state() for family in self.families()}
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as stateFile:
+            json.dump(state, stateFile)
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Metrics summed over every worker that wrote a file, this one up to date
+
+        Returns:
+            list: MetricFamily objects holding the sums, in the order of families
+        """
+        self.write()
+        families = self.families()
+        merged = {family.name: family.emptyCopy() for family in families}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as stateFile:
+                    state = json.load(stateFile)
+            except (OSError, ValueError):
+                continue # Removed or being replaced by its worker
+            for name, familyState in state.items():
+                if name in merged:
+                    merged[name].merge(familyState)
+        return [merged[family.name] for family in families]
+
+    def _flushPeriodically(self):
+        while True:
+            time.sleep(self.flushInterval)
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Error writing metrics: {str(e)}")
+
+
+def clearMultiprocessDirectory(directory):
+    """Remove the files of a previous server run, before the workers start
+
+    Args:
+        directory (str): Directory shared by the workers
+    """
+    for path in glob.glob(os.path.join(directory, "*.json*")):
+        os.remove(path)
+
+
+# HTTP requests, labelled with the route pattern (/edit-quote/<quoteId>) so ids do not multiply the series
+requestDuration = MetricFamily(
+    "quotebase_http_request_duration_seconds", "Time spent in the route until the response is returned.",
+    "histogram", ("method", "route")
+)
+requestsTotal = MetricFamily(
+    "quotebase_http_requests_total", "Requests served, by response status.",
+    "counter", ("method", "route", "status")
+)
+requestErrorsTotal = MetricFamily(
+    "quotebase_http_request_errors_total", "Requests answered with a 5xx status.",
+    "counter", ("method", "route")
+)
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from metrics import MetricFamily
+
+
+class HasherBusy(Exception):
+    """Raised when the password pool already has as much work queued as it is allowed to"""
+
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a dedicated, size bounded thread pool
+
+    bcrypt releases the GIL while it works, so the pool caps how many CPU cores password
+    checks can take at once and leaves the request threads free for cheap routes. Work
+    beyond maxWorkers running plus queueLimit waiting is rejected with HasherBusy instead
+    of piling up.
+    """
+
+    def __init__(self, rounds=12, maxWorkers=None, queueLimit=32, timeout=10):
+        """
+        Args:
+            rounds (int, optional): bcrypt work factor of new hashes. Defaults to 12 (bcrypt.gensalt default).
+            maxWorkers (int, optional): Threads hashing in parallel. Defaults to the number of CPUs.
+            queueLimit (int, optional): Jobs allowed to wait for a thread. Defaults to 32.
+            timeout (int, optional): Seconds a request waits for its result. Defaults to 10.
+        """
+        self.rounds = rounds
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.queueLimit = queueLimit
+        self.timeout = timeout
+        self._slots = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._stats = {"completed": 0, "rejected": 0, "waitSeconds": 0.0, "runSeconds": 0.0, "maxWaitSeconds": 0.0}
+        # Same timings as histograms, for /metrics
+        self.durations = MetricFamily(
+            "quotebase_bcrypt_duration_seconds", "Time password jobs waited for a thread (wait) and ran (run).",
+            "histogram", ("operation", "phase"), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+        )
+        self.rejections = MetricFamily(
+            "quotebase_bcrypt_rejected_total", "Password jobs refused because the pool was full.", "counter", ()
+        )
+
+    def hash(self, password):
+        """Hash a password with the configured work factor
+
+        Args:
+            password (str): Plain text password
+
+        Returns:
+            str: bcrypt hash
+        """
+        hashed = self._run("hash", bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+        return hashed.decode("utf-8")
+
+    def verify(self, password, hashed):
+        """Check a password against a stored hash
+
+        Args:
+            password (str): Plain text password
+            hashed (str): Stored bcrypt hash
+
+        Returns:
+            bool: True if the password matches
+        """
+        return self._run("verify", bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def needsRehash(self, hashed):
+        """Whether a stored hash was made with another work factor than the configured one
+
+        Args:
+            hashed (str): Stored bcrypt hash ($2b$<rounds>$...)
+
+        Returns:
+            bool: True if the hash should be replaced
+        """
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self):
+        """Snapshot of the pool timings, to size maxWorkers and queueLimit
+
+        Returns:
+            dict: Completed and rejected jobs, total/max seconds waited for a thread and total seconds hashing
+        """
+        with self._lock:
+            return dict(self._stats, maxWorkers=self.maxWorkers, queueLimit=self.queueLimit, rounds=self.rounds)
+
+    def _getExecutor(self):
+        # Threads do not survive a fork: pre-forking servers get a fresh pool in every worker
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="bcrypt")
+                self._slots = threading.BoundedSemaphore(self.maxWorkers + self.queueLimit)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, operation, function, *args):
+        executor = self._getExecutor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            self.rejections.inc()
+            raise HasherBusy("Too many password operations in progress")
+
+        submittedAt = time.perf_counter()
+        timings = {}
+
+        def job():
+            timings["startedAt"] = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                timings["endedAt"] = time.perf_counter()
+
+        try:
+            future = executor.submit(job)
+        except Exception:
+            slots.release()
+            raise
+        # The slot is only given back once the job is done, even if the caller stopped waiting
+        future.add_done_callback(lambda _: slots.release())
+        result = future.result(timeout=self.timeout)
+
+        waited = timings["startedAt"] - submittedAt
+        ran = timings["endedAt"] - timings["startedAt"]
+        self.durations.observe(waited, operation, "wait")
+        self.durations.observe(ran, operation, "run")
+        with self._lock:
+            self._stats["completed"] += 1
+            self._stats["waitSeconds"] += waited
+            self._stats["maxWaitSeconds"] = max(self._stats["maxWaitSeconds"], waited)
+            self._stats["runSeconds"] += ran
+        return result
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+# Attempts at taking a partial reservation while other requests keep changing the quota
+maxReservationAttempts = 5
+
+
+def reserveQuota(userCollection, userEmail, count):
+    """Take up to count quotes from the remaining quota of a user, never going below zero
+
+    The whole amount is taken with a single conditional update when the quota allows it.
+    Otherwise whatever is left is taken with a compare-and-set on the remaining amount.
+    The library version is left alone: it is bumped once the inserts went through
+    (see bumpLibraryVersion), so a rejected insert does not look like a change.
+
+    Args:
+        userCollection (Collection): Users collection
+        userEmail (str): Owner of the quota
+        count (int): Quotes wanted
+
+    Returns:
+        int: Quotes granted, between 0 and count
+    """
+    user = userCollection.find_one_and_update(
+        {"email": userEmail, "quotesRemaining": {"$gte": count}},
+        {
+            "$inc": {"quotesRemaining": -count},
+            "$set": {"updatedAt": datetime.now(timezone.utc)}
+        },
+        projection={"_id": 1}
+    )
+    if user:
+        return count
+
+    # Not enough left for all of them: take what remains
+    for _ in range(maxReservationAttempts):
+        current = userCollection.find_one({"email": userEmail}, {"_id": 0, "quotesRemaining": 1})
+        remaining = current.get("quotesRemaining", 0) if current else 0
+        if remaining <= 0:
+            return 0
+        granted = min(count, remaining)
+        user = userCollection.find_one_and_update(
+            {"email": userEmail, "quotesRemaining": remaining}, # Only if nobody changed it in between
+            {
+                "$inc": {"quotesRemaining": -granted},
+                "$set": {"updatedAt": datetime.now(timezone.utc)}
+            },
+            projection={"_id": 1}
+        )
+        if user:
+            return granted
+    return 0
+
+
+def releaseQuota(userCollection, userEmail, count, bumpVersion=False):
+    """Give quotes back to the quota of a user (reserved but not inserted, or deleted)
+
+    Args:
+        userCollection (Collection): Users collection
+        userEmail (str): Owner of the quota
+        count (int): Quotes to give back
+        bumpVersion (bool, optional): Also bump the library version, when quotes were
+            removed from it. Defaults to False.
+
+    Returns:
+        int | None: Library version after the release if bumpVersion is set, None otherwise
+    """
+    if count <= 0 and not bumpVersion:
+        return None
+    update = {
+        "$inc": {"quotesRemaining": count},
+        "$set": {"updatedAt": datetime.now(timezone.utc)}
+    }
+    if not bumpVersion:
+        userCollection.update_one({"email": userEmail}, update)
+        return None
+    update["$inc"]["libraryVersion"] = 1
+    user = userCollection.find_one_and_update(
+        {"email": userEmail},
+        update,
+        projection={"libraryVersion": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return user["libraryVersion"] if user else None
+
+
+def bumpLibraryVersion(userCollection, userEmail):
+    """Bump the library version of a user, after quotes were written
+
+    Args:
+        userCollection (Collection): Users collection
+        userEmail (str): Owner of the library
+
+    Returns:
+        int | None: Library version after the bump, None if the user does not exist
+    """
+    user = userCollection.find_one_and_update(
+        {"email": userEmail},
+        {"$inc": {"libraryVersion": 1}},
+        projection={"libraryVersion": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return user["libraryVersion"] if user else None
@@ -0,0 +1,221 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from quota import releaseQuota, reserveQuota
+from quoteUtils import QuoteValidationError, cleanQuoteFields, derivedFields, quoteFields
+
+# Operations accepted in one POST /quotes/batch (filter operations may touch more quotes each)
+maxBatchOperations = 1000
+
+operationKinds = ("add", "edit", "delete", "updateWhere", "deleteWhere")
+
+
+class BatchError(ValueError):
+    """Raised when a batch request as a whole is not valid"""
+
+
+def parseOperations(data):
+    """Check the envelope of a batch request
+
+    Args:
+        data (dict): {"operations": [{"op": "add" | "edit" | "delete" | "updateWhere" | "deleteWhere", ...}]}
+
+    Raises:
+        BatchError: Not a list of operations or too many of them
+
+    Returns:
+        list: The operations
+    """
+    operations = data.get("operations") if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise BatchError("Send a non-empty list of operations.")
+    if len(operations) > maxBatchOperations:
+        raise BatchError(f"A batch can not hold more than {maxBatchOperations} operations.")
+    return operations
+
+
+def runBatch(quotesCollection, userCollection, userEmail, operations):
+    """Validate mixed add/edit/delete operations and run them as one unordered bulk_write
+
+    Operations:
+        {"op": "add", "quote": {...}}
+        {"op": "edit", "id": "...", "quote": {...}} (all fields, defaults like PUT /edit-quote)
+        {"op": "delete", "id": "..."}
+        {"op": "updateWhere", "where": {"author": "X"}, "set": {"author": "Y"}}
+        {"op": "deleteWhere", "where": {"bookTitle": "X"}}
+
+    A quote can only be changed by one operation of a batch: edit/delete operations
+    naming a quote already claimed fail, filter operations skip it. The quota is
+    reserved once for all adds and settled once afterwards (failed adds and deletes
+    credited), along with the library version bump that tells caches the library changed.
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        userCollection (Collection): Users collection
+        userEmail (str): Owner of the quotes
+        operations (list): Operations, see parseOperations
+
+    Returns:
+        tuple: (results, version) one result per operation, in order, and the library
+            version after the batch (None if nothing was written)
+    """
+    results = [None] * len(operations)
+    planned = [] # (operation index, kind, [(write, quote _id)])
+    claimed = set()
+    addedQuotes = {} # operation index -> new quote
+    now = datetime.now(timezone.utc)
+
+    # Quotes named by id, looked up in a single query
+    ids = {}
+    for index, operation in enumerate(operations):
+        if isinstance(operation, dict) and operation.get("op") in ("edit", "delete"):
+            try:
+                ids[index] = ObjectId(operation.get("id"))
+            except (InvalidId, TypeError):
+                results[index] = _error(index, "Quote not found or unauthorized")
+    existing = {
+        quote["_id"] for quote in quotesCollection.find(
+            {"_id": {"$in": list(ids.values())}, "userEmail": userEmail}, {"_id": 1}
+        )
+    } if ids else set()
+
+    for index, operation in enumerate(operations):
+        if results[index] is not None:
+            continue
+        kind = operation.get("op") if isinstance(operation, dict) else None
+        try:
+            if kind not in operationKinds:
+                raise QuoteValidationError(f"Unknown operation. Use one of: {', '.join(operationKinds)}.")
+
+            if kind == "add":
+                quote = {
+                    "_id": ObjectId(), # Set here so the result can name it
+                    "userEmail": userEmail,
+                    **cleanQuoteFields(operation.get("quote")), # Same rules as POST /add-quote
+                    "createdAt": now,
+                    "updatedAt": now,
+                }
+                quote.update(derivedFields(quote))
+                addedQuotes[index] = quote
+                planned.append((index, kind, [(InsertOne(quote), quote["_id"])]))
+                continue
+
+            if kind in ("edit", "delete"):
+                quoteId = ids[index]
+                if quoteId not in existing:
+                    raise QuoteValidationError("Quote not found or unauthorized")
+                if quoteId in claimed:
+                    raise QuoteValidationError("Quote is changed by another operation of this batch.")
+                if kind == "edit":
+                    fields = cleanQuoteFields(operation.get("quote"), fillDefaults=True)
+                    write = _updateQuote(quoteId, userEmail, fields, now)
+                else:
+                    write = DeleteOne({"_id": quoteId, "userEmail": userEmail})
+                claimed.add(quoteId)
+                planned.append((index, kind, [(write, quoteId)]))
+                continue
+
+            # Filter operations: resolve the matching quotes now, so each one gets its fingerprint recomputed
+            where = _cleanFieldMap(operation.get("where"), "where")
+            if kind == "updateWhere":
+                changes = _cleanFieldMap(operation.get("set"), "set")
+            writes = []
+            for quote in quotesCollection.find({"userEmail": userEmail, **where}, {field: 1 for field in quoteFields}):
+                if quote["_id"] in claimed:
+                    continue
+                if kind == "updateWhere":
+                    fields = cleanQuoteFields({**quote, **changes}, fillDefaults=True)
+                    writes.append((_updateQuote(quote["_id"], userEmail, fields, now), quote["_id"]))
+                else:
+                    writes.append((DeleteOne({"_id": quote["_id"], "userEmail": userEmail}), quote["_id"]))
+                claimed.add(quote["_id"])
+            planned.append((index, kind, writes))
+        except QuoteValidationError as e:
+            results[index] = _error(index, str(e))
+
+    # Duplicate adds are rejected before they take any quota, with one fingerprint lookup
+    fingerprints = [quote["fingerprint"] for quote in addedQuotes.values()]
+    seen = {
+        quote["fingerprint"] for quote in quotesCollection.find(
+            {"userEmail": userEmail, "fingerprint": {"$in": fingerprints}}, {"_id": 0, "fingerprint": 1}
+        )
+    } if fingerprints else set()
+    for index, quote in addedQuotes.items():
+        if quote["fingerprint"] in seen:
+            results[index] = _error(index, "Duplicate quote detected.")
+        seen.add(quote["fingerprint"])
+    planned = [entry for entry in planned if results[entry[0]] is None]
+
+    # One conditional quota reservation for every add, before anything is written:
+    # the deletes of the batch only credit the quota once they went through
+    adds = [entry for entry in planned if entry[1] == "add"]
+    reserved = 0
+    if adds:
+        reserved = reserveQuota(userCollection, userEmail, len(adds))
+        rejected = len(adds) - reserved
+        if rejected:
+            for index, _, _ in adds[-rejected:]:
+                results[index] = _error(index, "Quote limit reached. Upgrade to add more quotes.")
+            planned = [entry for entry in planned if results[entry[0]] is None]
+
+    writes = [write for _, _, entryWrites in planned for write, _ in entryWrites]
+    failures = {} # write index -> error message
+    inserted = deleted = modified = 0
+    if writes:
+        try:
+            result = quotesCollection.bulk_write(writes, ordered=False)
+            inserted, deleted, modified = result.inserted_count, result.deleted_count, result.modified_count
+        except BulkWriteError as e:
+            inserted, deleted, modified = e.details["nInserted"], e.details["nRemoved"], e.details["nModified"]
+            for writeError in e.details["writeErrors"]:
+                failures[writeError["index"]] = (
+                    "Duplicate quote detected." if writeError["code"] == 11000 else "Could not save quote."
+                )
+        except Exception:
+            releaseQuota(userCollection, userEmail, reserved) # e.g. AutoReconnect: give the adds' quota back, as addQuote does
+            raise
+
+    # Give back the reserved quota of the adds that failed and credit the deletes (never a negative $inc);
+    # the library version is only bumped if something changed
+    version = None
+    if inserted or deleted or modified:
+        version = releaseQuota(userCollection, userEmail, reserved + deleted - inserted, bumpVersion=True)
+    else:
+        releaseQuota(userCollection, userEmail, reserved)
+
+    writeIndex = 0
+    for index, kind, entryWrites in planned:
+        errors = [failures.get(writeIndex + offset) for offset in range(len(entryWrites))]
+        writeIndex += len(entryWrites)
+        if kind in ("updateWhere", "deleteWhere"):
+            failed = sum(1 for error in errors if error)
+            results[index] = {"index": index, "status": "ok", "matched": len(entryWrites), "failed": failed}
+        elif errors[0]:
+            results[index] = _error(index, errors[0])
+        else:
+            results[index] = {"index": index, "status": "ok", "id": str(entryWrites[0][1])}
+    return results, version
+
+
+def _error(index, message):
+    return {"index": index, "status": "error", "error": message}
+
+
+def _updateQuote(quoteId, userEmail, fields, now):
+    update = {**fields, "updatedAt": now}
+    update.update(derivedFields(fields)) # Fingerprint and search terms
+    return UpdateOne({"_id": quoteId, "userEmail": userEmail}, {"$set": update})
+
+
+def _cleanFieldMap(fieldMap, name):
+    # Field -> value map of a filter operation, restricted to the user editable fields
+    if not isinstance(fieldMap, dict) or not fieldMap:
+        raise QuoteValidationError(f"{name} must name at least one field.")
+    unknown = [field for field in fieldMap if field not in quoteFields]
+    if unknown:
+        raise QuoteValidationError(f"Unknown field in {name}: {', '.join(unknown)}.")
+    return {field: str(value).strip() if value is not None else "" for field, value in fieldMap.items()}
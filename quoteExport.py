@@ -0,0 +1,132 @@
+import csv
+import io
+import itertools
+import json
+import zlib
+from datetime import datetime
+
+from bson import ObjectId
+
+from quoteUtils import quoteFields, quoteProjection, sortCollation
+
+# Documents fetched from MongoDB per getMore
+exportBatchSize = 1000
+# Output is handed to the server in chunks of about this many characters, not one write per quote
+flushSize = 64 * 1024
+
+# Column order of CSV exports; the file can be imported back as is (extra columns are ignored)
+exportColumns = ("_id",) + quoteFields + ("createdAt", "updatedAt")
+# Spreadsheets run cells starting with these as formulas; such CSV cells get a leading ' (undone by the import)
+formulaPrefixes = ("=", "+", "-", "@", "\t", "\r")
+
+exportMimetypes = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "json": "application/json",
+}
+
+
+def exportCursor(quotesCollection, userEmail, batchSize=exportBatchSize):
+    """Cursor over all quotes of a user, in insertion order (served by the userEmail/_id index)
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        userEmail (str): Owner of the quotes
+        batchSize (int, optional): Documents per round trip. Defaults to exportBatchSize.
+
+    Returns:
+        Cursor: Quotes without their hidden fields
+    """
+    return quotesCollection.find(
+        {"userEmail": userEmail},
+        quoteProjection,
+        collation=sortCollation # The userEmail/_id index is built with it, without it the server sorts in memory
+    ).sort("_id", 1).batch_size(batchSize)
+
+
+def generateExport(quotes, exportFormat):
+    """Encode quotes one at a time, yielding the output in chunks
+
+    Args:
+        quotes (Iterable): Quote documents, typically a cursor
+        exportFormat (str): ndjson, csv or json
+
+    Yields:
+        str: Part of the exported file
+    """
+    encoders = {"ndjson": _encodeNdjson, "csv": _encodeCsv, "json": _encodeJsonArray}
+    buffer = []
+    size = 0
+    for part in encoders[exportFormat](quotes):
+        buffer.append(part)
+        size += len(part)
+        if size >= flushSize:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def gzipChunks(chunks, level=6):
+    """Compress a stream of text chunks into a gzip file, without holding the whole output
+
+    Args:
+        chunks (Iterable): str chunks
+        level (int, optional): zlib compression level. Defaults to 6.
+
+    Yields:
+        bytes: Part of the gzip file
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _jsonDefault(value):
+    # Types stored by the app that json can not encode
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encodeNdjson(quotes):
+    for quote in quotes:
+        yield json.dumps(quote, default=_jsonDefault, ensure_ascii=False) + "\n"
+
+
+def _encodeJsonArray(quotes):
+    separator = "[\n"
+    for quote in quotes:
+        yield separator + json.dumps(quote, default=_jsonDefault, ensure_ascii=False)
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
+
+
+def _encodeCsv(quotes):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    rows = (
+        [_csvValue(quote.get(column)) for column in exportColumns]
+        for quote in quotes
+    )
+    for row in itertools.chain([exportColumns], rows):
+        writer.writerow(row)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+
+def _csvValue(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, ObjectId)):
+        return _jsonDefault(value)
+    if isinstance(value, str) and value.startswith(formulaPrefixes):
+        return "'" + value # Shown as text instead of evaluated (CSV injection)
+    return value
@@ -0,0 +1,283 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+from pymongo.errors import BulkWriteError
+
+from quoteExport import formulaPrefixes
+from quota import bumpLibraryVersion, releaseQuota, reserveQuota
+from quoteUtils import QuoteValidationError, cleanQuoteFields, derivedFields
+from sync import stampQuotes
+
+# Quotes validated, checked for duplicates and inserted together
+importBatchSize = 500
+# Longest accepted NDJSON line / JSON array element (characters); 5 fields of characterSpamLimit fit easily
+maxRecordSize = 64 * 1024
+# Rows listed in the error report, the rest are only counted
+maxReportedErrors = 1000
+# Characters read from the upload at a time by the JSON array parser
+readChunkSize = 64 * 1024
+
+extensionFormats = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+mimeFormats = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+
+class ImportFormatError(ValueError):
+    """Raised when the format of an uploaded file can not be determined"""
+
+
+def detectFormat(requestedFormat=None, filename=None, mimetype=None):
+    """Pick the parser for an upload: explicit format first, then file extension, then content type
+
+    Args:
+        requestedFormat (str, optional): json, ndjson or csv. Defaults to None.
+        filename (str, optional): Name of the uploaded file. Defaults to None.
+        mimetype (str, optional): Content type of the upload. Defaults to None.
+
+    Raises:
+        ImportFormatError: No supported format found
+
+    Returns:
+        str: json, ndjson or csv
+    """
+    if requestedFormat:
+        if requestedFormat not in extensionFormats.values():
+            raise ImportFormatError("Unsupported format. Use json, ndjson or csv.")
+        return requestedFormat
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in extensionFormats:
+        return extensionFormats[extension]
+    if mimetype in mimeFormats:
+        return mimeFormats[mimetype]
+    raise ImportFormatError("Unsupported format. Use json, ndjson or csv.")
+
+
+def iterRecords(binaryStream, importFormat):
+    """Parse an upload one quote at a time
+
+    Args:
+        binaryStream (IO): Uploaded bytes, UTF-8 encoded (a BOM is allowed)
+        importFormat (str): json, ndjson or csv
+
+    Yields:
+        tuple: (row, record, error) row numbers start at 1, record is None when error is set
+    """
+    if not hasattr(binaryStream, "read1"):
+        binaryStream = io.BufferedReader(binaryStream) # TextIOWrapper needs a buffered stream
+    textStream = io.TextIOWrapper(binaryStream, encoding="utf-8-sig", newline="")
+    parsers = {"json": iterJsonArray, "ndjson": iterNdjson, "csv": iterCsv}
+    try:
+        yield from parsers[importFormat](textStream)
+    except UnicodeDecodeError:
+        yield 0, None, "File is not UTF-8 encoded."
+
+
+def iterNdjson(textStream):
+    row = 0
+    while True:
+        line = textStream.readline(maxRecordSize + 1)
+        if not line:
+            return
+        row += 1
+        if len(line) > maxRecordSize:
+            # Skip the rest of the oversized line without keeping it in memory
+            while line and not line.endswith("\n"):
+                line = textStream.readline(maxRecordSize + 1)
+            yield row, None, "Quote is too large."
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line), None
+        except ValueError:
+            yield row, None, "Invalid JSON."
+
+
+def iterCsv(textStream):
+    row = 0
+    try:
+        for row, record in enumerate(csv.DictReader(textStream), 1):
+            yield row, {column: _unescapeFormula(value) for column, value in record.items()}, None
+    except csv.Error as e:
+        yield row + 1, None, f"Invalid CSV: {str(e)}" # The rest of the file can not be trusted
+
+
+def _unescapeFormula(value):
+    # Cells the export prefixed with ' so spreadsheets do not evaluate them
+    if isinstance(value, str) and value.startswith("'") and value[1:].startswith(formulaPrefixes):
+        return value[1:]
+    return value
+
+
+def iterJsonArray(textStream):
+    """Incremental parser for a JSON array of objects, keeping at most one element in memory"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    endOfFile = False
+    started = False
+    expectingComma = False
+    row = 0
+
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            if endOfFile:
+                yield row + 1, None, "Unexpected end of file, the JSON array is not closed."
+                return
+            buffer = textStream.read(readChunkSize)
+            endOfFile = not buffer
+            continue
+
+        if not started:
+            if buffer[0] != "[":
+                yield 1, None, "JSON file must contain an array of quotes."
+                return
+            started = True
+            buffer = buffer[1:]
+            continue
+        if buffer[0] == "]":
+            return
+        if expectingComma:
+            if buffer[0] != ",":
+                yield row + 1, None, "Invalid JSON."
+                return
+            expectingComma = False
+            buffer = buffer[1:]
+            continue
+
+        # A value running up to the end of the buffer may be cut (e.g. a number), read more first
+        try:
+            value, end = decoder.raw_decode(buffer)
+            complete = end < len(buffer) or endOfFile
+        except ValueError:
+            if endOfFile:
+                yield row + 1, None, "Invalid JSON."
+                return
+            complete = False
+        if not complete:
+            if len(buffer) > maxRecordSize:
+                yield row + 1, None, "Quote is too large."
+                return
+            chunk = textStream.read(readChunkSize)
+            endOfFile = not chunk
+            buffer += chunk
+            continue
+
+        row += 1
+        buffer = buffer[end:]
+        expectingComma = True
+        yield row, value, None
+
+
+def importQuoteRecords(quotesCollection, userCollection, userEmail, records, batchSize=importBatchSize):
+    """Validate and insert parsed quotes in batches
+
+    Each batch costs one duplicate lookup, one quota reservation and one insert_many,
+    whatever its size. Quotes beyond the remaining quota are rejected.
+
+    Records are validated like POST /add-quote (cleanQuoteFields: required fields and
+    length limit). On purpose, an empty series or characters field is then filled from the
+    title or the author, which the quote forms do in the browser before calling /add-quote.
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        userCollection (Collection): Users collection
+        userEmail (str): Owner of the imported quotes
+        records (Iterable): (row, record, error) tuples, see iterRecords
+        batchSize (int, optional): Quotes per batch. Defaults to importBatchSize.
+
+    Returns:
+        dict: imported, failed, errors ([{"row", "error"}]), errorsTruncated and version
+    """
+    report = {"imported": 0, "failed": 0, "errors": [], "errorsTruncated": False, "version": None}
+    batch = []
+    for row, record, error in records:
+        if error:
+            _reportError(report, row, error)
+            continue
+        try:
+            fields = cleanQuoteFields(record, fillDefaults=True) # addQuote's validation, plus the defaults the quote forms fill in
+        except QuoteValidationError as e:
+            _reportError(report, row, str(e))
+            continue
+
+        quote = {
+            "userEmail": userEmail,
+            **fields,
+            "createdAt": datetime.now(timezone.utc),
+            "updatedAt": datetime.now(timezone.utc),
+        }
+        quote.update(derivedFields(quote))
+        batch.append((row, quote))
+        if len(batch) >= batchSize:
+            _insertBatch(quotesCollection, userCollection, userEmail, batch, report)
+            batch = []
+    if batch:
+        _insertBatch(quotesCollection, userCollection, userEmail, batch, report)
+    report["errors"].sort(key=lambda error: error["row"]) # Batch errors are only known once the batch is sent
+    return report
+
+
+def _reportError(report, row, error):
+    report["failed"] += 1
+    if len(report["errors"]) < maxReportedErrors:
+        report["errors"].append({"row": row, "error": error})
+    else:
+        report["errorsTruncated"] = True
+
+
+def _insertBatch(quotesCollection, userCollection, userEmail, batch, report):
+    # Duplicates inside the file, then duplicates of quotes already stored, in one query
+    fingerprints = [quote["fingerprint"] for _, quote in batch]
+    stored = {
+        found["fingerprint"] for found in quotesCollection.find(
+            {"userEmail": userEmail, "fingerprint": {"$in": fingerprints}},
+            {"_id": 0, "fingerprint": 1}
+        )
+    }
+    unique = []
+    for row, quote in batch:
+        if quote["fingerprint"] in stored:
+            _reportError(report, row, "Duplicate quote detected.")
+        else:
+            stored.add(quote["fingerprint"])
+            unique.append((row, quote))
+    if not unique:
+        return
+
+    # Charge the quota once for the whole batch
+    granted = reserveQuota(userCollection, userEmail, len(unique))
+    for row, _ in unique[granted:]:
+        _reportError(report, row, "Quote limit reached. Upgrade to add more quotes.")
+    unique = unique[:granted]
+    if not unique:
+        return
+
+    # Unordered: one failing quote (e.g. added concurrently) does not stop the others
+    failed = set() # Positions in unique
+    try:
+        quotesCollection.insert_many([quote for _, quote in unique], ordered=False)
+    except BulkWriteError as e:
+        for writeError in e.details["writeErrors"]:
+            failed.add(writeError["index"])
+            row = unique[writeError["index"]][0]
+            _reportError(report, row, "Duplicate quote detected." if writeError["code"] == 11000 else "Could not save quote.")
+    except Exception:
+        releaseQuota(userCollection, userEmail, len(unique)) # e.g. AutoReconnect: give the batch's quota back, as addQuote does
+        raise
+    releaseQuota(userCollection, userEmail, len(failed)) # Only inserted quotes count against the quota
+    report["imported"] += len(unique) - len(failed)
+    if len(failed) == len(unique):
+        return
+
+    # Bump the library version once the quotes are stored, and list them under it like single adds
+    report["version"] = bumpLibraryVersion(userCollection, userEmail)
+    insertedIds = [quote["_id"] for position, (_, quote) in enumerate(unique) if position not in failed]
+    stampQuotes(quotesCollection, insertedIds, report["version"])
@@ -0,0 +1,317 @@
+import base64
+import hashlib
+import json
+import re
+import unicodedata
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Fields a user can see, sort and search on (same order as the quotes table columns)
+quoteFields = ("bookSeries", "bookTitle", "characters", "quote", "author")
+requiredFields = ("bookTitle", "quote", "author")
+
+# Spam protection: no field may be longer than this
+characterSpamLimit = 2000
+
+# Stored on every quote but never sent to the client
+hiddenFields = ("userEmail", "fingerprint", "searchTerms", "syncVersion")
+quoteProjection = {field: 0 for field in hiddenFields}
+
+# Words are indexed with the field they come from ("author:tolkien") so searches can be scoped to a field
+searchTermSeparator = ":"
+wordPattern = re.compile(r"\w+")
+
+# Listing limits for GET /quotes
+defaultPageSize = 10
+maxPageSize = 100
+
+# Case-insensitive ordering, same as the toLowerCase() comparison the table used to do in the browser.
+# The listing indexes are built with the same collation, otherwise MongoDB can not use them for sorting.
+sortCollation = {"locale": "en", "strength": 2}
+
+# Compound indexes backing GET /quotes: one per sortable column, plus insertion order (_id)
+quoteListIndexes = [
+    [("userEmail", 1), (field, 1), ("_id", 1)] for field in quoteFields
+] + [[("userEmail", 1), ("_id", 1)]]
+
+
+class QueryError(ValueError):
+    """Raised when the listing parameters sent by the client are not valid"""
+
+
+class QuoteValidationError(ValueError):
+    """Raised when the fields of a quote sent by the client are not valid"""
+
+
+def cleanQuoteFields(data, fillDefaults=False):
+    """Strip and validate the user editable fields of a quote
+
+    Args:
+        data (dict): Quote sent by the client
+        fillDefaults (bool, optional): Use the title as series and the author as characters when
+            those are empty, like the quote forms do. Defaults to False.
+
+    Raises:
+        QuoteValidationError: A required field is empty or a field is too long
+
+    Returns:
+        dict: The quoteFields, stripped
+    """
+    if not isinstance(data, dict):
+        raise QuoteValidationError("Quote must be an object.")
+    fields = {
+        field: str(data.get(field)).strip() if data.get(field) is not None else ""
+        for field in quoteFields
+    }
+    
+    # Required fields
+    if not all(fields[field] for field in requiredFields):
+        raise QuoteValidationError("Book title, quote, and author are mandatory fields.")
+    # Spam protection (data longer than specified characters)
+    if any(len(value) > characterSpamLimit for value in fields.values()):
+        raise QuoteValidationError(f"Any field should not be longer than {characterSpamLimit} characters.")
+    
+    if fillDefaults:
+        fields["bookSeries"] = fields["bookSeries"] or fields["bookTitle"]
+        fields["characters"] = fields["characters"] or fields["author"]
+    return fields
+
+
+def serializeQuote(quote):
+    """Prepare a quote document for JSON serialization
+
+    Args:
+        quote (dict): Quote document
+
+    Returns:
+        dict: The same document without hidden fields and with its ObjectId converted to string
+    """
+    for field in hiddenFields:
+        quote.pop(field, None) # Do not include user email in the returned data (security)
+    quote["_id"] = str(quote["_id"]) # Convert ObjectId to string for JSON serialization
+    return quote
+
+
+def quoteFingerprint(quote):
+    """Hash of the normalised content of a quote, used to reject duplicates
+
+    Fields are Unicode (NFKC) normalised, whitespace collapsed and case folded, so quotes
+    that only differ in spacing or capitalisation count as the same quote.
+
+    Args:
+        quote (dict): Document holding the quoteFields
+
+    Returns:
+        str: Hex encoded SHA-256 digest
+    """
+    normalized = [
+        " ".join(unicodedata.normalize("NFKC", quote.get(field) or "").split()).casefold()
+        for field in quoteFields
+    ]
+    return hashlib.sha256("\x1f".join(normalized).encode("utf-8")).hexdigest()
+
+
+def tokenize(text):
+    """Split text into normalised words
+
+    Args:
+        text (str): Any text
+
+    Returns:
+        list: NFKC normalised, case folded words in order of appearance
+    """
+    return wordPattern.findall(unicodedata.normalize("NFKC", text or "").casefold())
+
+
+def quoteSearchTerms(quote):
+    """Inverted index entries of a quote (see searchTermSeparator)
+
+    Args:
+        quote (dict): Document holding the quoteFields
+
+    Returns:
+        list: Sorted, unique "field:word" terms
+    """
+    return sorted({
+        f"{field}{searchTermSeparator}{word}" for field in quoteFields for word in tokenize(quote.get(field))
+    })
+
+
+def derivedFields(quote):
+    """Fields computed from the content of a quote, to be stored along with it
+
+    Args:
+        quote (dict): Document holding the quoteFields
+
+    Returns:
+        dict: fingerprint and searchTerms
+    """
+    return {"fingerprint": quoteFingerprint(quote), "searchTerms": quoteSearchTerms(quote)}
+
+
+def backfillDerivedFields(quotesCollection, batchSize=1000):
+    """Add the derived fields to quotes stored before they existed (flask backfill, run once per upgrade)
+
+    Quotes that turn out to duplicate an already fingerprinted quote are left without a
+    fingerprint (the unique index only covers documents that have one), but still get
+    their search terms. They are reported for a human to merge or delete.
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        batchSize (int, optional): Updates sent per bulk_write. Defaults to 1000.
+
+    Returns:
+        dict: updated (updates applied) and duplicates (_id of the quotes left without a fingerprint)
+    """
+    report = {"updated": 0, "duplicates": []}
+    legacyQuotes = quotesCollection.find(
+        {"$or": [{name: {"$exists": False}} for name in ("fingerprint", "searchTerms")]},
+        {field: 1 for field in quoteFields}
+    )
+    batch = [] # (quote _id, UpdateOne)
+    for quote in legacyQuotes:
+        # One update per field, so a fingerprint collision does not hold back the search terms
+        for name, value in derivedFields(quote).items():
+            batch.append((quote["_id"], UpdateOne(
+                {"_id": quote["_id"], name: {"$exists": False}},
+                {"$set": {name: value}}
+            )))
+        if len(batch) >= batchSize:
+            _writeBackfillBatch(quotesCollection, batch, report)
+            batch = []
+    if batch:
+        _writeBackfillBatch(quotesCollection, batch, report)
+    return report
+
+
+def _writeBackfillBatch(quotesCollection, batch, report):
+    try:
+        report["updated"] += quotesCollection.bulk_write([update for _, update in batch], ordered=False).modified_count
+    except BulkWriteError as e:
+        # Duplicates among legacy quotes, everything else in the batch went through
+        report["updated"] += e.details["nModified"]
+        report["duplicates"] += [batch[writeError["index"]][0] for writeError in e.details["writeErrors"]]
+
+
+def encodeCursor(sortValue, quoteId):
+    """Build the opaque keyset cursor handed to the client
+
+    Args:
+        sortValue (str | None): Value of the sort field on the last quote of the page
+        quoteId (ObjectId): _id of the last quote of the page
+
+    Returns:
+        str: URL safe cursor string
+    """
+    payload = json.dumps([sortValue, str(quoteId)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decodeCursor(cursor):
+    """Reverse encodeCursor
+
+    Args:
+        cursor (str): Cursor string received from the client
+
+    Raises:
+        QueryError: The cursor was not produced by encodeCursor
+
+    Returns:
+        tuple: (sortValue, ObjectId)
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sortValue, quoteId = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if sortValue is not None and not isinstance(sortValue, str):
+            raise ValueError("Unexpected sort value")
+        return sortValue, ObjectId(quoteId)
+    except (ValueError, TypeError, InvalidId, UnicodeError):
+        raise QueryError("Invalid cursor.")
+
+
+def parseListArgs(args):
+    """Validate the query string of GET /quotes
+
+    Args:
+        args (MultiDict): request.args
+
+    Raises:
+        QueryError: One of the parameters is not valid
+
+    Returns:
+        dict: limit, sortField, sortOrder, searchField, search and cursor
+    """
+    try:
+        limit = int(args.get("limit", defaultPageSize))
+    except ValueError:
+        raise QueryError("limit must be a number.")
+    if limit < 1 or limit > maxPageSize:
+        raise QueryError(f"limit must be between 1 and {maxPageSize}.")
+
+    sortField = args.get("sortField") or None
+    if sortField is not None and sortField not in quoteFields:
+        raise QueryError("Unknown sort field.")
+
+    sortOrder = args.get("sortOrder", "asc")
+    if sortOrder not in ("asc", "desc"):
+        raise QueryError("sortOrder must be asc or desc.")
+
+    searchField = args.get("searchField", "global")
+    if searchField != "global" and searchField not in quoteFields:
+        raise QueryError("Unknown search field.")
+
+    cursor = args.get("cursor")
+    return {
+        "limit": limit,
+        "sortField": sortField,
+        "sortOrder": sortOrder,
+        "searchField": searchField,
+        "search": args.get("search", "").strip(),
+        "cursor": decodeCursor(cursor) if cursor else None,
+    }
+
+
+def buildListQuery(userEmail, options):
+    """Translate listing options into a MongoDB filter and sort specification
+
+    Paging uses the (sort value, _id) pair of the last quote as a keyset, so every page
+    is an index range scan no matter how deep the client goes.
+
+    Args:
+        userEmail (str): Owner of the quotes
+        options (dict): Output of parseListArgs
+
+    Returns:
+        tuple: (filter, sort)
+    """
+    conditions = [{"userEmail": userEmail}]
+
+    # Case-insensitive substring search, same behaviour as the old client-side search
+    if options["search"]:
+        pattern = {"$regex": re.escape(options["search"]), "$options": "i"}
+        if options["searchField"] == "global":
+            conditions.append({"$or": [{field: pattern} for field in quoteFields]})
+        else:
+            conditions.append({options["searchField"]: pattern})
+
+    direction = 1 if options["sortOrder"] == "asc" else -1
+    comparison = "$gt" if direction == 1 else "$lt"
+    sortField = options["sortField"]
+
+    # Continue right after the last quote of the previous page
+    if options["cursor"]:
+        sortValue, lastId = options["cursor"]
+        if sortField:
+            conditions.append({"$or": [
+                {sortField: {comparison: sortValue}},
+                {sortField: sortValue, "_id": {comparison: lastId}},
+            ]})
+        else:
+            conditions.append({"_id": {comparison: lastId}})
+
+    sort = [(sortField, direction), ("_id", direction)] if sortField else [("_id", direction)]
+    query = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    return query, sort
@@ -0,0 +1,120 @@
+from quoteUtils import QueryError, defaultPageSize, maxPageSize, quoteFields, quoteProjection, searchTermSeparator, tokenize
+
+# How much a matching word counts depending on the field it is found in
+searchWeights = {
+    "bookTitle": 3,
+    "author": 3,
+    "bookSeries": 2,
+    "characters": 2,
+    "quote": 1,
+}
+
+# Longer queries are cut, every word adds an $in entry and a score expression
+maxQueryWords = 10
+
+
+def parseSearchArgs(args):
+    """Validate the query string of GET /quotes/search
+
+    Args:
+        args (MultiDict): request.args
+
+    Raises:
+        QueryError: One of the parameters is not valid
+
+    Returns:
+        dict: words, searchField, page and limit
+    """
+    words = list(dict.fromkeys(tokenize(args.get("q", ""))))[:maxQueryWords] # Unique, in order
+    if not words:
+        raise QueryError("Search query is empty.")
+
+    searchField = args.get("searchField", "global")
+    if searchField != "global" and searchField not in quoteFields:
+        raise QueryError("Unknown search field.")
+
+    try:
+        page = int(args.get("page", 1))
+        limit = int(args.get("limit", defaultPageSize))
+    except ValueError:
+        raise QueryError("page and limit must be numbers.")
+    if page < 1:
+        raise QueryError("page must be at least 1.")
+    if limit < 1 or limit > maxPageSize:
+        raise QueryError(f"limit must be between 1 and {maxPageSize}.")
+
+    return {"words": words, "searchField": searchField, "page": page, "limit": limit}
+
+
+def searchFilter(userEmail, options):
+    """Quotes containing at least one of the words, found through the (userEmail, searchTerms) multikey index
+
+    Args:
+        userEmail (str): Owner of the quotes
+        options (dict): Output of parseSearchArgs
+
+    Returns:
+        dict: MongoDB filter
+    """
+    terms = [term for fieldTerms in _termsByField(options).values() for term in fieldTerms]
+    return {"userEmail": userEmail, "searchTerms": {"$in": terms}}
+
+
+def buildSearchPipeline(userEmail, options):
+    """Aggregation pipeline returning the _id and score of one page of relevance ranked quotes
+
+    Only quotes containing at least one of the words are scored. The score of a quote is the
+    sum, over the searched fields, of the field weight times the number of query words found
+    in it. Documents are cut down to _id and score before the sort, so the sort stays small
+    and only the page leaves the server.
+
+    Args:
+        userEmail (str): Owner of the quotes
+        options (dict): Output of parseSearchArgs
+
+    Returns:
+        list: Pipeline producing [{"_id": ..., "score": n}] in rank order
+    """
+    score = {"$add": [
+        {"$multiply": [
+            searchWeights[field],
+            {"$size": {"$filter": {"input": "$searchTerms", "cond": {"$in": ["$$this", terms]}}}},
+        ]}
+        for field, terms in _termsByField(options).items()
+    ]}
+
+    return [
+        {"$match": searchFilter(userEmail, options)},
+        {"$project": {"score": score}}, # _id is kept
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$skip": (options["page"] - 1) * options["limit"]},
+        {"$limit": options["limit"]},
+    ]
+
+
+def searchPage(quotesCollection, userEmail, options):
+    """One page of relevance ranked quotes and the number of hits
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        userEmail (str): Owner of the quotes
+        options (dict): Output of parseSearchArgs
+
+    Returns:
+        dict: quotes (documents without hidden fields, best first) and total
+    """
+    ranked = [hit["_id"] for hit in quotesCollection.aggregate(buildSearchPipeline(userEmail, options))]
+    if options["page"] == 1 and len(ranked) < options["limit"]:
+        total = len(ranked) # Everything fits on the first page, no need to count
+    else:
+        total = quotesCollection.count_documents(searchFilter(userEmail, options))
+
+    # Do not include user email in the returned data (security)
+    quotes = {quote["_id"]: quote for quote in quotesCollection.find({"_id": {"$in": ranked}, "userEmail": userEmail}, quoteProjection)}
+    return {"quotes": [quotes[quoteId] for quoteId in ranked if quoteId in quotes], "total": total}
+
+
+def _termsByField(options):
+    # Search terms of every searched field, as stored in searchTerms ("field<separator>word")
+    fields = quoteFields if options["searchField"] == "global" else (options["searchField"],)
+    return {field: [f"{field}{searchTermSeparator}{word}" for word in options["words"]] for field in fields}
@@ -17,16 +17,33 @@ document.addEventListener("DOMContentLoaded", () => {
     const deleteButton = document.getElementById("delete-quote");
     const cancelButton = document.getElementById("cancel-edit");
 
-    // Client-side memory for quotes
-    // Get the quotes passed from the Flask backend
-    const embeddedQuotesData = document.getElementById("quotes-data");
-    let quotes = embeddedQuotesData ? JSON.parse(embeddedQuotesData.textContent) : [];
+    // Client-side memory for quotes, loaded from /quotes after the page is shown (see loadQuotes)
+    let quotes = [];
     let filteredQuotes = [...quotes]; // Default to all quotes
+    // Version of the library the client-side memory reflects (bumped by every add/edit/delete)
+    const quotesTable = document.getElementById("quotes-table");
+    let libraryVersion = parseInt(quotesTable.dataset.version, 10) || 0;
+    // Account the offline copy of the library belongs to (see serviceWorker.js)
+    const libraryOwner = quotesTable.dataset.owner;
+    registerServiceWorker();
+
+    // Loading trackers
+    const loadingInfo = document.getElementById("loading-quotes");
+    const loadPageSize = 100; // Quotes per background request, the most /quotes returns at once
+    let totalQuotes = 0; // Quotes in the library, known from the first page on
+    let allQuotesLoaded = false;
+    const addedWhileLoading = new Set(); // Ids of quotes added here that a page still to come may contain too
 
     // Search controllers
     const searchInput = document.getElementById("search");
     const searchFieldSelector = document.getElementById("search-field");
 
+    // Search trackers: queries run in a worker holding a lowercased copy of every quote (see searchWorker.js)
+    const searchDelay = 150; // Milliseconds of typing pause before searching
+    let searchTimer = null;
+    let searchId = 0; // Id of the latest query, results of older ones are dropped
+    const searchWorker = createSearchWorker();
+
     // Pagination controllers
     const previousPageButton = document.getElementById("previous-page");
     const nextPageButton = document.getElementById("next-page");
@@ -44,11 +61,24 @@ document.addEventListener("DOMContentLoaded", () => {
     let currentSortField = null;
     let currentSortOrder = "asc"; // Default sorting mode is ascending
 
+    // Rows of the table are created once and refilled with other quotes, never rebuilt (see fillRow).
+    // Scroll mode keeps spacer rows above and below them as tall as the quotes out of sight.
+    const tableSection = document.getElementById("table-section");
+    const rowPool = [];
+    const topSpacer = createSpacerRow();
+    const bottomSpacer = createSpacerRow();
+    quotesTableBody.append(topSpacer, bottomSpacer);
+    let renderedQuotes = filteredQuotes; // Quotes the table currently shows (all pages)
+    let scrollMode = false;
+    let rowHeight = 0; // Measured from the first filled row, rows have a fixed height in scroll mode
+    let scrollFrameRequested = false;
+    const scrollOverscan = 10; // Rows kept ready above and below the visible ones
+
     // Logout button
     const logoutButton = document.getElementById("logout");
 
-    // Render the table on page load
-    renderQuotesTable(quotes);
+    // Render the table as soon as the first page arrives, the rest of the library follows in the background
+    loadQuotes();
 
     // Informational pop-up functionality
     popUpButtons.forEach((button) => {
@@ -86,7 +116,7 @@ document.addEventListener("DOMContentLoaded", () => {
     // Add quote section functionality
     async function addQuoteToTable(quote) {
         try {
-            const response = await fetch("/add-quote", {
+            const response = await fetch("/add-quote?delta=1", {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
@@ -96,11 +126,8 @@ document.addEventListener("DOMContentLoaded", () => {
 
             const data = await response.json();
             if (response.ok) {
-                // Update the client-side memory
-                quotes = data.quotes; // Update the client-side memory with the updated quotes
-                filteredQuotes = filteredQuotes = [...quotes]; // Update filteredQuotes if needed
-                // Re-render the table
-                renderQuotesTable(quotes);
+                // Update the client-side memory with the added quote and re-render the table
+                applyQuoteDelta(data);
                 console.log("quote added to the db");
             } else if (response.status === 401) {
                 alert(data.error || "Session expired. Please log in again.");
@@ -114,6 +141,178 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
+    // Turn a columnar quote list (field names once, value arrays, dictionaries, epoch timestamps) into quote objects.
+    // Plain arrays of quotes are returned as they are.
+    function decodeColumnar(payload) {
+        if (Array.isArray(payload)) {
+            return payload;
+        }
+        const { count, fields, columns, dictionaries, timestamps } = payload;
+        const decoded = new Array(count);
+        for (let row = 0; row < count; row++) {
+            const quote = {};
+            for (const field of fields) {
+                let value = columns[field][row];
+                if (value !== null && dictionaries[field]) {
+                    value = dictionaries[field][value];
+                } else if (value !== null && timestamps.includes(field)) {
+                    value = new Date(value).toUTCString(); // Same rendering as the plain JSON responses
+                }
+                quote[field] = value;
+            }
+            decoded[row] = quote;
+        }
+        return decoded;
+    }
+
+    // One page of the library in insertion order, null if the session expired
+    async function fetchQuotePage(cursor, limit) {
+        const params = new URLSearchParams({limit: String(limit)});
+        if (cursor) {
+            params.set("cursor", cursor);
+        } else {
+            params.set("count", "1"); // The first page also tells how many quotes there are
+        }
+        const response = await fetch(`/quotes?${params}`, {
+            headers: {"Accept": "application/vnd.quotebase.columnar+json"},
+        });
+        if (response.status === 401) {
+            window.location.href = "/"; // Redirect to the login page
+            return null;
+        }
+        if (!response.ok) {
+            throw new Error(`Loading quotes failed with status ${response.status}`);
+        }
+        const data = await response.json();
+        data.quotes = decodeColumnar(data.quotes);
+        return data;
+    }
+
+    // Keep the library in IndexedDB through the service worker, so returning visits only fetch the changes
+    function registerServiceWorker() {
+        if (!("serviceWorker" in navigator) || !libraryOwner) return;
+        navigator.serviceWorker.register("/service-worker.js").catch((error) => {
+            console.error("Service worker registration failed:", error);
+        });
+    }
+
+    // Send a message to the service worker, once it is active
+    function postToServiceWorker(message) {
+        if (!("serviceWorker" in navigator) || !libraryOwner) return;
+        navigator.serviceWorker.ready.then((registration) => {
+            registration.active.postMessage({...message, owner: libraryOwner});
+        });
+    }
+
+    // Library stored by the service worker and synced with the changes since the last visit,
+    // null when there is none (first visit, no service worker yet, or too far behind)
+    async function fetchOfflineLibrary() {
+        if (!("serviceWorker" in navigator) || !navigator.serviceWorker.controller || !libraryOwner) return null;
+        try {
+            const response = await fetch(`/offline/quotes?owner=${encodeURIComponent(libraryOwner)}`);
+            return response.status === 200 ? await response.json() : null;
+        } catch (error) {
+            console.error("Error reading the offline library:", error);
+            return null;
+        }
+    }
+
+    // Load the library kept by the service worker if there is one. Otherwise load the first page
+    // (as many quotes as the table shows), then the rest page by page, always requesting the next page
+    // before merging the current one, and hand the result to the service worker for the next visit.
+    async function loadQuotes() {
+        try {
+            const library = await fetchOfflineLibrary();
+            if (library) {
+                libraryVersion = library.version;
+                totalQuotes = library.quotes.length;
+                allQuotesLoaded = true;
+                mergeQuotes(library.quotes);
+                return;
+            }
+
+            const firstPage = await fetchQuotePage(null, scrollMode ? loadPageSize : itemsPerPage);
+            if (!firstPage) return;
+            libraryVersion = firstPage.version;
+            totalQuotes = firstPage.total;
+            mergeQuotes(firstPage.quotes);
+
+            let nextPage = firstPage.nextCursor ? fetchQuotePage(firstPage.nextCursor, loadPageSize) : null;
+            while (nextPage) {
+                const page = await nextPage;
+                if (!page) return;
+                nextPage = page.nextCursor ? fetchQuotePage(page.nextCursor, loadPageSize) : null;
+                // Changes made somewhere else while loading are not merged here: libraryVersion stays
+                // behind, so the next add/edit/delete reloads the page (see applyQuoteDelta)
+                mergeQuotes(page.quotes);
+            }
+            allQuotesLoaded = true;
+            addedWhileLoading.clear();
+            renderQuotesTable(filteredQuotes);
+            postToServiceWorker({type: "store", version: libraryVersion, quotes: quotes});
+        } catch (error) {
+            console.error("Error loading quotes:", error);
+            loadingInfo.textContent = "Unable to load all of your quotes. Please refresh the page.";
+        }
+    }
+
+    // Append a loaded page to the client-side memory, keeping the current search and sort
+    function mergeQuotes(page) {
+        const newQuotes = page.filter((q) => !addedWhileLoading.has(q._id));
+        quotes.push(...newQuotes);
+        newQuotes.forEach((quote) => countDataListValues(quote, 1));
+        indexQuotes(newQuotes);
+        if (searchInput.value.trim()) {
+            searchQuotes(); // The new page may hold more matches
+            return;
+        }
+        filteredQuotes.push(...newQuotes);
+        if (currentSortField) {
+            sortFilteredQuotes(); // Rare while loading, so sorting everything again is fine
+        }
+        renderQuotesTable(filteredQuotes);
+    }
+
+    // Apply a delta response of add/edit/delete to the client-side memory
+    function applyQuoteDelta(data) {
+        // Library changed somewhere else (e.g. another tab) since the last sync, start over from the server
+        if (data.version !== libraryVersion + 1) {
+            window.location.reload();
+            return;
+        }
+        libraryVersion = data.version;
+        postToServiceWorker({type: "apply", version: data.version, quote: data.quote, deletedId: data.deletedId});
+
+        if (data.deletedId) {
+            const deletedQuote = quotes.find((q) => q._id === data.deletedId);
+            if (deletedQuote) {
+                countDataListValues(deletedQuote, -1);
+            }
+            unindexQuote(data.deletedId);
+            quotes = quotes.filter((q) => q._id !== data.deletedId);
+            totalQuotes--;
+        } else {
+            const index = quotes.findIndex((q) => q._id === data.quote._id);
+            if (index !== -1) {
+                countDataListValues(quotes[index], -1); // Values of the quote before the edit
+            }
+            countDataListValues(data.quote, 1);
+            indexQuotes([data.quote]);
+            if (index === -1) {
+                quotes.push(data.quote); // Added quote
+                if (!allQuotesLoaded) {
+                    addedWhileLoading.add(data.quote._id);
+                    totalQuotes++;
+                }
+            } else {
+                quotes[index] = data.quote; // Edited quote
+            }
+        }
+        filteredQuotes = [...quotes]; // Update filteredQuotes if needed
+        renderQuotesTable(quotes);
+        characterLimitIndicator(); // Reset character limits
+    }
+
     // Edit section functionality
     quotesTableBody.addEventListener("click", (event) => {
         if (event.target.classList.contains("edit-button")) {
@@ -158,7 +357,7 @@ document.addEventListener("DOMContentLoaded", () => {
         }
         if (confirm("Are you sure you want to save changes?")) {
             try {
-                const response = await fetch(`/edit-quote/${quoteId}`, {
+                const response = await fetch(`/edit-quote/${quoteId}?delta=1`, {
                     method: "PUT",
                     headers: {
                         "Content-Type": "application/json"
@@ -168,11 +367,8 @@ document.addEventListener("DOMContentLoaded", () => {
     
                 const data = await response.json();
                 if (response.ok) {
-                    // Update the client-side memory
-                    quotes = data.quotes; // Update the client-side memory with the updated quotes
-                    filteredQuotes = filteredQuotes = [...quotes]; // Update filteredQuotes if needed
-                    // Re-render the table
-                    renderQuotesTable(quotes);
+                    // Update the client-side memory with the change and re-render the table
+                    applyQuoteDelta(data);
                     alert("Quote updated successfully!"); // TODO Turn this to console.log
                     editQuoteSection.classList.remove("show");
                     editQuoteSection.classList.add("hide");
@@ -200,17 +396,14 @@ document.addEventListener("DOMContentLoaded", () => {
 
         if (confirm("Are you sure you want to delete this quote?")) {
             try {
-                const response = await fetch(`/delete-quote/${quoteId}`, {
+                const response = await fetch(`/delete-quote/${quoteId}?delta=1`, {
                     method: "DELETE",
                 });
 
                 const data = await response.json();
                 if (response.ok) {
-                    // Update the client-side memory
-                    quotes = data.quotes; // Update the client-side memory with the updated quotes
-                    filteredQuotes = filteredQuotes = [...quotes]; // Update filteredQuotes if needed
-                    // Re-render the table
-                    renderQuotesTable(quotes);
+                    // Update the client-side memory with the change and re-render the table
+                    applyQuoteDelta(data);
                     alert("Quote deleted successfully!"); // TODO Turn this to console.log
                     editQuoteSection.classList.remove("show");
                     editQuoteSection.classList.add("hide");
@@ -243,8 +436,26 @@ document.addEventListener("DOMContentLoaded", () => {
         }, 500);
     });
 
+    // Pages of the table; while loading, unfiltered pages count the quotes still on their way
+    function pageCount(quotesToRender = filteredQuotes) {
+        const unfiltered = !allQuotesLoaded && !searchInput.value.trim();
+        const count = unfiltered ? Math.max(totalQuotes, quotesToRender.length) : quotesToRender.length;
+        return Math.max(1, Math.ceil(count / itemsPerPage));
+    }
+
     function renderQuotesTable(quotesToRender = filteredQuotes) {
-        const totalPages = Math.ceil(quotesToRender.length / itemsPerPage);
+        renderedQuotes = quotesToRender;
+        if (scrollMode) {
+            // Every quote in one scrolling table, only the rows in sight exist
+            const waiting = !allQuotesLoaded;
+            loadingInfo.style.display = waiting ? "block" : "none";
+            noResultInfo.style.display = quotesToRender.length === 0 && !waiting ? "block" : "none";
+            pageInfo.textContent = `${quotesToRender.length} quotes`;
+            renderScrollWindow();
+            return;
+        }
+
+        const totalPages = pageCount(quotesToRender);
         // After search current page needs to be updated (to prevent out of bound pages)
         if (currentPage > totalPages) {
             currentPage = totalPages;
@@ -253,33 +464,108 @@ document.addEventListener("DOMContentLoaded", () => {
         const endIndex = startIndex + itemsPerPage;
         const paginatedQuotes = quotesToRender.slice(startIndex, endIndex);
 
-        // Clear the table
-        quotesTableBody.innerHTML = "";
-
-        // If there is no quote, display no results message
-        if (paginatedQuotes.length === 0) {
-            noResultInfo.style.display = "block";
-            return;
-        }
-        noResultInfo.style.display = "none";
+        // Quotes of this page are still loading, or there are none
+        const waiting = !allQuotesLoaded && paginatedQuotes.length < itemsPerPage;
+        loadingInfo.style.display = waiting ? "block" : "none";
+        pageInfo.textContent = `${currentPage}/${totalPages}`;
+        previousPageButton.disabled = currentPage === 1;
+        nextPageButton.disabled = currentPage === totalPages;
+        noResultInfo.style.display = paginatedQuotes.length === 0 && !waiting ? "block" : "none";
 
         // Render the table
-        paginatedQuotes.forEach((quote) => addRowToTable(quote));
+        showRows(paginatedQuotes, startIndex);
+    }
 
-        //Update page info
-        pageInfo.textContent = `${currentPage}/${totalPages}`;
+    function createSpacerRow() {
+        const row = document.createElement("tr");
+        row.className = "spacer-row";
+        const cell = document.createElement("td");
+        cell.colSpan = 6;
+        row.appendChild(cell);
+        return row;
+    }
 
-        //Enable or disable pagination buttons
-        previousPageButton.disabled = currentPage === 1;
-        nextPageButton.disabled = currentPage === totalPages;
+    function createRow() {
+        const row = document.createElement("tr");
+        for (let column = 0; column < 5; column++) {
+            row.appendChild(document.createElement("td"));
+        }
+        const actionCell = document.createElement("td");
+        const editButton = document.createElement("button");
+        editButton.className = "edit-button";
+        editButton.textContent = "Edit";
+        actionCell.appendChild(editButton);
+        row.appendChild(actionCell);
+        quotesTableBody.insertBefore(row, bottomSpacer);
+        return row;
+    }
 
-        characterLimitIndicator(); // Reset character limits
-        updateDataLists(); // Update data lists (suggestions)
+    // Put a quote in a row, touching the cells only if the row showed another quote (or an older version)
+    function fillRow(row, quote, index) {
+        row.hidden = false;
+        row.classList.toggle("even-row", index % 2 === 1);
+        if (row.quote === quote) {
+            return;
+        }
+        row.quote = quote;
+        const cells = row.cells;
+        cells[0].textContent = quote.bookSeries || "";
+        cells[1].textContent = quote.bookTitle || "";
+        cells[2].textContent = quote.characters || "";
+        cells[3].textContent = quote.quote || "";
+        cells[4].textContent = quote.author || "";
+        cells[5].firstChild.dataset.id = quote._id;
     }
 
-    // Event listener for items-per-page dropdown
+    // Show the given quotes in the first rows of the pool and hide the rest
+    function showRows(quotesToShow, firstIndex) {
+        while (rowPool.length < quotesToShow.length) {
+            rowPool.push(createRow());
+        }
+        quotesToShow.forEach((quote, offset) => fillRow(rowPool[offset], quote, firstIndex + offset));
+        for (let index = quotesToShow.length; index < rowPool.length; index++) {
+            rowPool[index].hidden = true;
+            rowPool[index].quote = null;
+        }
+    }
+
+    // Rows in sight of the scrolling table section, plus a few above and below
+    function renderScrollWindow() {
+        if (!rowHeight) {
+            showRows(renderedQuotes.slice(0, 1), 0);
+            rowHeight = (rowPool[0] && rowPool[0].getBoundingClientRect().height) || 40;
+        }
+        const visibleRows = Math.ceil(tableSection.clientHeight / rowHeight);
+        const firstIndex = Math.max(0, Math.floor(tableSection.scrollTop / rowHeight) - scrollOverscan);
+        const windowQuotes = renderedQuotes.slice(firstIndex, firstIndex + visibleRows + 2 * scrollOverscan);
+        topSpacer.style.height = `${firstIndex * rowHeight}px`;
+        bottomSpacer.style.height = `${(renderedQuotes.length - firstIndex - windowQuotes.length) * rowHeight}px`;
+        showRows(windowQuotes, firstIndex);
+    }
+
+    // At most one window update per frame, however many scroll events come in
+    tableSection.addEventListener("scroll", () => {
+        if (!scrollMode || scrollFrameRequested) return;
+        scrollFrameRequested = true;
+        requestAnimationFrame(() => {
+            scrollFrameRequested = false;
+            renderScrollWindow();
+        });
+    }, {passive: true});
+
+    // Event listener for items-per-page dropdown ("all" switches from pages to one scrolling table)
     itemsPerPageSelect.addEventListener("change", () => {
-        itemsPerPage = parseInt(itemsPerPageSelect.value);
+        scrollMode = itemsPerPageSelect.value === "all";
+        tableSection.classList.toggle("virtual-scroll", scrollMode);
+        previousPageButton.hidden = scrollMode;
+        nextPageButton.hidden = scrollMode;
+        topSpacer.style.height = "0px";
+        bottomSpacer.style.height = "0px";
+        rowHeight = 0; // Rows are shorter in scroll mode, measure again
+        tableSection.scrollTop = 0;
+        if (!scrollMode) {
+            itemsPerPage = parseInt(itemsPerPageSelect.value);
+        }
         currentPage = 1; // Reset to the first page
         renderQuotesTable(filteredQuotes);
     });
@@ -294,29 +580,12 @@ document.addEventListener("DOMContentLoaded", () => {
 
     // Event listener for next page button
     nextPageButton.addEventListener("click", () => {
-        const totalPages = Math.ceil(quotes.length / itemsPerPage);
-        if (currentPage < totalPages) {
+        if (currentPage < pageCount()) {
             currentPage++;
             renderQuotesTable(filteredQuotes);
         }
     });
 
-    // 
-    function addRowToTable(quote) {
-        const row = document.createElement("tr");
-        row.innerHTML = `
-                <td>${quote.bookSeries || ""}</td>
-                <td>${quote.bookTitle}</td>
-                <td>${quote.characters || ""}</td>
-                <td>${quote.quote}</td>
-                <td>${quote.author}</td>
-                <td>
-                    <button class="edit-button" data-id="${quote._id}">Edit</button>
-                </td>
-            `;
-            quotesTableBody.appendChild(row);
-    }
-
     addQuoteForm.addEventListener("submit", (event) => {
         event.preventDefault();
 
@@ -342,32 +611,81 @@ document.addEventListener("DOMContentLoaded", () => {
 
         // Reset the form
         addQuoteForm.reset();
+        characterLimitIndicator(); // Reset character limits
     });
 
-    // Search functionality
-    searchInput.addEventListener("input", searchQuotes);
+    // Search functionality: typing waits for a pause, the field selector searches right away
+    searchInput.addEventListener("input", () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(searchQuotes, searchDelay);
+    });
     searchFieldSelector.addEventListener("change", searchQuotes);
 
+    // The worker, or null if this browser can not start it (the search then runs here, see filterQuotes)
+    function createSearchWorker() {
+        try {
+            const worker = new Worker(searchInput.dataset.worker);
+            worker.onmessage = (event) => {
+                if (event.data.searchId !== searchId) return; // The user typed again in the meantime
+                const matches = new Set(event.data.ids);
+                showSearchResults(quotes.filter((quote) => matches.has(quote._id)));
+            };
+            return worker;
+        } catch (error) {
+            console.error("Search worker unavailable:", error);
+            return null;
+        }
+    }
+
+    // Keep the worker's index in step with the client-side memory
+    function indexQuotes(quotesToIndex) {
+        if (searchWorker && quotesToIndex.length) {
+            searchWorker.postMessage({type: "put", quotes: quotesToIndex});
+        }
+    }
+
+    function unindexQuote(quoteId) {
+        if (searchWorker) {
+            searchWorker.postMessage({type: "remove", id: quoteId});
+        }
+    }
+
     function searchQuotes() {
+        clearTimeout(searchTimer);
+        searchId++; // A query still running in the worker stops at its next chunk
         const searchWord = searchInput.value.trim().toLowerCase();
-        const searchField = searchFieldSelector.value;
-    
+        if (!searchWord) {
+            showSearchResults([...quotes]);
+        } else if (searchWorker) {
+            searchWorker.postMessage({type: "search", searchId: searchId, word: searchWord, field: searchFieldSelector.value});
+        } else {
+            showSearchResults(filterQuotes(searchWord, searchFieldSelector.value));
+        }
+    }
+
+    // Show search results in the order chosen on the table headers
+    function showSearchResults(results) {
+        filteredQuotes = results;
+        if (currentSortField) {
+            sortFilteredQuotes();
+        }
+        renderQuotesTable(filteredQuotes);
+    }
+
+    // Same search as the worker's, on the main thread
+    function filterQuotes(searchWord, searchField) {
         if (searchField === "global") {
-            filteredQuotes = quotes.filter(quote =>
+            return quotes.filter(quote =>
                 Object.entries(quote).filter(
                     ([key]) => !["_id", "createdAt", "updatedAt"].includes(key) // Exclude these fields from search
                 ).some(
                     ([_, value]) => value && value.toString().toLowerCase().includes(searchWord) // Check value for search term
                 )
             );
-        } else {
-            filteredQuotes = quotes.filter(
-                quote => quote[searchField] && quote[searchField].toLowerCase().includes(searchWord)
-            );
         }
-    
-        // Render the filtered quotes
-        renderQuotesTable(filteredQuotes);
+        return quotes.filter(
+            quote => quote[searchField] && quote[searchField].toLowerCase().includes(searchWord)
+        );
     }
 
     // Sorting functionality
@@ -396,14 +714,7 @@ document.addEventListener("DOMContentLoaded", () => {
         }
 
         // Sort quotes
-        filteredQuotes.sort((a, b) => {
-            const aValue = a[field]?.toLowerCase() || "";
-            const bValue = b[field]?.toLowerCase() || "";
-
-            if (aValue < bValue) return currentSortOrder === "asc" ? -1 : 1;
-            if (aValue > bValue) return currentSortOrder === "asc" ? 1 : -1;
-            return 0;
-        });
+        sortFilteredQuotes();
 
         // Clear existing classes
         document.querySelectorAll("#quotes-table th").forEach((th) => {
@@ -417,40 +728,53 @@ document.addEventListener("DOMContentLoaded", () => {
         renderQuotesTable(filteredQuotes);
     }
 
-    // Data list functions (suggestions)
-    function updateDataLists() {
-        const seriesSet = new Set();
-        const titlesSet = new Set();
-        const charactersSet = new Set();
-        const authorsSet = new Set();
-
-        quotes.forEach(quote => {
-            seriesSet.add(quote.bookSeries);
-            titlesSet.add(quote.bookTitle);
-            charactersSet.add(quote.characters);
-            authorsSet.add(quote.author);
+    function sortFilteredQuotes() {
+        const field = currentSortField;
+        filteredQuotes.sort((a, b) => {
+            const aValue = a[field]?.toLowerCase() || "";
+            const bValue = b[field]?.toLowerCase() || "";
+
+            if (aValue < bValue) return currentSortOrder === "asc" ? -1 : 1;
+            if (aValue > bValue) return currentSortOrder === "asc" ? 1 : -1;
+            return 0;
         });
+    }
 
-        updateDataList("series-list", seriesSet);
-        updateDataList("title-list", titlesSet);
-        updateDataList("characters-list", charactersSet);
-        updateDataList("author-list", authorsSet);
+    // Data list functions (suggestions). Every value is counted by the quotes using it: its <option>
+    // is added when the first quote uses it and removed with the last one, the lists are never rebuilt.
+    const dataListIds = {bookSeries: "series-list", bookTitle: "title-list", characters: "characters-list", author: "author-list"};
+    const dataListValues = {};
+    for (const field of Object.keys(dataListIds)) {
+        dataListValues[field] = new Map(); // value -> {count, option}
     }
 
-    function updateDataList(datalistId, dataSet) {
-        const datalist = document.getElementById(datalistId);
-        datalist.innerHTML = "";
-        dataSet.forEach(value => {
-            const option = document.createElement("option");
-            option.value = value;
-            datalist.appendChild(option);
-        });
+    // change is 1 for a quote that appeared, -1 for one that went away
+    function countDataListValues(quote, change) {
+        for (const [field, datalistId] of Object.entries(dataListIds)) {
+            const value = quote[field];
+            if (!value) continue;
+            const values = dataListValues[field];
+            const entry = values.get(value);
+            if (entry) {
+                entry.count += change;
+                if (entry.count <= 0) {
+                    entry.option.remove();
+                    values.delete(value);
+                }
+            } else if (change > 0) {
+                const option = document.createElement("option");
+                option.value = value;
+                document.getElementById(datalistId).appendChild(option);
+                values.set(value, {count: change, option: option});
+            }
+        }
     }
 
     //Event listener for logout button
     if (logoutButton) {
         logoutButton.addEventListener("click", async () => {
             try {
+                postToServiceWorker({type: "clear"}); // The offline copy is not left behind on a shared computer
                 const response = await fetch("/logout", {method: "GET"});
 
                 if (response.redirected) {
@@ -484,7 +808,9 @@ function characterLimitIndicator () {
             const remainingSpan = label.querySelector("span");
             remainingSpan.textContent = `${remaining}/${maxLength}`;;
 
-            //update the span dynamically
+            //update the span dynamically (once per input, this function runs again to reset the counts)
+            if (input.dataset.limitTracked) return;
+            input.dataset.limitTracked = "true";
             input.addEventListener("input", () =>{
                 remaining = maxLength - input.value.length;
                 remainingSpan.textContent = `${remaining}/${maxLength}`;
@@ -0,0 +1,42 @@
+// Search index of the quote table, run off the main thread (see runSearch in script.js).
+// Every quote is lowercased once when it arrives, so a query only compares strings.
+
+// Searchable fields, the order of the values in the index
+const searchFields = ["bookSeries", "bookTitle", "characters", "quote", "author"];
+// Quotes compared before the worker looks for newer messages
+const searchChunkSize = 2000;
+
+const searchIndex = new Map(); // quote id -> lowercased values of searchFields
+let latestSearchId = 0; // Only the latest query is finished, older ones stop at their next chunk
+
+self.onmessage = (event) => {
+    const message = event.data;
+    if (message.type === "put") {
+        // Added, loaded or edited quotes
+        message.quotes.forEach((quote) => {
+            searchIndex.set(quote._id, searchFields.map((field) => (quote[field] || "").toString().toLowerCase()));
+        });
+    } else if (message.type === "remove") {
+        searchIndex.delete(message.id);
+    } else if (message.type === "search") {
+        latestSearchId = message.searchId;
+        search(message.searchId, message.word, message.field);
+    }
+};
+
+// Ids of the quotes containing word, in the given field or ("global") any of them
+async function search(searchId, word, field) {
+    const column = searchFields.indexOf(field);
+    const ids = [];
+    let compared = 0;
+    for (const [id, values] of searchIndex) {
+        if (column === -1 ? values.some((value) => value.includes(word)) : values[column].includes(word)) {
+            ids.push(id);
+        }
+        if (++compared % searchChunkSize === 0) {
+            await new Promise((resolve) => setTimeout(resolve, 0)); // Let a newer query (or index update) in
+            if (searchId !== latestSearchId) return;
+        }
+    }
+    self.postMessage({type: "results", searchId: searchId, ids: ids});
+}
@@ -0,0 +1,189 @@
+// Offline copy of the library (see loadQuotes in script.js), served from /service-worker.js.
+// Quotes are kept in IndexedDB, one database per account: a returning visit only downloads
+// what changed since the previous one (GET /quotes/changes) instead of the whole library.
+// The page shell is cached too, so the library still opens without a network.
+
+const shellCache = "quote-base-shell";
+const databasePrefix = "quote-base-library-";
+// Seconds deleted quotes are remembered by the server (tombstoneRetention in sync.py), until a sync tells otherwise
+const defaultRetention = 30 * 24 * 60 * 60;
+
+self.addEventListener("install", () => {
+    self.skipWaiting(); // Nothing to migrate, take over from an older version at once
+});
+
+self.addEventListener("activate", (event) => {
+    event.waitUntil(self.clients.claim()); // Control the page that registered this worker, not only the next one
+});
+
+self.addEventListener("fetch", (event) => {
+    const url = new URL(event.request.url);
+    if (url.origin !== self.location.origin || event.request.method !== "GET") {
+        return;
+    }
+    if (url.pathname === "/offline/quotes") {
+        event.respondWith(offlineLibrary(url.searchParams.get("owner")));
+    } else if (url.pathname === "/home" || url.pathname.startsWith("/static/")) {
+        event.respondWith(networkFirst(event.request));
+    }
+});
+
+// Messages of the page: the library it loaded from /quotes, its own changes, and logging out
+self.addEventListener("message", (event) => {
+    const message = event.data;
+    if (!message || !message.owner) {
+        return;
+    }
+    if (message.type === "store") {
+        event.waitUntil(storeLibrary(message.owner, message.version, message.quotes));
+    } else if (message.type === "apply") {
+        event.waitUntil(applyOwnChange(message));
+    } else if (message.type === "clear") {
+        event.waitUntil(Promise.all([deleteLibrary(message.owner), caches.delete(shellCache)]));
+    }
+});
+
+// Page shell: always from the network when there is one (HTTP caching still applies), the cached copy otherwise
+async function networkFirst(request) {
+    try {
+        const response = await fetch(request);
+        if (response.ok && !response.redirected) {
+            const cache = await caches.open(shellCache);
+            await cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await caches.match(request);
+        if (cached) {
+            return cached;
+        }
+        throw error;
+    }
+}
+
+// The stored library brought up to date with the changes since the last sync.
+// 204 when there is nothing usable and the page has to load the library from /quotes.
+async function offlineLibrary(owner) {
+    if (!owner) {
+        return new Response(null, {status: 204});
+    }
+    const db = await openLibrary(owner);
+    try {
+        const sync = await requestResult(db.transaction("meta").objectStore("meta").get("sync"));
+        if (!sync || Date.now() - sync.syncedAt > (sync.retention || defaultRetention) * 1000) {
+            return new Response(null, {status: 204}); // Never stored, or deletions since then may be forgotten
+        }
+
+        let offline = false;
+        try {
+            const response = await fetch(`/quotes/changes?since=${sync.version}`, {credentials: "same-origin"});
+            if (response.status === 401) {
+                return new Response(null, {status: 401});
+            }
+            if (!response.ok) {
+                throw new Error(`Syncing quotes failed with status ${response.status}`);
+            }
+            const changes = await response.json();
+            if (changes.reset) {
+                return new Response(null, {status: 204}); // Too far behind, the page stores a fresh copy
+            }
+            await applyChanges(db, changes.quotes, changes.deletedIds, {
+                version: changes.version,
+                syncedAt: Date.now(),
+                retention: changes.retention,
+            });
+        } catch (error) {
+            offline = true; // No network: the library as of the last sync
+        }
+
+        const reading = db.transaction(["quotes", "meta"]);
+        const [quotes, current] = await Promise.all([
+            requestResult(reading.objectStore("quotes").getAll()), // Sorted by id, so in insertion order
+            requestResult(reading.objectStore("meta").get("sync")),
+        ]);
+        return new Response(JSON.stringify({version: current.version, quotes: quotes, offline: offline}), {
+            headers: {"Content-Type": "application/json"},
+        });
+    } finally {
+        db.close();
+    }
+}
+
+// Replace the stored library with the one the page loaded
+async function storeLibrary(owner, version, quotes) {
+    const db = await openLibrary(owner);
+    try {
+        const writing = db.transaction(["quotes", "meta"], "readwrite");
+        const store = writing.objectStore("quotes");
+        store.clear();
+        quotes.forEach((quote) => store.put(quote));
+        writing.objectStore("meta").put({version: version, syncedAt: Date.now(), retention: defaultRetention}, "sync");
+        await transactionDone(writing);
+    } finally {
+        db.close();
+    }
+}
+
+// An add/edit/delete of the page, applied when it directly follows the stored version (a gap is left to the next sync)
+async function applyOwnChange(message) {
+    const db = await openLibrary(message.owner);
+    try {
+        const writing = db.transaction(["quotes", "meta"], "readwrite");
+        const sync = await requestResult(writing.objectStore("meta").get("sync"));
+        if (!sync || sync.version !== message.version - 1) {
+            return;
+        }
+        if (message.deletedId) {
+            writing.objectStore("quotes").delete(message.deletedId);
+        } else {
+            writing.objectStore("quotes").put(message.quote);
+        }
+        writing.objectStore("meta").put({...sync, version: message.version}, "sync");
+        await transactionDone(writing);
+    } finally {
+        db.close();
+    }
+}
+
+// Changed quotes and tombstones of GET /quotes/changes, written with the new sync state in one transaction
+async function applyChanges(db, quotes, deletedIds, sync) {
+    const writing = db.transaction(["quotes", "meta"], "readwrite");
+    const store = writing.objectStore("quotes");
+    quotes.forEach((quote) => store.put(quote));
+    deletedIds.forEach((id) => store.delete(id));
+    writing.objectStore("meta").put(sync, "sync");
+    await transactionDone(writing);
+}
+
+function openLibrary(owner) {
+    return new Promise((resolve, reject) => {
+        const opening = indexedDB.open(databasePrefix + owner, 1);
+        opening.onupgradeneeded = () => {
+            opening.result.createObjectStore("quotes", {keyPath: "_id"});
+            opening.result.createObjectStore("meta");
+        };
+        opening.onsuccess = () => resolve(opening.result);
+        opening.onerror = () => reject(opening.error);
+    });
+}
+
+function deleteLibrary(owner) {
+    return new Promise((resolve) => {
+        const deleting = indexedDB.deleteDatabase(databasePrefix + owner);
+        deleting.onsuccess = deleting.onerror = () => resolve();
+    });
+}
+
+function requestResult(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function transactionDone(transaction) {
+    return new Promise((resolve, reject) => {
+        transaction.oncomplete = () => resolve();
+        transaction.onerror = transaction.onabort = () => reject(transaction.error);
+    });
+}
@@ -0,0 +1,152 @@
+import re
+from collections import Counter
+
+from pymongo import DeleteMany, UpdateOne
+
+from quoteUtils import QueryError
+
+# Fields completed by GET /quotes/suggest (the quote text itself is not worth suggesting)
+suggestionFields = ("bookSeries", "bookTitle", "characters", "author")
+
+# Completions returned by GET /quotes/suggest
+defaultSuggestionLimit = 10
+maxSuggestionLimit = 50
+maxPrefixLength = 100
+
+# Indexes of the suggestions collection: one entry per (user, field, value),
+# prefix lookups on the lowercased value
+suggestionIndexes = [
+    [("userEmail", 1), ("field", 1), ("value", 1)],
+    [("userEmail", 1), ("field", 1), ("key", 1)],
+]
+
+
+def parseSuggestArgs(args):
+    """Validate the query string of GET /quotes/suggest
+
+    Args:
+        args (MultiDict): request.args
+
+    Raises:
+        QueryError: One of the parameters is not valid
+
+    Returns:
+        dict: field, prefix and limit
+    """
+    field = args.get("field")
+    if field not in suggestionFields:
+        raise QueryError(f"field must be one of {', '.join(suggestionFields)}.")
+
+    prefix = args.get("prefix", "").strip()
+    if len(prefix) > maxPrefixLength:
+        raise QueryError(f"prefix can not be longer than {maxPrefixLength} characters.")
+
+    try:
+        limit = int(args.get("limit", defaultSuggestionLimit))
+    except ValueError:
+        raise QueryError("limit must be a number.")
+    if limit < 1 or limit > maxSuggestionLimit:
+        raise QueryError(f"limit must be between 1 and {maxSuggestionLimit}.")
+
+    return {"field": field, "prefix": prefix, "limit": limit}
+
+
+def findSuggestions(suggestionsCollection, userEmail, field, prefix, limit=defaultSuggestionLimit):
+    """Values of a field starting with prefix (case-insensitive), most used first
+
+    Reads the suggestions collection only: an index range scan over the lowercased values
+    of one field of one user, the quotes are not touched.
+
+    Args:
+        suggestionsCollection (Collection): Suggestions collection
+        userEmail (str): Owner of the quotes
+        field (str): One of suggestionFields
+        prefix (str): Start of the value, may be empty
+        limit (int, optional): Values returned at most. Defaults to defaultSuggestionLimit.
+
+    Returns:
+        list: [{"value": ..., "count": quotes using it}, ...]
+    """
+    # Anchored, case-sensitive regex on the lowercased value: MongoDB turns it into index bounds
+    query = {"userEmail": userEmail, "field": field, "key": {"$regex": "^" + re.escape(prefix.lower())}}
+    cursor = suggestionsCollection.find(query, {"_id": 0, "value": 1, "count": 1})
+    return list(cursor.sort([("count", -1), ("value", 1)]).limit(limit))
+
+
+def applySuggestionChanges(suggestionsCollection, userEmail, removed=(), added=()):
+    """Count the field values of removed and added quotes in or out of the suggestions
+
+    An edit is the old quote removed and the new one added; values present in both are
+    not written. Values no quote uses anymore are deleted.
+
+    Args:
+        suggestionsCollection (Collection): Suggestions collection
+        userEmail (str): Owner of the quotes
+        removed (Iterable, optional): Deleted quotes, or quotes before an edit. Defaults to ().
+        added (Iterable, optional): Inserted quotes, or quotes after an edit. Defaults to ().
+    """
+    changes = Counter()
+    for quotes, change in ((removed, -1), (added, 1)):
+        for quote in quotes:
+            for field in suggestionFields:
+                if quote.get(field):
+                    changes[(field, quote[field])] += change
+
+    operations = [
+        UpdateOne(
+            {"userEmail": userEmail, "field": field, "value": value},
+            {"$inc": {"count": change}, "$setOnInsert": {"key": value.lower()}},
+            upsert=True
+        )
+        for (field, value), change in changes.items() if change != 0
+    ]
+    if not operations:
+        return
+    if any(change < 0 for change in changes.values()):
+        operations.append(DeleteMany({"userEmail": userEmail, "count": {"$lte": 0}}))
+    suggestionsCollection.bulk_write(operations, ordered=True) # The delete has to see the decrements
+
+
+def rebuildSuggestions(quotesCollection, suggestionsCollection, userEmail=None):
+    """Count the field values again from the quotes, after bulk changes (batch, import) or for
+    quotes stored before suggestions existed
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        suggestionsCollection (Collection): Suggestions collection
+        userEmail (str, optional): Only this user, every user if None. Defaults to None.
+
+    Returns:
+        int: Suggestions written
+    """
+    scope = {"userEmail": userEmail} if userEmail is not None else {}
+    entries = []
+    for field in suggestionFields:
+        pipeline = [
+            {"$match": {**scope, field: {"$nin": [None, ""]}}},
+            {"$group": {"_id": {"userEmail": "$userEmail", "value": f"${field}"}, "count": {"$sum": 1}}},
+        ]
+        for group in quotesCollection.aggregate(pipeline):
+            value = group["_id"]["value"]
+            entries.append({
+                "userEmail": group["_id"]["userEmail"],
+                "field": field,
+                "value": value,
+                "key": value.lower(),
+                "count": group["count"],
+            })
+
+    # Absolute counts, so two processes backfilling at once write the same thing
+    if userEmail is not None:
+        suggestionsCollection.delete_many(scope) # Values no quote uses anymore go away
+    operations = [
+        UpdateOne(
+            {"userEmail": entry["userEmail"], "field": entry["field"], "value": entry["value"]},
+            {"$set": {"key": entry["key"], "count": entry["count"]}},
+            upsert=True
+        )
+        for entry in entries
+    ]
+    if operations:
+        suggestionsCollection.bulk_write(operations, ordered=False)
+    return len(entries)
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta, timezone
+
+from quoteUtils import QueryError, quoteProjection, serializeQuote
+
+# Deleted quotes are remembered this long; a client that last synced before that has to reload its library
+tombstoneRetention = timedelta(days=30)
+
+# Changed quotes sent by GET /quotes/changes at most, a client further behind reloads its library
+maxChanges = 1000
+
+# Index of the change feed: quotes and tombstones of a user by the library version that stamped them
+syncIndex = [("userEmail", 1), ("syncVersion", 1)]
+
+
+def parseChangesArgs(args):
+    """Validate the query string of GET /quotes/changes
+
+    Args:
+        args (MultiDict): request.args
+
+    Raises:
+        QueryError: since is missing or not a version
+
+    Returns:
+        int: Library version the client last synced at
+    """
+    try:
+        since = int(args.get("since", ""))
+    except ValueError:
+        raise QueryError("since must be a library version.")
+    if since < 0:
+        raise QueryError("since must be a library version.")
+    return since
+
+
+def stampQuotes(quotesCollection, quoteIds, version):
+    """Mark quotes as changed at a library version, once the change went through and bumped it
+
+    A client syncing between the write and the stamp gets the quote at its next sync, which
+    starts from the version it read (see collectChanges).
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        quoteIds (list): _id of the added or edited quotes
+        version (int): Library version after the change
+    """
+    if quoteIds and version is not None:
+        quotesCollection.update_many({"_id": {"$in": quoteIds}}, {"$set": {"syncVersion": version}})
+
+
+def recordDeletion(tombstonesCollection, userEmail, quoteId, version):
+    """Remember a deleted quote, so clients syncing later drop their copy
+
+    Args:
+        tombstonesCollection (Collection): Tombstones collection
+        userEmail (str): Owner of the quote
+        quoteId (str): Id of the deleted quote
+        version (int): Library version after the delete
+    """
+    tombstonesCollection.insert_one({
+        "userEmail": userEmail,
+        "quoteId": quoteId,
+        "syncVersion": version,
+        "deletedAt": datetime.now(timezone.utc), # Expired by the TTL index after tombstoneRetention
+    })
+
+
+def requireFullSync(userCollection, userEmail, version):
+    """Make clients that synced before version reload their library, after changes that
+    were not stamped one by one (batches)
+
+    Args:
+        userCollection (Collection): Users collection
+        userEmail (str): Owner of the library
+        version (int): Library version after the changes
+    """
+    userCollection.update_one({"email": userEmail}, {"$max": {"syncFloor": version}})
+
+
+def collectChanges(quotesCollection, tombstonesCollection, user, userEmail, since):
+    """Quotes added, edited and deleted since a library version
+
+    Changes stamped with since itself are sent again: a write that was still in flight when
+    the client last synced is not missed, and applying a change twice does nothing.
+
+    Args:
+        quotesCollection (Collection): Quotes collection
+        tombstonesCollection (Collection): Tombstones collection
+        user (dict): libraryVersion and syncFloor of the user, read before the changes
+        userEmail (str): Owner of the library
+        since (int): Library version the client last synced at
+
+    Returns:
+        dict: version, reset (the client has to reload its library), quotes and deletedIds
+    """
+    version = user.get("libraryVersion", 0)
+    reset = {"version": version, "reset": True, "quotes": [], "deletedIds": []}
+    if since > version or since < user.get("syncFloor", 0):
+        return reset # Another library (e.g. a restored database), or batch changes the feed does not list
+
+    changedQuotes = list(
+        quotesCollection.find(
+            {"userEmail": userEmail, "syncVersion": {"$gte": since}},
+            quoteProjection # Do not include user email in the returned data (security)
+        ).sort("_id", 1).limit(maxChanges + 1)
+    )
+    if len(changedQuotes) > maxChanges:
+        return reset # Reloading is cheaper than patching this many quotes
+    deletedIds = tombstonesCollection.distinct("quoteId", {"userEmail": userEmail, "syncVersion": {"$gte": since}})
+    return {
+        "version": version,
+        "reset": False,
+        "quotes": [serializeQuote(quote) for quote in changedQuotes],
+        "deletedIds": deletedIds,
+    }
@@ -1,15 +1,35 @@
 import pytest
 import json
-from app import app, characterSpamLimit # Import Flask app
+import app as appModule
+from app import app, characterSpamLimit, quoteListCache, userProfileCache # Import Flask app
+from quoteUtils import derivedFields
+from indexes import ensureIndexes, requiredIndexes
+from cache import LRUCache
+from passwords import PasswordHasher
+from database import MongoConnection, clientOptions
+from columnar import decodeColumnar
+import os
+from types import SimpleNamespace
+import threading
+import io
+import csv
+import gzip
+import quoteImport
+import assets
+import shutil
 import mongomock # import mongomock
 from bson import ObjectId
+from pymongo.errors import AutoReconnect
 import bcrypt
 from datetime import datetime, timezone
 
 @pytest.fixture
-def client():
+def client(monkeypatch):
     """Setup Flask test client with testing config
 
+    Args:
+        monkeypatch (_type_): Used to let mongomock count with a collation
+
     Yields:
         client: Flask test client
         mockDb: Mock db
@@ -24,9 +44,42 @@ def client():
     # Create a unique index for email
     mockDb["users"].create_index("email", unique=True)
     
+    # mongomock ignores the collation of find() but refuses it in count_documents(); count the same way as find()
+    countDocuments = mongomock.collection.Collection.count_documents
+    def countIgnoringCollation(self, filter, collation=None, **kwargs):
+        return countDocuments(self, filter, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, "count_documents", countIgnoringCollation)
+    
+    # Quote lists and user profiles cached by a previous test belong to another mock db
+    quoteListCache.local.clear()
+    userProfileCache.local.clear()
+    
     with app.test_client() as client:
         yield client, mockDb # Return both client and the mock database
 
+@pytest.fixture
+def reportedCollations(monkeypatch):
+    """Make mongomock report index collations like MongoDB does (it accepts them but leaves them out of index_information)"""
+    collations = {} # (collection, index name) -> collation
+    createIndex = mongomock.collection.Collection.create_index
+    indexInformation = mongomock.collection.Collection.index_information
+    
+    def recordingCreateIndex(self, keys, **kwargs):
+        name = createIndex(self, keys, **kwargs)
+        if kwargs.get("collation"):
+            collations[(self.full_name, name)] = {**kwargs["collation"], "caseLevel": False} # Defaults filled in by the server
+        return name
+    
+    def reportingIndexInformation(self):
+        information = indexInformation(self)
+        for name, index in information.items():
+            if (self.full_name, name) in collations:
+                index["collation"] = collations[(self.full_name, name)]
+        return information
+    
+    monkeypatch.setattr(mongomock.collection.Collection, "create_index", recordingCreateIndex)
+    monkeypatch.setattr(mongomock.collection.Collection, "index_information", reportingIndexInformation)
+
 def testRegisterSuccess(client):
     """Test successful registration of a user
 
@@ -168,7 +221,7 @@ def testHomeRedirectIfNotLoggedIn(client):
     assert response.location.endswith("/") # Redirects to the root
 
 def testHomeWithValidSession(client):
-    """Test that the home page is rendered for logged-in users with quotes
+    """Test that the home page shell is rendered for logged-in users and their quotes are loaded from /quotes
 
     Args:
         client (_type_): Mock db and client
@@ -180,19 +233,30 @@ def testHomeWithValidSession(client):
         session["user"] = "test@example.com"
     
     # Mock database data
+    mockDb["users"].insert_one({"email": "test@example.com", "libraryVersion": 4})
     mockDb["quotes"].insert_many([
-        {"_id": ObjectId(), "userEmail": "test@example.com", "quote": "Test Quote 1"},
-        {"_id": ObjectId(), "userEmail": "test@example.com", "quote": "Test Quote 2"},
+        {"_id": ObjectId(), "userEmail": "test@example.com", "quote": f"Test Quote {i}"} for i in range(1, 13)
     ])
     
     response = client.get("/home")
     
     # Assertions
     assert response.status_code == 200
-    # Check that quotes are passed correctly to the template
+    # The shell does not carry the library, script.js asks for its first page
     responseData = response.data.decode("utf-8")
-    assert "Test Quote 1" in responseData
-    assert "Test Quote 2" in responseData
+    assert "Test Quote 1" not in responseData
+    assert 'id="quotes-table"' in responseData
+    
+    firstPage = client.get("/quotes?limit=10&count=1").get_json()
+    assert [quote["quote"] for quote in firstPage["quotes"]] == [f"Test Quote {i}" for i in range(1, 11)]
+    assert firstPage["total"] == 12
+    assert firstPage["version"] == 4
+    
+    # Later pages come without the count
+    nextPage = client.get(f"/quotes?limit=10&cursor={firstPage['nextCursor']}").get_json()
+    assert [quote["quote"] for quote in nextPage["quotes"]] == ["Test Quote 11", "Test Quote 12"]
+    assert "total" not in nextPage
+    assert nextPage["version"] == 4
 
 def testLoginSuccess(client):
     """Test successful login of a user
@@ -558,14 +622,15 @@ def testAddQuoteDuplicate(client):
         "email": "test@example.com",
         "quotesRemaining": 10,
     })
-    mockDb["quotes"].insert_one({
+    storedQuote = {
         "userEmail": "test@example.com",
         "bookSeries": "Test Series",
         "bookTitle": "Test Book",
         "characters": "Test Character",
         "quote": "This is a test quote.",
         "author": "Test Author",
-    })
+    }
+    mockDb["quotes"].insert_one({**storedQuote, **derivedFields(storedQuote)}) # Stored like the app does
     
     # Simulate logged-in session
     with client.session_transaction() as session:
@@ -942,4 +1007,1420 @@ def testDeleteQuoteServerError(client, monkeypatch):
     
     # Assertions
     assert response.status_code == 500
-    assert responseJSON["error"] == "Something went wrong"
\ No newline at end of file
+    assert responseJSON["error"] == "Something went wrong"
+
+def testListQuotesUnauthorized(client):
+    """Test listing quotes without logging in
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    response = client.get("/quotes")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 401
+    assert responseJSON["error"] == "Unauthorized access. Please log in."
+
+def testListQuotesKeysetPaging(client):
+    """Test walking through a sorted library page by page with the returned cursor
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Mock database data (two quotes share the same author to exercise the _id tie-breaker)
+    authors = ["Bravo", "alpha", "Delta", "Bravo", "charlie"]
+    mockDb["quotes"].insert_many([
+        {"userEmail": "test@example.com", "bookTitle": f"Book {i}", "quote": f"Quote {i}", "author": author}
+        for i, author in enumerate(authors)
+    ])
+    mockDb["quotes"].insert_one({"userEmail": "other@example.com", "bookTitle": "Other", "quote": "Other", "author": "Aaron"})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # Walk through all pages
+    seenAuthors = []
+    cursor = None
+    while True:
+        url = "/quotes?limit=2&sortField=author&sortOrder=desc" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        responseJSON = response.get_json()
+        assert response.status_code == 200
+        assert all("userEmail" not in quote for quote in responseJSON["quotes"])
+        seenAuthors += [quote["author"] for quote in responseJSON["quotes"]]
+        cursor = responseJSON["nextCursor"]
+        if not cursor:
+            break
+    
+    # Assertions
+    assert len(seenAuthors) == len(authors) # Every quote exactly once, other users excluded
+    assert sorted(seenAuthors) == sorted(authors)
+    assert seenAuthors == sorted(seenAuthors, reverse=True)
+
+def testListQuotesSearch(client):
+    """Test filtering the listing by a search term on a given field
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Mock database data
+    mockDb["quotes"].insert_many([
+        {"userEmail": "test@example.com", "bookTitle": "Dune", "quote": "Fear is the mind-killer.", "author": "Frank Herbert"},
+        {"userEmail": "test@example.com", "bookTitle": "Emma", "quote": "A mind lively and at ease.", "author": "Jane Austen"},
+        {"userEmail": "test@example.com", "bookTitle": "Mindset", "quote": "Becoming is better than being.", "author": "Carol Dweck"},
+    ])
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # Search a single field
+    response = client.get("/quotes?search=MIND&searchField=quote")
+    responseJSON = response.get_json()
+    assert response.status_code == 200
+    assert {quote["bookTitle"] for quote in responseJSON["quotes"]} == {"Dune", "Emma"}
+    
+    # Search every field (regex characters are matched literally)
+    response = client.get("/quotes?search=mind&searchField=global")
+    assert len(response.get_json()["quotes"]) == 3
+    response = client.get("/quotes?search=.*")
+    assert response.get_json()["quotes"] == []
+
+def testListQuotesInvalidParameters(client):
+    """Test listing quotes with invalid paging and sorting parameters
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # Assertions
+    assert client.get("/quotes?limit=0").status_code == 400
+    assert client.get("/quotes?limit=abc").status_code == 400
+    assert client.get("/quotes?sortField=userEmail").get_json()["error"] == "Unknown sort field."
+    assert client.get("/quotes?sortOrder=up").status_code == 400
+    assert client.get("/quotes?searchField=password").status_code == 400
+    assert client.get("/quotes?cursor=not-a-cursor").get_json()["error"] == "Invalid cursor."
+
+def testQuoteMutationsDeltaMode(client):
+    """Test that add, edit and delete only return the affected quote and a growing library version in delta mode
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user and a quote that should not be sent back
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10, "totalQuotes": 100})
+    mockDb["quotes"].insert_one({"userEmail": "test@example.com", "bookTitle": "Old Book", "quote": "Old quote", "author": "Old Author"})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # Add
+    quoteData = {
+        "bookSeries": "Test Series",
+        "bookTitle": "Test Book",
+        "characters": "Test Character",
+        "quote": "This is a test quote.",
+        "author": "Test Author",
+    }
+    response = client.post("/add-quote?delta=1", data=json.dumps(quoteData), content_type="application/json")
+    responseJSON = response.get_json()
+    assert response.status_code == 200
+    assert "quotes" not in responseJSON
+    assert responseJSON["quote"]["quote"] == "This is a test quote."
+    assert "userEmail" not in responseJSON["quote"]
+    assert responseJSON["version"] == 1
+    quoteId = responseJSON["quote"]["_id"]
+    
+    # A rejected duplicate changes nothing, so the next change follows on from version 1
+    response = client.post("/add-quote?delta=1", data=json.dumps(quoteData), content_type="application/json")
+    assert response.status_code == 400
+    assert mockDb["users"].find_one({"email": "test@example.com"})["libraryVersion"] == 1
+    
+    # Edit
+    quoteData["quote"] = "Edited quote."
+    response = client.put(f"/edit-quote/{quoteId}?delta=1", data=json.dumps(quoteData), content_type="application/json")
+    responseJSON = response.get_json()
+    assert response.status_code == 200
+    assert responseJSON["quote"]["_id"] == quoteId
+    assert responseJSON["quote"]["quote"] == "Edited quote."
+    assert "userEmail" not in responseJSON["quote"]
+    assert responseJSON["version"] == 2
+    
+    # Delete
+    response = client.delete(f"/delete-quote/{quoteId}?delta=1")
+    responseJSON = response.get_json()
+    assert response.status_code == 200
+    assert responseJSON == {"message": "Quote deleted successfully!", "deletedId": quoteId, "version": 3}
+    assert mockDb["users"].find_one({"email": "test@example.com"})["quotesRemaining"] == 10
+
+def testHomeEmbedsLibraryVersion(client):
+    """Test that the home page passes the library version to the client
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user whose library has been changed 7 times
+    mockDb["users"].insert_one({"email": "test@example.com", "libraryVersion": 7})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    response = client.get("/home")
+    
+    # Assertions
+    assert response.status_code == 200
+    assert 'data-version="7"' in response.data.decode("utf-8")
+
+def testEnsureIndexesIsIdempotent(client, reportedCollations):
+    """Test that the required indexes are created once and left alone afterwards
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # The fixture already created the unique email index
+    report = ensureIndexes(mockDb)
+    declared = [f"{name}.{spec['name']}" for name, specs in requiredIndexes.items() for spec in specs]
+    assert sorted(report["created"]) == sorted(label for label in declared if label != "users.email_1")
+    assert report["drifted"] == [] and report["unmanaged"] == []
+    
+    # Second run has nothing to do
+    report = ensureIndexes(mockDb)
+    assert report == {"created": [], "drifted": [], "unmanaged": []}
+    assert mockDb["users"].index_information()["email_1"]["unique"]
+
+def testEnsureIndexesReportsDrift(client, reportedCollations):
+    """Test that indexes differing from the declaration or not declared at all are reported, not dropped
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # A non-unique email index, a sort index without its collation and a hand-made index
+    otherDb = mongomock.MongoClient()["quote-base"]
+    otherDb["users"].create_index("email")
+    otherDb["quotes"].create_index([("userEmail", 1), ("author", 1), ("_id", 1)])
+    otherDb["quotes"].create_index("quote")
+    
+    report = ensureIndexes(otherDb)
+    
+    # Assertions
+    assert report["drifted"] == ["users.email_1", "quotes.userEmail_1_author_1__id_1"]
+    assert report["unmanaged"] == ["quotes.quote_1"]
+    assert "quote_1" in otherDb["quotes"].index_information()
+
+def testIndexesCreatedBeforeFirstRequest(client):
+    """Test that the quotes indexes exist once the app served a request
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    client.get("/")
+    
+    # Assertions
+    assert "userEmail_1_author_1__id_1" in mockDb["quotes"].index_information()
+
+def testAddQuoteNormalisedDuplicate(client):
+    """Test that a quote differing only in case and spacing is rejected as a duplicate
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    quoteData = {
+        "bookSeries": "Test Series",
+        "bookTitle": "Test Book",
+        "characters": "Test Character",
+        "quote": "This is a test quote.",
+        "author": "Test Author",
+    }
+    response = client.post("/add-quote", data=json.dumps(quoteData), content_type="application/json")
+    assert response.status_code == 200
+    assert "fingerprint" not in response.get_json()["quotes"][0]
+    
+    # Same quote, different spacing and capitalisation
+    quoteData["quote"] = "this  is a TEST quote."
+    response = client.post("/add-quote", data=json.dumps(quoteData), content_type="application/json")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 400
+    assert responseJSON["error"] == "Duplicate quote detected."
+    assert mockDb["quotes"].count_documents({"userEmail": "test@example.com"}) == 1
+    assert mockDb["users"].find_one({"email": "test@example.com"})["quotesRemaining"] == 9 # Not charged twice
+
+def testEditQuoteIntoDuplicate(client):
+    """Test that editing a quote into the copy of another quote is rejected
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # Add two quotes
+    firstQuote = {"bookSeries": "Series", "bookTitle": "Book", "characters": "Hero", "quote": "First quote", "author": "Author"}
+    secondQuote = dict(firstQuote, quote="Second quote")
+    client.post("/add-quote", data=json.dumps(firstQuote), content_type="application/json")
+    response = client.post("/add-quote?delta=1", data=json.dumps(secondQuote), content_type="application/json")
+    secondId = response.get_json()["quote"]["_id"]
+    
+    # Turn the second quote into the first one
+    response = client.put(f"/edit-quote/{secondId}", data=json.dumps(firstQuote), content_type="application/json")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 400
+    assert responseJSON["error"] == "Duplicate quote detected."
+    assert mockDb["quotes"].find_one({"_id": ObjectId(secondId)})["quote"] == "Second quote"
+    
+    # Neither a rejected edit nor a missing quote changes the library version
+    response = client.put(f"/edit-quote/{ObjectId()}", data=json.dumps(firstQuote), content_type="application/json")
+    assert response.status_code == 404
+    assert mockDb["users"].find_one({"email": "test@example.com"})["libraryVersion"] == 2
+    
+    # Saving a quote without changes is not a duplicate of itself
+    response = client.put(f"/edit-quote/{secondId}", data=json.dumps(secondQuote), content_type="application/json")
+    assert response.status_code == 200
+
+def testSearchQuotesRanked(client):
+    """Test that search hits are ranked by field weight and number of matching words
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # Add quotes through the API so their search terms are maintained
+    quotes = [
+        {"bookSeries": "", "bookTitle": "Winter Tales", "characters": "", "quote": "Nothing here.", "author": "Anon"},
+        {"bookSeries": "", "bookTitle": "Summer", "characters": "", "quote": "Winter is coming.", "author": "George Martin"},
+        {"bookSeries": "", "bookTitle": "Winter", "characters": "", "quote": "Winter is coming.", "author": "George Martin"},
+        {"bookSeries": "", "bookTitle": "Autumn", "characters": "", "quote": "Leaves fall.", "author": "Anon"},
+    ]
+    for quoteData in quotes:
+        client.post("/add-quote", data=json.dumps(quoteData), content_type="application/json")
+    
+    response = client.get("/quotes/search?q=WINTER coming")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 200
+    assert responseJSON["total"] == 3
+    assert [quote["bookTitle"] for quote in responseJSON["quotes"]] == ["Winter", "Winter Tales", "Summer"]
+    assert all("searchTerms" not in quote and "userEmail" not in quote and "score" not in quote for quote in responseJSON["quotes"])
+    
+    # Paging, the total still counts every hit
+    response = client.get("/quotes/search?q=winter&limit=2")
+    responseJSON = response.get_json()
+    assert [quote["bookTitle"] for quote in responseJSON["quotes"]] == ["Winter", "Winter Tales"]
+    assert responseJSON["total"] == 3
+    assert responseJSON["hasMore"] is True
+    response = client.get("/quotes/search?q=winter&limit=2&page=2")
+    responseJSON = response.get_json()
+    assert [quote["bookTitle"] for quote in responseJSON["quotes"]] == ["Summer"]
+    assert responseJSON["total"] == 3
+    assert responseJSON["hasMore"] is False
+
+def testSearchQuotesFieldScoped(client):
+    """Test that a field scoped search ignores matches in other fields, including legacy quotes
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Quotes stored before search terms existed get them from the backfill command
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    mockDb["quotes"].insert_many([
+        {"userEmail": "test@example.com", "bookTitle": "The Hobbit", "quote": "In a hole in the ground.", "author": "J.R.R. Tolkien"},
+        {"userEmail": "other@example.com", "bookTitle": "The Hobbit", "quote": "In a hole.", "author": "Tolkien"},
+    ])
+    app.test_cli_runner().invoke(args=["backfill"])
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # A quote mentioning the author in another field
+    quoteData = {"bookSeries": "", "bookTitle": "Tolkien and Me", "characters": "", "quote": "A memoir.", "author": "Someone"}
+    client.post("/add-quote", data=json.dumps(quoteData), content_type="application/json")
+    
+    response = client.get("/quotes/search?q=tolkien&searchField=author")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 200
+    assert [quote["bookTitle"] for quote in responseJSON["quotes"]] == ["The Hobbit"]
+    assert responseJSON["total"] == 1
+    assert client.get("/quotes/search?q=   ").status_code == 400
+    assert client.get("/quotes/search?q=tolkien&searchField=userEmail").status_code == 400
+
+def testBackfillCommand(client):
+    """Test that the backfill command derives the fields of legacy quotes and reports the duplicates it can not fingerprint
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    ensureIndexes(mockDb)
+    
+    # Two legacy copies of the same quote
+    legacyQuote = {"userEmail": "test@example.com", "bookTitle": "The Hobbit", "quote": "In a hole.", "author": "Tolkien"}
+    firstId = mockDb["quotes"].insert_one(dict(legacyQuote)).inserted_id
+    secondId = mockDb["quotes"].insert_one(dict(legacyQuote)).inserted_id
+    
+    result = app.test_cli_runner().invoke(args=["backfill"])
+    assert "Updated: 3, duplicates left without a fingerprint: 1" in result.output
+    assert f"duplicate quote {secondId}" in result.output
+    assert "fingerprint" in mockDb["quotes"].find_one({"_id": firstId})
+    assert "searchTerms" in mockDb["quotes"].find_one({"_id": secondId})
+    
+    # Requests never scan for legacy quotes
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    mockDb["quotes"].insert_one({**legacyQuote, "quote": "Not backfilled"})
+    client.get("/quotes")
+    assert "searchTerms" not in mockDb["quotes"].find_one({"quote": "Not backfilled"})
+
+def testLoginRehashesOutdatedPassword(client):
+    """Test that a password hashed with another work factor is rehashed with the configured one at login
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Add a mock user whose hash uses a cheaper work factor than the configured one
+    oldHash = bcrypt.hashpw("password123".encode("utf-8"), bcrypt.gensalt(4)).decode("utf-8")
+    mockDb["users"].insert_one({"email": "test@example.com", "password": oldHash})
+    
+    response = client.post(
+        "/login",
+        data=json.dumps({"email": "test@example.com", "password": "password123"}),
+        content_type="application/json"
+    )
+    newHash = mockDb["users"].find_one({"email": "test@example.com"})["password"]
+    
+    # Assertions
+    assert response.status_code == 200
+    assert newHash != oldHash
+    assert int(newHash.split("$")[2]) == appModule.passwordHasher.rounds
+    assert bcrypt.checkpw("password123".encode("utf-8"), newHash.encode("utf-8"))
+    assert not appModule.passwordHasher.needsRehash(newHash)
+
+def testLoginRejectedWhenPasswordPoolIsFull(client, monkeypatch):
+    """Test that logins beyond the password pool capacity are turned away instead of queued
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # A pool with a single worker and no queue, kept busy by a verification that waits for an event
+    hasher = PasswordHasher(rounds=4, maxWorkers=1, queueLimit=0)
+    monkeypatch.setattr(appModule, "passwordHasher", hasher)
+    release = threading.Event()
+    blockingJob = threading.Thread(target=hasher._run, args=("verify", release.wait))
+    blockingJob.start()
+    while hasher._slots is None or hasher._slots._value != 0: # Wait until the job took the only slot
+        pass
+    
+    mockDb["users"].insert_one({"email": "test@example.com", "password": "hashedPass"})
+    response = client.post(
+        "/login",
+        data=json.dumps({"email": "test@example.com", "password": "password123"}),
+        content_type="application/json"
+    )
+    release.set()
+    blockingJob.join()
+    
+    # Assertions
+    assert response.status_code == 503
+    assert response.get_json()["error"] == "Server is busy. Please try again in a moment."
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["completed"] == 1
+
+def testQuoteListCacheFollowsMutations(client):
+    """Test that the quote list is served from the cache and kept current by add, edit and delete
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    # First read fills the cache, the second one is a hit
+    appModule.getUserQuotes("test@example.com", 0)
+    hitsBefore = quoteListCache.stats()["hits"]
+    appModule.getUserQuotes("test@example.com", 0)
+    assert quoteListCache.stats()["hits"] == hitsBefore + 1
+    
+    # Mutations update the cached list in place, the database is not read again
+    quoteData = {"bookSeries": "S", "bookTitle": "Book", "characters": "C", "quote": "Cached quote", "author": "A"}
+    response = client.post("/add-quote", data=json.dumps(quoteData), content_type="application/json")
+    quoteId = response.get_json()["quotes"][0]["_id"]
+    quoteData["quote"] = "Edited cached quote"
+    response = client.put(f"/edit-quote/{quoteId}", data=json.dumps(quoteData), content_type="application/json")
+    assert [quote["quote"] for quote in response.get_json()["quotes"]] == ["Edited cached quote"]
+    assert quoteListCache.get("test@example.com", 2)[0]["quote"] == "Edited cached quote"
+    
+    # A change made by another process (version bumped without this cache knowing) is not hidden by the cache
+    mockDb["quotes"].insert_one({"userEmail": "test@example.com", "bookTitle": "Other", "quote": "From elsewhere", "author": "B"})
+    mockDb["users"].update_one({"email": "test@example.com"}, {"$inc": {"libraryVersion": 1}})
+    response = client.delete(f"/delete-quote/{quoteId}")
+    assert [quote["quote"] for quote in response.get_json()["quotes"]] == ["From elsewhere"]
+    version = mockDb["users"].find_one({"email": "test@example.com"})["libraryVersion"]
+    assert [quote["quote"] for quote in appModule.getUserQuotes("test@example.com", version)] == ["From elsewhere"]
+
+def testLRUCacheEvictionAndExpiry(client):
+    """Test that the LRU cache evicts the least recently used entry and expires old entries
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    lruCache = LRUCache(maxEntries=2, ttl=60)
+    lruCache.set("a", 1)
+    lruCache.set("b", 2)
+    lruCache.get("a") # "b" is now the least recently used
+    lruCache.set("c", 3)
+    
+    # Assertions
+    assert lruCache.get("b") is None
+    assert lruCache.get("a") == 1 and lruCache.get("c") == 3
+    assert lruCache.stats()["evictions"] == 1
+    
+    expiringCache = LRUCache(maxEntries=2, ttl=0)
+    expiringCache.set("a", 1)
+    assert expiringCache.get("a") is None
+    assert expiringCache.stats()["expirations"] == 1
+
+def testInternalStatsOnlyFromLoopback(client):
+    """Test that cache and password pool counters are only served to local requests
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    response = client.get("/internal/stats")
+    assert response.status_code == 200
+    assert {"hits", "misses", "evictions"} <= set(response.get_json()["quoteListCache"])
+    assert "waitSeconds" in response.get_json()["passwordHasher"]
+    
+    response = client.get("/internal/stats", environ_base={"REMOTE_ADDR": "203.0.113.5"})
+    assert response.status_code == 404
+
+def testHomeConditionalGet(client, monkeypatch):
+    """Test that /home answers 304 to an up to date browser without touching the quotes
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    response = client.get("/home")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    
+    # Unchanged library: 304 and the quotes are not fetched
+    def failIfCalled(*args, **kwargs):
+        raise AssertionError("Quotes should not be fetched")
+    monkeypatch.setattr(appModule, "getUserQuotes", failIfCalled)
+    response = client.get("/home", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    monkeypatch.undo()
+    
+    # Any mutation changes the ETag
+    quoteData = {"bookSeries": "S", "bookTitle": "Book", "characters": "C", "quote": "New quote", "author": "A"}
+    client.post("/add-quote", data=json.dumps(quoteData), content_type="application/json")
+    response = client.get("/home", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    
+    # Another account with the same library version does not share the ETag
+    mockDb["users"].insert_one({"email": "other@example.com", "libraryVersion": 1})
+    with client.session_transaction() as session:
+        session["user"] = "other@example.com"
+    response = client.get("/home", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+
+def testGetQuoteLimitConditionalGet(client):
+    """Test that /get-quote-limit answers 304 until the quota changes
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Mock user data
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 73, "totalQuotes": 100})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    etag = client.get("/get-quote-limit").headers["ETag"]
+    response = client.get("/get-quote-limit", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    
+    # Quota used up by an add in another process, seen once the cached profile expires
+    mockDb["users"].update_one({"email": "test@example.com"}, {"$inc": {"quotesRemaining": -1}})
+    userProfileCache.invalidate("test@example.com")
+    response = client.get("/get-quote-limit", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.get_json()["remainingQuotes"] == 72
+
+def testImportQuotesNdjson(client):
+    """Test an NDJSON import mixing valid, invalid and duplicate rows
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    lines = [
+        json.dumps({"bookTitle": "Book 1", "quote": "Quote 1", "author": "Author 1"}),
+        json.dumps({"bookTitle": "Book 2", "quote": "Quote 2"}), # Missing author
+        "{not json",
+        "",
+        json.dumps({"bookTitle": "Book 1", "quote": "QUOTE  1", "author": "Author 1"}), # Duplicate of row 1
+        json.dumps({"bookTitle": "Book 3", "quote": "x" * (characterSpamLimit + 1), "author": "Author 3"}),
+        json.dumps({"bookTitle": "Book 4", "quote": "Quote 4", "author": "Author 4"}),
+    ]
+    response = client.post("/quotes/import?format=ndjson", data="\n".join(lines), content_type="application/x-ndjson")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 200
+    assert responseJSON["imported"] == 2
+    assert responseJSON["failed"] == 4
+    assert [error["row"] for error in responseJSON["errors"]] == [2, 3, 5, 6]
+    assert responseJSON["errors"][2]["error"] == "Duplicate quote detected."
+    storedQuote = mockDb["quotes"].find_one({"bookTitle": "Book 4"})
+    assert storedQuote["bookSeries"] == "Book 4" # Same defaults as the quote forms
+    assert storedQuote["characters"] == "Author 4"
+    user = mockDb["users"].find_one({"email": "test@example.com"})
+    assert user["quotesRemaining"] == 8
+    assert user["libraryVersion"] == responseJSON["version"]
+
+def testImportQuotesCsvUpToQuota(client):
+    """Test that a CSV upload only imports as many quotes as the quota allows
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 3})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    rows = ["bookSeries,bookTitle,characters,quote,author"]
+    rows += [f"Series,Book {i},Character,\"Quote {i}, with a comma\",Author" for i in range(5)]
+    upload = (io.BytesIO("\r\n".join(rows).encode("utf-8-sig")), "quotes.csv")
+    response = client.post("/quotes/import", data={"file": upload}, content_type="multipart/form-data")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 200
+    assert responseJSON["imported"] == 3
+    assert responseJSON["errors"] == [
+        {"row": 4, "error": "Quote limit reached. Upgrade to add more quotes."},
+        {"row": 5, "error": "Quote limit reached. Upgrade to add more quotes."},
+    ]
+    assert mockDb["quotes"].find_one({"bookTitle": "Book 0"})["quote"] == "Quote 0, with a comma"
+    assert mockDb["users"].find_one({"email": "test@example.com"})["quotesRemaining"] == 0
+
+def testImportQuotesJsonArray(client, monkeypatch):
+    """Test the incremental JSON array parser across read boundaries and in small batches
+
+    Args:
+        client (_type_): Mock db and client
+        monkeypatch (_type_): Used to shrink read chunks and batches
+    """
+    client, mockDb = client # Unpack client and mock database
+    monkeypatch.setattr(quoteImport, "readChunkSize", 7)
+    monkeypatch.setattr(quoteImport, "importBatchSize", 2)
+    
+    # Insert a user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    quotes = [{"bookTitle": f"Book {i}", "quote": f"Quote {i}", "author": "Author"} for i in range(5)]
+    quotes.insert(2, 42) # Not a quote object
+    response = client.post("/quotes/import", data=json.dumps(quotes), content_type="application/json")
+    responseJSON = response.get_json()
+    
+    # Assertions
+    assert response.status_code == 200
+    assert responseJSON["imported"] == 5
+    assert responseJSON["errors"] == [{"row": 3, "error": "Quote must be an object."}]
+    assert mockDb["quotes"].count_documents({"userEmail": "test@example.com"}) == 5
+    
+    # Truncated file: rows before the error are kept
+    response = client.post("/quotes/import", data='[{"bookTitle": "Book 9", "quote": "Quote 9", "author": "A"}, {"bo', content_type="application/json")
+    responseJSON = response.get_json()
+    assert responseJSON["imported"] == 1
+    assert responseJSON["errors"] == [{"row": 2, "error": "Invalid JSON."}]
+    
+    # A failing insert (lost connection) gives the reserved quota back
+    def lostConnection(self, *args, **kwargs):
+        raise AutoReconnect("connection lost")
+    with monkeypatch.context() as patch:
+        patch.setattr(mongomock.collection.Collection, "insert_many", lostConnection)
+        response = client.post("/quotes/import", data=json.dumps([{"bookTitle": "Book 10", "quote": "Quote 10", "author": "A"}]), content_type="application/json")
+    assert response.status_code == 500
+    assert mockDb["users"].find_one({"email": "test@example.com"})["quotesRemaining"] == 4
+    
+    # Unknown format
+    response = client.post("/quotes/import", data="quotes", content_type="text/plain")
+    assert response.status_code == 400
+
+def testExportQuotesFormats(client):
+    """Test that the library is exported in every format and can be imported back
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user and quotes, one of another user
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    for i in range(3):
+        storedQuote = {
+            "userEmail": "test@example.com", "bookSeries": "Series", "bookTitle": f"Book {i}", "characters": "Character",
+            "quote": f'Quote {i}, "quoted"', "author": "Author", "createdAt": datetime.now(timezone.utc)
+        }
+        mockDb["quotes"].insert_one({**storedQuote, **derivedFields(storedQuote)}) # Stored like the app does
+    mockDb["quotes"].insert_one({"userEmail": "other@example.com", "bookTitle": "Other", "quote": "Other", "author": "Other"})
+    
+    # Not logged in
+    assert client.get("/quotes/export").status_code == 401
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    response = client.get("/quotes/export?format=ndjson")
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers["Content-Disposition"] == 'attachment; filename="quotes.ndjson"'
+    exported = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [quote["bookTitle"] for quote in exported] == ["Book 0", "Book 1", "Book 2"]
+    assert "userEmail" not in exported[0]
+    
+    response = client.get("/quotes/export?format=json&gzip=1")
+    assert response.mimetype == "application/gzip"
+    assert len(json.loads(gzip.decompress(response.get_data()))) == 3
+    
+    # CSV export goes back in through the import (duplicates of the existing quotes)
+    csvExport = client.get("/quotes/export?format=csv").get_data()
+    assert csvExport.splitlines()[0] == b"_id,bookSeries,bookTitle,characters,quote,author,createdAt,updatedAt"
+    response = client.post("/quotes/import?format=csv", data=csvExport, content_type="text/csv")
+    assert response.get_json()["errors"][0] == {"row": 1, "error": "Duplicate quote detected."}
+    assert response.get_json()["failed"] == 3
+    
+    # Cells a spreadsheet would run as formulas are exported as text, and imported back unchanged
+    formula = {"bookSeries": "", "bookTitle": "=HYPERLINK(\"http://evil\")", "characters": "@SUM(A1)", "quote": "-1+2", "author": "+Author"}
+    client.post("/add-quote", data=json.dumps(formula), content_type="application/json")
+    rows = list(csv.DictReader(io.StringIO(client.get("/quotes/export?format=csv").get_data(as_text=True))))
+    assert rows[-1]["bookTitle"] == "'=HYPERLINK(\"http://evil\")"
+    assert (rows[-1]["characters"], rows[-1]["quote"], rows[-1]["author"]) == ("'@SUM(A1)", "'-1+2", "'+Author")
+    assert rows[0]["quote"] == 'Quote 0, "quoted"'
+    records = list(quoteImport.iterCsv(io.StringIO(client.get("/quotes/export?format=csv").get_data(as_text=True))))
+    assert {field: records[-1][1][field] for field in formula} == formula
+    
+    # Unknown format
+    assert client.get("/quotes/export?format=xml").status_code == 400
+
+def testParallelAddsNeverOverdrawQuota(client):
+    """Test that parallel adds against one account never take more quotes than the quota holds
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user with fewer quotes left than the adds about to be sent
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 5})
+    client.get("/") # Build the indexes before the threads start
+    
+    statuses = []
+    startLine = threading.Barrier(20)
+    
+    def addQuote(i):
+        with app.test_client() as threadClient:
+            with threadClient.session_transaction() as session:
+                session["user"] = "test@example.com"
+            quoteData = {"bookTitle": f"Book {i}", "quote": f"Quote {i}", "author": "Author"}
+            startLine.wait()
+            response = threadClient.post("/add-quote?delta=1", data=json.dumps(quoteData), content_type="application/json")
+            statuses.append(response.status_code)
+    
+    threads = [threading.Thread(target=addQuote, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    # Assertions
+    assert sorted(statuses) == [200] * 5 + [403] * 15
+    assert mockDb["quotes"].count_documents({"userEmail": "test@example.com"}) == 5
+    assert mockDb["users"].find_one({"email": "test@example.com"})["quotesRemaining"] == 0
+
+def testBatchQuotesMixedOperations(client, monkeypatch):
+    """Test a batch mixing adds, edits, deletes and filter operations, with per-operation results
+
+    Args:
+        client (_type_): Mock db and client
+        monkeypatch (_type_): Used to make the bulk write fail
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user with two quotes left and a small library
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 2, "libraryVersion": 4})
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    quoteIds = []
+    for i, author in enumerate(["Old Name", "Old Name", "Other", "Other"]):
+        quoteData = {"bookTitle": f"Book {i}", "quote": f"Quote {i}", "author": author}
+        mockDb["users"].update_one({"email": "test@example.com"}, {"$inc": {"quotesRemaining": 1}})
+        quoteIds.append(client.post("/add-quote?delta=1", data=json.dumps(quoteData), content_type="application/json").get_json()["quote"]["_id"])
+    
+    operations = [
+        {"op": "updateWhere", "where": {"author": "Old Name"}, "set": {"author": "New Name"}},
+        {"op": "delete", "id": quoteIds[2]},
+        {"op": "edit", "id": quoteIds[2], "quote": {"bookTitle": "B", "quote": "Q", "author": "A"}}, # Already deleted above
+        {"op": "add", "quote": {"bookTitle": "Book 5", "quote": "Quote 5", "author": "Author"}},
+        {"op": "add", "quote": {"bookTitle": "Book 6", "quote": "Quote 6", "author": "Author"}},
+        {"op": "add", "quote": {"bookTitle": "Book 7", "quote": "Quote 7", "author": "Author"}}, # Over the quota (deletes credit it afterwards)
+        {"op": "add", "quote": {"bookTitle": "Book 3", "quote": "Quote 3", "author": "Other"}}, # Duplicate
+        {"op": "edit", "id": "not-an-id", "quote": {"bookTitle": "B", "quote": "Q", "author": "A"}},
+        {"op": "add", "quote": {"bookTitle": "", "quote": "Q", "author": "A"}},
+        {"op": "rename"},
+    ]
+    response = client.post("/quotes/batch?delta=1", data=json.dumps({"operations": operations}), content_type="application/json")
+    responseJSON = response.get_json()
+    results = responseJSON["results"]
+    
+    # Assertions
+    assert response.status_code == 200
+    assert "quotes" not in responseJSON
+    assert results[0] == {"index": 0, "status": "ok", "matched": 2, "failed": 0}
+    assert results[1] == {"index": 1, "status": "ok", "id": quoteIds[2]}
+    assert results[2]["error"] == "Quote is changed by another operation of this batch."
+    assert results[3]["status"] == results[4]["status"] == "ok"
+    assert results[5]["error"] == "Quote limit reached. Upgrade to add more quotes."
+    assert results[6]["error"] == "Duplicate quote detected."
+    assert results[7]["error"] == "Quote not found or unauthorized"
+    assert results[8]["error"] == "Book title, quote, and author are mandatory fields."
+    assert results[9]["status"] == "error"
+    
+    assert mockDb["quotes"].count_documents({"userEmail": "test@example.com", "author": "New Name"}) == 2
+    renamed = mockDb["quotes"].find_one({"_id": ObjectId(quoteIds[0])})
+    assert "author:new" in renamed["searchTerms"] # Derived fields follow the change
+    assert mockDb["quotes"].count_documents({"userEmail": "test@example.com"}) == 5 # 4 - 1 + 2
+    user = mockDb["users"].find_one({"email": "test@example.com"})
+    assert user["quotesRemaining"] == 1 # 2 - 2 added + 1 deleted
+    assert user["libraryVersion"] == responseJSON["version"] > 8
+    
+    # A failing bulk write (lost connection) gives the quota reserved for the adds back
+    def lostConnection(self, *args, **kwargs):
+        raise AutoReconnect("connection lost")
+    operations = [{"op": "add", "quote": {"bookTitle": "Book 8", "quote": "Quote 8", "author": "Author"}}]
+    with monkeypatch.context() as patch:
+        patch.setattr(mongomock.collection.Collection, "bulk_write", lostConnection)
+        response = client.post("/quotes/batch", data=json.dumps({"operations": operations}), content_type="application/json")
+    assert response.status_code == 500
+    assert mockDb["users"].find_one({"email": "test@example.com"})["quotesRemaining"] == 1
+    
+    # Invalid envelope
+    response = client.post("/quotes/batch", data=json.dumps({"operations": []}), content_type="application/json")
+    assert response.status_code == 400
+
+def testMongoConnectionPerProcessAndPoolStats(client, monkeypatch):
+    """Test that a forked process gets its own client and that pool events are counted
+
+    Args:
+        client (_type_): Mock db and client
+        monkeypatch (_type_): Used to fake a fork
+    """
+    clients = []
+    
+    def clientFactory(uri, **options):
+        clients.append(options)
+        return mongomock.MongoClient()
+    
+    connection = MongoConnection(options=clientOptions({"MONGO_MAX_POOL_SIZE": "20", "MONGO_WAIT_QUEUE_TIMEOUT_MS": ""}), clientFactory=clientFactory)
+    assert clients == [] # Nothing is created at import time
+    
+    db = connection.database("quote-base")
+    db["quotes"].insert_one({"quote": "Quote"})
+    assert db["quotes"].count_documents({}) == 1
+    assert len(clients) == 1
+    assert clients[0]["maxPoolSize"] == 20 and "waitQueueTimeoutMS" not in clients[0]
+    assert clients[0]["event_listeners"] == [connection.poolStats, connection.commandStats]
+    
+    # Pool events of a checkout that waited, then went back to the pool
+    connection.poolStats.connection_check_out_started(None)
+    connection.poolStats.connection_checked_out(None)
+    assert connection.stats()["pool"]["inUse"] == 1
+    connection.poolStats.connection_checked_in(None)
+    connection.poolStats.connection_check_out_failed(None)
+    pool = connection.stats()["pool"]
+    assert pool["checkouts"] == 1 and pool["inUse"] == 0 and pool["maxInUse"] == 1 and pool["checkoutFailures"] == 1
+    
+    # A worker forked from this process builds its own client on first use
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    db["quotes"].count_documents({})
+    assert len(clients) == 2
+    assert connection.stats()["pool"]["checkouts"] == 0
+
+def testMetricsEndpoint(client, monkeypatch):
+    """Test that route, MongoDB and bcrypt timings are exposed in Prometheus text format
+
+    Args:
+        client (_type_): Mock db and client
+        monkeypatch (_type_): Used to set a scraper token
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    def metricValue(text, series):
+        # Value of one series in the exposition text, 0 if not there yet
+        for line in text.splitlines():
+            if line.startswith(series + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0
+    
+    notFound = 'quotebase_http_requests_total{method="DELETE",route="/delete-quote/<quoteId>",status="404"}'
+    errors = 'quotebase_http_request_errors_total{method="DELETE",route="/delete-quote/<quoteId>"}'
+    count = 'quotebase_http_request_duration_seconds_count{method="DELETE",route="/delete-quote/<quoteId>"}'
+    before = client.get("/metrics").get_data(as_text=True) # Other tests share the process counters
+    
+    # A route with an id in its path and a failing one
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    client.delete(f"/delete-quote/{ObjectId()}")
+    client.delete("/delete-quote/not-an-id")
+    
+    # Command events as sent by pymongo (mongomock does not send any)
+    commandStats = appModule.mongoConnection.commandStats
+    commandStats.started(SimpleNamespace(command_name="find", command={"find": "quotes"}, request_id=1))
+    commandStats.failed(SimpleNamespace(command_name="find", duration_micros=1500, request_id=1))
+    
+    response = client.get("/metrics")
+    text = response.get_data(as_text=True)
+    
+    # Assertions
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert '# TYPE quotebase_http_request_duration_seconds histogram' in text
+    assert metricValue(text, notFound) - metricValue(before, notFound) == 1
+    assert metricValue(text, errors) - metricValue(before, errors) == 1
+    assert metricValue(text, count) - metricValue(before, count) == 2
+    assert 'quotebase_mongo_command_duration_seconds_bucket{collection="quotes",command="find",le="0.0025"} 1' in text
+    assert 'quotebase_mongo_command_failures_total{collection="quotes",command="find"} 1' in text
+    assert "# TYPE quotebase_bcrypt_duration_seconds histogram" in text
+    
+    # With a token, only the scraper holding it gets in
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "scrape-token")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-token"}).status_code == 200
+
+def testMetricsFollowNewMongoClient(client, monkeypatch):
+    """Test that MongoDB command metrics come from the client the process actually uses
+
+    Args:
+        client (_type_): Mock db and client
+        monkeypatch (_type_): Used to make the connection build a new client
+    """
+    client, mockDb = client # Unpack client and mock database
+    connection = appModule.mongoConnection
+    
+    # A process that did not create its client yet (a fresh gunicorn worker) gets new counters with it
+    monkeypatch.setattr(connection, "_pid", None)
+    monkeypatch.setattr(connection, "_client", None)
+    before = connection.commandStats
+    connection.client
+    assert connection.commandStats is not before
+    
+    # Events sent to the listeners registered on that client (mongomock does not send any)
+    connection.commandStats.started(SimpleNamespace(command_name="insert", command={"insert": "tombstones"}, request_id=7))
+    connection.commandStats.failed(SimpleNamespace(command_name="insert", duration_micros=2000, request_id=7))
+    
+    text = client.get("/metrics").get_data(as_text=True)
+    
+    # Assertions
+    assert 'quotebase_mongo_command_failures_total{collection="tombstones",command="insert"} 1' in text
+    assert 'quotebase_mongo_command_duration_seconds_count{collection="tombstones",command="insert"} 1' in text
+
+def testMetricsSumWorkers(client, monkeypatch, tmp_path):
+    """Test that a scrape adds up the metrics every worker wrote to the shared directory
+
+    Args:
+        client (_type_): Mock db and client
+        monkeypatch (_type_): Used to share metrics through tmp_path
+        tmp_path (Path): Directory shared by the workers
+    """
+    client, mockDb = client # Unpack client and mock database
+    series = 'quotebase_http_requests_total{method="GET",route="/get-quote-limit",status="401"}'
+    buckets = 'quotebase_http_request_duration_seconds_count{method="GET",route="/get-quote-limit"}'
+    
+    def metricValue(text, name):
+        for line in text.splitlines():
+            if line.startswith(name + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0
+    
+    local = client.get("/metrics").get_data(as_text=True) # This process alone
+    
+    # Another worker that served three of these requests
+    otherWorker = {
+        "quotebase_http_requests_total": [[["GET", "/get-quote-limit", "401"], 3]],
+        "quotebase_http_request_duration_seconds": [[["GET", "/get-quote-limit"], [[3] + [0] * 13, 0.003]]],
+    }
+    (tmp_path / "99999.json").write_text(json.dumps(otherWorker))
+    shared = appModule.MultiprocessMetrics(str(tmp_path), appModule.metricFamilies)
+    monkeypatch.setattr(appModule, "multiprocessMetrics", shared)
+    
+    text = client.get("/metrics").get_data(as_text=True)
+    
+    # Assertions
+    assert metricValue(text, series) == metricValue(local, series) + 3
+    assert metricValue(text, buckets) == metricValue(local, buckets) + 3
+    assert (tmp_path / f"{os.getpid()}.json").exists() # This worker's own numbers, for the others' scrapes
+
+def testResponseCompression(client):
+    """Test gzip negotiation on the home page and streamed exports, and the exemptions
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Insert a user with enough quotes to pass the minimum size
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 73, "totalQuotes": 100})
+    for i in range(20):
+        mockDb["quotes"].insert_one({"userEmail": "test@example.com", "bookTitle": f"Book {i}", "quote": "A compressible quote. " * 5, "author": "Author"})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    plain = client.get("/home")
+    response = client.get("/home", headers={"Accept-Encoding": "gzip, deflate"})
+    
+    # Assertions
+    assert "Content-Encoding" not in plain.headers
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    assert len(response.get_data()) < len(plain.get_data()) / 2
+    
+    # The weak ETag of the compressed page still revalidates
+    assert response.headers["ETag"].startswith("W/")
+    assert client.get("/home", headers={"If-None-Match": response.headers["ETag"], "Accept-Encoding": "gzip"}).status_code == 304
+    
+    # gzip refused by the client
+    assert "Content-Encoding" not in client.get("/home", headers={"Accept-Encoding": "gzip;q=0"}).headers
+    
+    # Streamed export
+    response = client.get("/quotes/export?format=ndjson", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(gzip.decompress(response.get_data()).splitlines()) == 20
+    
+    # Exempt and small responses
+    assert "Content-Encoding" not in client.get("/get-quote-limit", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/quotes?limit=1", headers={"Accept-Encoding": "gzip"}).headers
+
+def testColumnarQuoteLists(client):
+    """Test that quote lists are sent column by column when the client asks for it
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    for i in range(30):
+        mockDb["quotes"].insert_one({
+            "userEmail": "test@example.com", "bookSeries": "Series", "bookTitle": f"Book {i % 3}", "characters": "Character",
+            "quote": f"Quote {i}", "author": "Author", "createdAt": datetime(2025, 1, 1, tzinfo=timezone.utc)
+        })
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    plain = client.get("/quotes?limit=30")
+    response = client.get("/quotes?limit=30", headers={"Accept": "application/vnd.quotebase.columnar+json"})
+    payload = response.get_json()
+    
+    # Assertions
+    assert plain.mimetype == "application/json"
+    assert response.mimetype == "application/vnd.quotebase.columnar+json"
+    assert "Accept" in response.headers["Vary"]
+    assert payload["quotes"]["dictionaries"]["author"] == ["Author"]
+    assert payload["quotes"]["dictionaries"]["bookTitle"] == ["Book 0", "Book 1", "Book 2"]
+    assert payload["quotes"]["columns"]["createdAt"][0] == 1735689600000
+    assert len(response.get_data()) < len(plain.get_data()) * 0.6
+    
+    decoded = decodeColumnar(payload["quotes"])
+    plainQuotes = plain.get_json()["quotes"]
+    assert [quote["quote"] for quote in decoded] == [quote["quote"] for quote in plainQuotes]
+    assert [quote["bookTitle"] for quote in decoded] == [quote["bookTitle"] for quote in plainQuotes]
+    
+    # The home page no longer embeds the list, script.js asks /quotes for the columnar encoding
+    assert '"dictionaries"' not in client.get("/home").get_data(as_text=True)
+
+def testFingerprintedStaticAssets(client, monkeypatch, tmp_path):
+    """Test that built assets are linked by their fingerprinted names and cached for good
+
+    Args:
+        client (_type_): Mock db and client
+        monkeypatch (_type_): Used to serve a static folder built in tmp_path
+        tmp_path (_type_): Copy of the static folder
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Without a build the source files are linked
+    assert 'href="/static/css/styles.css"' in client.get("/").get_data(as_text=True)
+    
+    staticFolder = str(tmp_path / "static")
+    shutil.copytree(app.static_folder, staticFolder)
+    manifest = assets.buildAssets(staticFolder)
+    monkeypatch.setattr(app, "static_folder", staticFolder)
+    monkeypatch.setattr(appModule, "assetManifest", assets.AssetManifest(staticFolder))
+    
+    builtCss = manifest["assets"]["css/styles.css"]
+    builtJs = manifest["assets"]["js/register.js"]
+    page = client.get("/").get_data(as_text=True)
+    css = client.get(f"/static/{builtCss}")
+    js = client.get(f"/static/{builtJs}")
+    source = client.get("/static/js/register.js")
+    
+    # Assertions
+    assert f'href="/static/{builtCss}"' in page
+    assert f'src="/static/{builtJs}"' in page
+    assert css.status_code == 200
+    assert css.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert "immutable" not in source.headers.get("Cache-Control", "")
+    assert len(js.get_data()) < len(source.get_data()) * 0.8
+    assert "/*" not in css.get_data(as_text=True)
+    assert f'url("/static/{manifest["assets"]["images/bg-gradient.jpg"]}")' in css.get_data(as_text=True)
+    assert f'"/static/{manifest["assets"]["images/eye-open.png"]}"' in js.get_data(as_text=True) # References in scripts too
+    css.close(), js.close(), source.close()
+    
+    # Content decides the name: an unchanged file keeps it, a changed one gets a new one
+    with open(os.path.join(staticFolder, "js", "script.js"), "a") as scriptFile:
+        scriptFile.write("\n// changed\nconsole.log(1);\n")
+    rebuilt = assets.buildAssets(staticFolder)
+    assert rebuilt["assets"]["css/styles.css"] == builtCss
+    assert rebuilt["assets"]["js/script.js"] != manifest["assets"]["js/script.js"]
+
+def testBackgroundImageVariants(client, tmp_path):
+    """Test that background images get resized copies in several formats, offered with image-set()
+
+    Args:
+        client (_type_): Mock db and client
+        tmp_path (_type_): Copy of the static folder
+    """
+    pytest.importorskip("PIL", reason="Pillow not installed; image variants not built (pip install -r requirements.txt)")
+    staticFolder = str(tmp_path / "static")
+    shutil.copytree(app.static_folder, staticFolder)
+    
+    manifest = assets.buildAssets(staticFolder, imageWidths=(640,))
+    variants = manifest["variants"]["images/bg-gradient.jpg"]
+    with open(os.path.join(staticFolder, manifest["assets"]["css/styles.css"]), encoding="utf-8") as cssFile:
+        css = cssFile.read()
+    
+    # Assertions
+    assert {"image/webp", "image/jpeg"} <= {variant["type"] for variant in variants}
+    assert {variant["width"] for variant in variants} == {640, 2500} # The original width is the largest variant
+    for variant in variants:
+        assert os.path.exists(os.path.join(staticFolder, variant["path"]))
+        assert f'url("/static/{variant["path"]}") type("{variant["type"]}")' in css
+    assert "@media (max-width:640px)" in css
+
+def testSuggestValues(client):
+    """Test that prefix completions follow every quote change and come from the suggestions collection
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # A quote stored before suggestions existed is counted by the backfill command
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10})
+    mockDb["quotes"].insert_one({"userEmail": "test@example.com", "bookTitle": "The Hobbit", "quote": "Legacy", "author": "Tolkien"})
+    assert "Suggestions: 2" in app.test_cli_runner().invoke(args=["backfill"]).output
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    def suggest(field, prefix):
+        response = client.get(f"/quotes/suggest?field={field}&prefix={prefix}")
+        assert response.status_code == 200
+        return [(entry["value"], entry["count"]) for entry in response.get_json()["suggestions"]]
+    
+    assert suggest("author", "tol") == [("Tolkien", 1)]
+    
+    quoteData = {"bookSeries": "Middle-earth", "bookTitle": "The Hobbit", "characters": "Bilbo", "quote": "In a hole", "author": "Tolkien"}
+    quoteId = client.post("/add-quote?delta=1", data=json.dumps(quoteData), content_type="application/json").get_json()["quote"]["_id"]
+    client.post("/add-quote", data=json.dumps({**quoteData, "quote": "Second", "author": "Tove Jansson"}), content_type="application/json")
+    
+    # Most used first, case-insensitive prefix
+    assert suggest("author", "TO") == [("Tolkien", 2), ("Tove Jansson", 1)]
+    assert suggest("bookTitle", "the h") == [("The Hobbit", 3)]
+    
+    # An edit moves the count from the old value to the new one
+    response = client.put(f"/edit-quote/{quoteId}?delta=1", data=json.dumps({**quoteData, "author": "J.R.R. Tolkien"}), content_type="application/json")
+    assert response.get_json()["quote"]["author"] == "J.R.R. Tolkien"
+    assert "fingerprint" not in response.get_json()["quote"]
+    assert suggest("author", "") == [("J.R.R. Tolkien", 1), ("Tolkien", 1), ("Tove Jansson", 1)]
+    
+    # A value nobody uses anymore disappears
+    client.delete(f"/delete-quote/{quoteId}")
+    assert suggest("author", "j") == []
+    assert suggest("characters", "") == [("Bilbo", 1)]
+    
+    # Batches are counted again from the quotes
+    operations = [{"op": "updateWhere", "where": {"author": "Tolkien"}, "set": {"author": "John Ronald Reuel Tolkien"}}]
+    client.post("/quotes/batch?delta=1", data=json.dumps({"operations": operations}), content_type="application/json")
+    assert suggest("author", "") == [("John Ronald Reuel Tolkien", 1), ("Tove Jansson", 1)]
+    
+    # Suggest lookups never read the quotes
+    mockDb["quotes"].delete_many({})
+    assert suggest("author", "tove") == [("Tove Jansson", 1)]
+    
+    # Invalid parameters
+    assert client.get("/quotes/suggest?field=quote&prefix=a").status_code == 400
+    assert client.get("/quotes/suggest?field=author&limit=0").status_code == 400
+
+def testQuoteChangesSinceVersion(client):
+    """Test that /quotes/changes lists the quotes added, edited and deleted since a library version
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # A quote stored before the change feed existed is part of the library the client loaded first
+    mockDb["users"].insert_one({"email": "test@example.com", "quotesRemaining": 10, "libraryVersion": 3})
+    mockDb["quotes"].insert_one({"userEmail": "test@example.com", "bookTitle": "Legacy", "quote": "Old", "author": "Someone"})
+    
+    # Simulate logged-in session
+    with client.session_transaction() as session:
+        session["user"] = "test@example.com"
+    
+    def changes(since):
+        response = client.get(f"/quotes/changes?since={since}")
+        assert response.status_code == 200
+        return response.get_json()
+    
+    unchanged = changes(3)
+    assert unchanged["version"] == 3 and not unchanged["reset"]
+    assert unchanged["quotes"] == [] and unchanged["deletedIds"] == []
+    assert unchanged["retention"] == 30 * 24 * 60 * 60
+    
+    quoteData = {"bookSeries": "", "bookTitle": "The Hobbit", "characters": "", "quote": "In a hole", "author": "Tolkien"}
+    firstId = client.post("/add-quote?delta=1", data=json.dumps(quoteData), content_type="application/json").get_json()["quote"]["_id"]
+    secondId = client.post("/add-quote?delta=1", data=json.dumps({**quoteData, "quote": "Second"}), content_type="application/json").get_json()["quote"]["_id"]
+    response = client.put(f"/edit-quote/{firstId}?delta=1", data=json.dumps({**quoteData, "quote": "Edited"}), content_type="application/json")
+    assert response.get_json()["version"] == 6
+    assert "syncVersion" not in response.get_json()["quote"]
+    
+    # Only the changed quotes, stamped version included so a write in flight at the last sync is not missed
+    synced = changes(3)
+    assert synced["version"] == 6
+    assert [quote["quote"] for quote in synced["quotes"]] == ["Edited", "Second"]
+    assert all("syncVersion" not in quote and "userEmail" not in quote for quote in synced["quotes"])
+    assert [quote["quote"] for quote in changes(6)["quotes"]] == ["Edited"]
+    
+    # Deletes leave a tombstone that expires with the retention window
+    client.delete(f"/delete-quote/{secondId}")
+    synced = changes(6)
+    assert synced["version"] == 7
+    assert [quote["_id"] for quote in synced["quotes"]] == [firstId]
+    assert synced["deletedIds"] == [secondId]
+    tombstoneIndexes = mockDb["tombstones"].index_information()
+    assert tombstoneIndexes["deletedAt_1"]["expireAfterSeconds"] == 30 * 24 * 60 * 60
+    
+    # Columnar encoding like the other quote lists
+    response = client.get("/quotes/changes?since=6", headers={"Accept": "application/vnd.quotebase.columnar+json"})
+    assert decodeColumnar(response.get_json()["quotes"])[0]["_id"] == firstId
+    
+    # Imported quotes are stamped one by one
+    client.post("/quotes/import?format=ndjson", data=json.dumps({**quoteData, "quote": "Imported"}) + "\n", content_type="application/x-ndjson")
+    assert [quote["quote"] for quote in changes(8)["quotes"]] == ["Imported"]
+    
+    # Batches are not: clients that synced before one reload their library
+    operations = [{"op": "updateWhere", "where": {"author": "Tolkien"}, "set": {"author": "J.R.R. Tolkien"}}]
+    version = client.post("/quotes/batch?delta=1", data=json.dumps({"operations": operations}), content_type="application/json").get_json()["version"]
+    assert changes(version - 1)["reset"]
+    assert not changes(version)["reset"]
+    
+    # A version the library never had (e.g. a restored database)
+    assert changes(version + 1)["reset"]
+    
+    # Invalid and missing versions
+    assert client.get("/quotes/changes?since=abc").status_code == 400
+    assert client.get("/quotes/changes").status_code == 400
+    with client.session_transaction() as session:
+        session.pop("user")
+    assert client.get("/quotes/changes?since=1").status_code == 401
+
+def testServiceWorkerServedFromRoot(client):
+    """Test that the service worker is served from the root path, uncached, and the home page tags the library owner
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    response = client.get("/service-worker.js")
+    assert response.status_code == 200
+    assert response.mimetype == "text/javascript"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert b"/quotes/changes" in response.get_data()
+    response.close()
+    
+    # Simulate logged-in sessions of two users, each with their own offline copy
+    owners = []
+    for email in ("test@example.com", "other@example.com"):
+        mockDb["users"].insert_one({"email": email, "quotesRemaining": 10})
+        with client.session_transaction() as session:
+            session["user"] = email
+        page = client.get("/home").get_data(as_text=True)
+        owners.append(page.split('data-owner="')[1].split('"')[0])
+    assert len(owners[0]) == 16 and owners[0] != owners[1]
+    assert "test@example.com" not in owners[0]
+
+def testUserProfileCache(client):
+    """Test that quota reads and existence checks are served from the profile cache, kept in step by the quota updates
+
+    Args:
+        client (_type_): Mock db and client
+    """
+    client, mockDb = client # Unpack client and mock database
+    
+    # Login reads the user anyway and primes the cache
+    hashed = bcrypt.hashpw(b"password123", bcrypt.gensalt(rounds=4)).decode("utf-8")
+    mockDb["users"].insert_one({"email": "test@example.com", "password": hashed, "quotesRemaining": 10, "totalQuotes": 10})
+    client.post("/login", data=json.dumps({"email": "test@example.com", "password": "password123"}), content_type="application/json")
+    
+    def remaining():
+        return client.get("/get-quote-limit").get_json()["remainingQuotes"]
+    
+    # Counters are kept since the process started
+    baseline = userProfileCache.stats()
+    assert remaining() == 10
+    assert userProfileCache.stats()["hits"] == baseline["hits"] + 1
+    assert userProfileCache.stats()["misses"] == baseline["misses"]
+    
+    # Adds and deletes apply their $inc to the cached profile instead of dropping it
+    quoteData = {"bookSeries": "", "bookTitle": "The Hobbit", "characters": "", "quote": "In a hole", "author": "Tolkien"}
+    quoteId = client.post("/add-quote?delta=1", data=json.dumps(quoteData), content_type="application/json").get_json()["quote"]["_id"]
+    client.post("/add-quote?delta=1", data=json.dumps({**quoteData, "quote": "Second"}), content_type="application/json")
+    assert remaining() == 8
+    client.delete(f"/delete-quote/{quoteId}?delta=1")
+    assert remaining() == 9
+    assert userProfileCache.stats()["misses"] == baseline["misses"]
+    
+    # Changes made elsewhere show once the entry expires or is invalidated
+    mockDb["users"].update_one({"email": "test@example.com"}, {"$set": {"quotesRemaining": 50, "totalQuotes": 60}})
+    assert remaining() == 9
+    userProfileCache.invalidate("test@example.com")
+    assert remaining() == 50
+    
+    # Batches read the quota again after settling it
+    operations = [{"op": "add", "quote": {**quoteData, "quote": "Batched"}}]
+    client.post("/quotes/batch?delta=1", data=json.dumps({"operations": operations}), content_type="application/json")
+    assert remaining() == 49
+    
+    # A missing user is remembered as missing until it registers
+    with client.session_transaction() as session:
+        session["user"] = "new@example.com"
+    assert client.get("/get-quote-limit").status_code == 401
+    client.post("/register", data=json.dumps({"email": "new@example.com", "password": "password123"}), content_type="application/json")
+    assert remaining() == 100
+    
+    # Hit ratio in the process stats
+    stats = client.get("/internal/stats").get_json()["userProfileCache"]
+    assert stats["misses"] > baseline["misses"]
+    assert stats["hitRatio"] == stats["hits"] / (stats["hits"] + stats["misses"])